@@ -0,0 +1,8 @@
+# -*- coding: utf-8 -*-
+"""URLconf of the API-only application; see map_review.settings.api."""
+from django.conf.urls import patterns, include, url
+
+urlpatterns = patterns(
+    '',
+    url(r'^maps/', include('maps.api_urls')),
+)
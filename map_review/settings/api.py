@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+"""Settings of the API-only application, map_review.wsgi_api.
+
+It serves the read-only JSON API and change feed from the same database
+as the full site, for machine clients: no sessions, CSRF, auth, messages
+or admin, only token authentication and conditional GET, and database
+connections kept open between requests.
+"""
+from base import *
+
+INSTALLED_APPS = (
+    'maps',
+)
+
+MIDDLEWARE_CLASSES = (
+    'maps.middleware.PinPrimaryMiddleware',
+    'maps.middleware.TokenAuthMiddleware',
+    'django.middleware.http.ConditionalGetMiddleware',
+)
+
+ROOT_URLCONF = 'map_review.api_urls'
+
+WSGI_APPLICATION = 'map_review.wsgi_api.application'
+
+TEMPLATE_CONTEXT_PROCESSORS = ()
+
+# Responses are JSON; skip loading translation catalogues.
+USE_I18N = False
+
+# Keep connections open between requests, in seconds.
+DATABASES = dict(
+    (alias, dict(db, CONN_MAX_AGE=600)) for alias, db in DATABASES.items()
+)
@@ -37,6 +37,8 @@ INSTALLED_APPS = (
 )
 
 MIDDLEWARE_CLASSES = (
+    'maps.middleware.PinPrimaryMiddleware',
+    'maps.middleware.TokenAuthMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -54,9 +56,36 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        # Keep connections open between requests, in seconds.
+        'CONN_MAX_AGE': 600,
     }
 }
 
+# Pragmas maps.sqlite applies to each new SQLite connection: write-ahead
+# logging, wait up to busy_timeout ms for a lock, fsync only at WAL
+# checkpoints, a 256 MiB memory map and a 64 MiB page cache.
+MAPS_SQLITE_PRAGMAS = (
+    ('journal_mode', 'WAL'),
+    ('busy_timeout', 5000),
+    ('synchronous', 'NORMAL'),
+    ('mmap_size', 256 * 1024 * 1024),
+    ('cache_size', -64 * 1024),
+)
+# Retries of review writes that still find SQLite locked, backing off
+# exponentially from MAPS_SQLITE_RETRY_DELAY seconds.
+MAPS_SQLITE_RETRIES = 5
+MAPS_SQLITE_RETRY_DELAY = 0.05
+# Queue the writes of each process on one lock, for threaded servers.
+MAPS_SQLITE_SINGLE_WRITER = False
+
+# Aliases in DATABASES of read replicas of 'default'; see maps.routers.
+DATABASE_ROUTERS = ['maps.routers.ReplicaRouter']
+MAPS_READ_REPLICAS = ()
+# Keep a client on the primary for this long after it writes, in seconds.
+MAPS_REPLICA_STICKY_SECONDS = 5
+# Replicas normally get their schema by replication, not from migrate.
+MAPS_MIGRATE_REPLICAS = False
+
 # Internationalization
 # https://docs.djangoproject.com/en/1.7/topics/i18n/
 
@@ -75,10 +104,75 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/1.7/howto/static-files/
 
 STATIC_URL = '/static/'
+STATIC_ROOT = os.path.join(BASE_DIR, 'static')
+
+# The review page's own script, served as it is while the page loads the
+# third-party libraries from their CDNs.
+STATICFILES_DIRS = (
+    ('maps/src', os.path.join(os.path.dirname(BASE_DIR), 'maps', 'assets',
+                              'src')),
+)
+
+# Content-hashed names plus .gz/.br copies; see maps.staticfiles. Build the
+# bundles with `manage.py build_assets` before running collectstatic.
+STATICFILES_STORAGE = 'maps.staticfiles.CompressedManifestStaticFilesStorage'
+
+# Serve the review page from the bundles `build_assets` writes instead of
+# the CDNs. Turn on once the vendored files and their pinned checksums are
+# committed and the bundles have been collected.
+MAPS_BUNDLED_ASSETS = False
+
+# Serve STATIC_ROOT from Django with far-future cache headers, for
+# deployments without a web server in front.
+MAPS_SERVE_STATIC = False
 
 
 # CUSTOM SETTINGS BELOW
 
+# Largest accepted autosave request body for review drafts, in bytes.
+MAPS_DRAFT_MAX_BYTES = 16 * 1024
+
+# Store a full Map snapshot every this many revisions, deltas in between.
+MAPS_REVISION_CHECKPOINT_INTERVAL = 10
+
+# Change feed: entries per response, longest long-poll wait and how often
+# a waiting request re-checks the feed (both in seconds).
+MAPS_CHANGES_PAGE_SIZE = 500
+MAPS_CHANGES_MAX_WAIT = 25
+MAPS_CHANGES_POLL_INTERVAL = 1
+
+# JSON API page sizes.
+MAPS_API_PAGE_SIZE = 50
+MAPS_API_MAX_PAGE_SIZE = 500
+# Tokens accepted by maps.middleware.TokenAuthMiddleware on the routes of
+# maps.api_urls, in the full site and the API-only profile alike; empty
+# means those routes are open.
+MAPS_API_TOKENS = tuple(
+    t for t in os.environ.get('MAPS_API_TOKENS', '').split(',') if t
+)
+
+# How long rendered map detail fragments stay cached, in seconds. Fragments
+# are keyed by revision; this bounds how stale the names of related
+# events, actors and data sources can get.
+MAPS_DETAIL_CACHE_TIMEOUT = 24 * 60 * 60
+
+# Lowest estimated title/URL similarity (0-1) at which two maps are
+# reported as possible duplicates.
+MAPS_DUPLICATE_THRESHOLD = 0.5
+
+# Where maps.reports writes the prebuilt per-event reports.
+MAPS_REPORTS_ROOT = os.path.join(BASE_DIR, 'reports')
+
+# Where maps.archive keeps the compressed reviews of archived events, and
+# how long an event goes without a review update before
+# `manage.py archive_events` archives it.
+MAPS_ARCHIVE_ROOT = os.path.join(BASE_DIR, 'archive')
+MAPS_ARCHIVE_AFTER_DAYS = 365
+
+# DataSource.meta keys copied to an indexed side table, for fast equality
+# and range lookups on any database; see maps.metadata.
+MAPS_PROMOTED_META_KEYS = ()
+
 # # # # 3RD PARTY SETTINGS BELOW # # # #
 
 # Crispy
@@ -0,0 +1,22 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Primary plus one read replica, as two SQLite files. The replica isn't
+# actually replicated, which makes replica reads easy to tell apart:
+#
+#   python manage.py test maps --settings=map_review.settings.test_replicas
+from devel import *
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'TEST': {'NAME': os.path.join(BASE_DIR, 'test_primary.sqlite3')},
+    },
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'replica.sqlite3'),
+        'TEST': {'NAME': os.path.join(BASE_DIR, 'test_replica.sqlite3')},
+    },
+}
+MAPS_READ_REPLICAS = ('replica',)
+MAPS_MIGRATE_REPLICAS = True
@@ -1,4 +1,5 @@
 # -*- coding: utf-8 -*-
+from django.conf import settings
 from django.conf.urls import patterns, include, url
 from django.contrib import admin
 
@@ -8,3 +9,10 @@ urlpatterns = patterns(
     url(r'^maps/', include('maps.urls')),
 
 )
+
+if settings.MAPS_SERVE_STATIC:
+    urlpatterns += patterns(
+        '',
+        url(r'^{0}(?P<path>.*)$'.format(settings.STATIC_URL.lstrip('/')),
+            'maps.staticfiles.serve'),
+    )
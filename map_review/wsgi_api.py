@@ -0,0 +1,16 @@
+"""
+WSGI config of the API-only application.
+
+Serves /maps/api/ and /maps/changes/ with map_review.settings.api, next
+to the full site in map_review.wsgi: point the front-end server's routes
+for those paths at this application. MAPS_API_SETTINGS_MODULE overrides
+the settings used.
+"""
+
+import os
+os.environ["DJANGO_SETTINGS_MODULE"] = os.environ.get(
+    "MAPS_API_SETTINGS_MODULE", "map_review.settings.api"
+)
+
+from django.core.wsgi import get_wsgi_application
+application = get_wsgi_application()
@@ -1,8 +1,25 @@
 from django.contrib import admin
 
-from .models import Event, DataSource, StatisticalOrIndicatorData, Map
+from .models import (
+    AdminArea, Event, DataSource, StatisticalOrIndicatorData, Map
+)
+from .pipeline import save_review
+
+
+class MapAdmin(admin.ModelAdmin):
+    """Saves maps and their relations through the batched save path."""
+
+    def save_model(self, request, obj, form, change):
+        save_review(form)
+
+    def save_related(self, request, form, formsets, change):
+        # Many-to-many data was already written by save_review.
+        for formset in formsets:
+            self.save_formset(request, form, formset, change=change)
+
 
 admin.site.register(Event)
 admin.site.register(DataSource)
 admin.site.register(StatisticalOrIndicatorData)
-admin.site.register(Map)
+admin.site.register(Map, MapAdmin)
+admin.site.register(AdminArea)
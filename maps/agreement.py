@@ -0,0 +1,472 @@
+# -*- coding: utf-8 -*-
+"""Inter-reviewer agreement.
+
+The same map is deliberately reviewed by several reviewers. Reviews of one
+underlying map, a *subject*, are grouped by the SHA-1 of the uploaded PDF,
+or failing that by normalised URL, file name or title, within the event.
+Each review is reduced to a short code per compared field
+(:class:`ReviewCoding`), and agreement is kept as running totals per
+field, per field category and per reviewer. When a review is saved or
+deleted, or its relations change, only the totals of its subject are
+recomputed (by the receivers below, connected in :mod:`maps.apps`), and
+the difference is applied to the running totals; the dashboards then read
+a few hundred rows, however many reviews there are.
+
+Measures, per field:
+
+* percent agreement: agreeing reviewer pairs out of all pairs;
+* Fleiss' kappa: the mean per-subject agreement, corrected for the
+  agreement expected by chance from the overall category distribution;
+* Cohen's kappa between two given reviewers, computed on demand from the
+  codings of the subjects they both reviewed (:func:`cohen_kappa`).
+
+If a reviewer reviewed a subject more than once, only their latest review
+counts. After changing the compared fields, run ``manage.py backfill
+review-codings --restart``.
+"""
+import hashlib
+import itertools
+import json
+import os
+from collections import Counter, defaultdict
+
+from django.db import IntegrityError, connections, models, router, transaction
+from django.db.models import F
+from django.http import JsonResponse
+from django.shortcuts import render
+from django.utils import six
+from django.utils.six.moves.urllib.parse import urlsplit
+from django.views.decorators.http import require_GET
+
+from . import duplicates, revisions
+from .models import (
+    FieldAgreement, FieldCategory, Map, MapSignature, ReviewCoding,
+    ReviewerAgreement,
+)
+
+#: Fields identifying the map reviewed rather than describing it, and
+#: per-review catalogue rows that never match between reviews.
+EXCLUDED_FIELDS = (
+    'reviewer_name', 'title', 'file_name', 'url', 'pdf', 'event',
+    'statistical_data',
+)
+
+#: Free text and coordinates aren't compared as categories.
+UNCOMPARED_TYPES = (models.TextField, models.FloatField, models.FileField)
+
+#: First key of the PostgreSQL advisory locks serialising scorings per
+#: subject; the second is taken from the subject hash.
+SUBJECT_LOCK = 0x61677265
+
+
+def fields():
+    """Names of the review fields compared."""
+    return [
+        f.name for f in revisions.tracked_fields() + Map._meta.many_to_many
+        if f.name not in EXCLUDED_FIELDS and
+        not isinstance(f, UNCOMPARED_TYPES)
+    ]
+
+
+def code(value):
+    """Short text standing for a normalised field value."""
+    if value is None or value == '' or value == []:
+        return ''
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, list):
+        value = ','.join(six.text_type(v) for v in value)
+    value = six.text_type(value)
+    if len(value) > 40:
+        value = hashlib.sha1(value.encode('utf-8')).hexdigest()
+    return value
+
+
+def encode(instance):
+    """Field name to code, for a saved Map."""
+    values = revisions.snapshot(instance)
+    values.update(revisions.m2m_membership(instance))
+    return dict((name, code(values[name])) for name in fields())
+
+
+def subject_key(instance):
+    """Identifies the map a review is about."""
+    sha1 = MapSignature.objects.filter(map=instance.pk).values_list(
+        'pdf_sha1', flat=True
+    ).first()
+    if sha1:
+        ident = 'pdf:' + sha1
+    elif instance.url:
+        parts = urlsplit(instance.url.strip().lower())
+        host = parts.netloc[4:] if parts.netloc.startswith('www.') else (
+            parts.netloc
+        )
+        ident = 'url:' + host + parts.path.rstrip('/') + (
+            '?' + parts.query if parts.query else ''
+        )
+    elif instance.file_name:
+        ident = 'file:' + os.path.basename(instance.file_name.strip().lower())
+    else:
+        ident = 'title:' + duplicates.normalise(instance.title)
+    return hashlib.sha1(u'{0}:{1}'.format(
+        instance.event_id, ident
+    ).encode('utf-8')).hexdigest()
+
+
+def subject_totals(codings):
+    """What the codings of one subject add to the running totals.
+
+    :rtype: Counter
+    :return: keyed by ``('field', field, column)``,
+        ``('category', field, code)`` and
+        ``('reviewer', reviewer_name, field, column)``.
+
+    """
+    latest = {}
+    for coding in codings:
+        other = latest.get(coding.reviewer_name)
+        if other is None or coding.pk > other.pk:
+            latest[coding.reviewer_name] = coding
+    totals = Counter()
+    if len(latest) < 2:
+        return totals
+    decoded = [
+        (name, json.loads(latest[name].codes)) for name in sorted(latest)
+    ]
+    for field in fields():
+        pairs = agreements = 0
+        for (a, codes_a), (b, codes_b) in itertools.combinations(decoded, 2):
+            agree = int(codes_a.get(field, '') == codes_b.get(field, ''))
+            pairs += 1
+            agreements += agree
+            for reviewer in (a, b):
+                totals[('reviewer', reviewer, field, 'pairs')] += 1
+                totals[('reviewer', reviewer, field, 'agreements')] += agree
+        totals[('field', field, 'subjects')] += 1
+        totals[('field', field, 'pairs')] += pairs
+        totals[('field', field, 'agreements')] += agreements
+        totals[('field', field, 'subject_agreement')] += (
+            agreements / float(pairs)
+        )
+        for _, codes in decoded:
+            totals[('category', field, codes.get(field, ''))] += 1
+    return totals
+
+
+def _lock(subjects, using):
+    """Queues scorings of ``subjects`` until the transaction ends.
+
+    Locking the codings of a subject doesn't stop two new reviews of it
+    from being scored at once, each without seeing the other, and their
+    pair from never being counted. SQLite has a single writer anyway.
+
+    """
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return
+    cursor = connection.cursor()
+    # In a stable order, so that scorings of two subjects can't deadlock.
+    for subject in sorted(subjects):
+        cursor.execute('SELECT pg_advisory_xact_lock(%s, %s)',
+                       [SUBJECT_LOCK, int(subject[:7], 16)])
+
+
+def _totals(subjects, manager):
+    totals = Counter()
+    for subject in subjects:
+        totals.update(subject_totals(
+            manager.select_for_update().filter(subject=subject)
+        ))
+    return totals
+
+
+def _add(model, lookup, fields, values, using):
+    """Adds ``values`` to the columns of the rows of ``fields``.
+
+    One update covers all the fields getting the same increments, which
+    is most of them when a review joins or leaves a subject.
+
+    """
+    manager = model.objects.db_manager(using)
+    increments = dict((k, F(k) + v) for k, v in values.items())
+    rows = manager.filter(field__in=fields, **lookup)
+    if rows.update(**increments) == len(fields):
+        return
+    missing = sorted(set(fields) - set(rows.values_list('field', flat=True)))
+    try:
+        with transaction.atomic(using=using):
+            manager.bulk_create([
+                model(field=field, **dict(lookup, **values))
+                for field in missing
+            ])
+    except IntegrityError:
+        # Some were created concurrently for another subject.
+        for field in missing:
+            try:
+                with transaction.atomic(using=using):
+                    manager.create(field=field, **dict(lookup, **values))
+            except IntegrityError:
+                manager.filter(field=field, **lookup).update(**increments)
+
+
+def _apply(after, before, using):
+    delta = Counter(after)
+    delta.subtract(before)
+    by_row = defaultdict(dict)
+    for key, value in delta.items():
+        if value:
+            by_row[key[:-1]][key[-1]] = value
+
+    # (model, lookup other than field, increments) to fields.
+    batches = defaultdict(list)
+    for row, values in by_row.items():
+        if row[0] == 'field':
+            batches[(FieldAgreement, (), tuple(sorted(values.items())))] \
+                .append(row[1])
+        elif row[0] == 'category':
+            for value, n in values.items():
+                batches[(FieldCategory, (('code', value),),
+                         (('ratings', n),))].append(row[1])
+        else:
+            batches[(ReviewerAgreement, (('reviewer_name', row[1]),),
+                     tuple(sorted(values.items())))].append(row[2])
+    # In a stable order, so concurrent scorings lock rows alike.
+    for (model, lookup, values), fields in sorted(
+            batches.items(),
+            key=lambda item: (item[0][0].__name__, repr(item[0][1:]))):
+        _add(model, dict(lookup), sorted(fields), dict(values), using)
+
+
+def score(instance, using=None):
+    """Brings the coding of a saved review, and the totals, up to date."""
+    using = using or router.db_for_write(Map)
+    manager = ReviewCoding.objects.db_manager(using)
+    coding = ReviewCoding(
+        review=instance, subject=subject_key(instance),
+        reviewer_name=instance.reviewer_name,
+        codes=json.dumps(encode(instance), sort_keys=True),
+    )
+    with transaction.atomic(using=using):
+        old = manager.select_for_update().filter(review=instance.pk).first()
+        if old and (old.subject, old.reviewer_name, old.codes) == (
+                coding.subject, coding.reviewer_name, coding.codes):
+            return old
+        subjects = set([coding.subject, old and old.subject]) - set([None])
+        _lock(subjects, using)
+        before = _totals(subjects, manager)
+        coding.save(using=using)
+        _apply(_totals(subjects, manager), before, using)
+    return coding
+
+
+def unscore(map_id, using=None):
+    """Takes a review about to be deleted out of the totals."""
+    using = using or router.db_for_write(Map)
+    manager = ReviewCoding.objects.db_manager(using)
+    with transaction.atomic(using=using):
+        old = manager.select_for_update().filter(review=map_id).first()
+        if old is None:
+            return
+        _lock([old.subject], using)
+        before = _totals([old.subject], manager)
+        old.delete()
+        _apply(_totals([old.subject], manager), before, using)
+
+
+def after_save(sender, instance, raw, using, **kwargs):
+    """``post_save`` receiver rescoring a saved review.
+
+    :func:`maps.pipeline.save_review` scores once its relations are saved
+    too, and opts out with :func:`maps.revisions.recorded_by_caller`.
+
+    """
+    if not raw and not revisions.by_caller(instance):
+        score(instance, using)
+
+
+def relation_changed(sender, instance, action, reverse, pk_set, using,
+                     **kwargs):
+    """``m2m_changed`` receiver rescoring the reviews whose relation
+    changed through a related manager."""
+    if action == 'pre_clear' and reverse:
+        # post_clear has no pk_set.
+        accessor = Map._meta.get_field(
+            revisions.relation_name(sender)
+        ).related.get_accessor_name()
+        instance._agreement_cleared = list(
+            getattr(instance, accessor).values_list('pk', flat=True)
+        )
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        score(instance, using)
+        return
+    if action == 'post_clear':
+        pk_set = instance._agreement_cleared
+        del instance._agreement_cleared
+    for review in Map.objects.using(using).filter(pk__in=pk_set or ()):
+        score(review, using)
+
+
+def kappa(observed, expected):
+    if expected is None or expected >= 1:
+        return None
+    return (observed - expected) / (1 - expected)
+
+
+def chance_agreement():
+    """Field name to the agreement expected by chance.
+
+    That is the probability that two ratings drawn from the field's overall
+    category distribution agree, the sum of squared category shares.
+
+    """
+    totals, squares = defaultdict(int), defaultdict(int)
+    for field, n in FieldCategory.objects.filter(
+            ratings__gt=0).values_list('field', 'ratings'):
+        totals[field] += n
+        squares[field] += n * n
+    return dict(
+        (field, squares[field] / float(totals[field] ** 2))
+        for field in totals
+    )
+
+
+def _labels():
+    return dict(
+        (f.name, f.verbose_name)
+        for f in Map._meta.fields + Map._meta.many_to_many
+    )
+
+
+def field_scores():
+    """Percent agreement and Fleiss' kappa of each compared field."""
+    chance, labels = chance_agreement(), _labels()
+    return [{
+        'field': row.field,
+        'label': labels.get(row.field, row.field),
+        'subjects': row.subjects,
+        'pairs': row.pairs,
+        'percent': row.agreements / float(row.pairs),
+        'kappa': kappa(row.subject_agreement / row.subjects,
+                       chance.get(row.field)),
+    } for row in FieldAgreement.objects.filter(
+        pairs__gt=0, field__in=fields()
+    ).order_by('field')]
+
+
+def overall(scores):
+    """Percent agreement over all pairs and mean kappa of ``scores``."""
+    pairs = sum(s['pairs'] for s in scores)
+    kappas = [s['kappa'] for s in scores if s['kappa'] is not None]
+    return {
+        'subjects': max([s['subjects'] for s in scores] or [0]),
+        'percent': sum(s['percent'] * s['pairs'] for s in scores) / pairs
+        if pairs else None,
+        'kappa': sum(kappas) / len(kappas) if kappas else None,
+    }
+
+
+def reviewer_scores(reviewer_name=None):
+    """Agreement of each reviewer with their peers.
+
+    The kappa of a reviewer compares their agreement rate with the one
+    expected by chance on the fields they were compared on.
+
+    :param str reviewer_name: if given, the scores of this reviewer per
+        field instead.
+
+    """
+    chance, labels = chance_agreement(), _labels()
+    rows = ReviewerAgreement.objects.filter(pairs__gt=0, field__in=fields())
+    if reviewer_name is not None:
+        return [{
+            'field': row.field,
+            'label': labels.get(row.field, row.field),
+            'pairs': row.pairs,
+            'percent': row.agreements / float(row.pairs),
+            'kappa': kappa(row.agreements / float(row.pairs),
+                           chance.get(row.field)),
+        } for row in rows.filter(
+            reviewer_name=reviewer_name
+        ).order_by('field')]
+
+    totals = defaultdict(lambda: [0, 0, 0.0])
+    for name, field, pairs, agreements in rows.values_list(
+            'reviewer_name', 'field', 'pairs', 'agreements'):
+        total = totals[name]
+        total[0] += pairs
+        total[1] += agreements
+        total[2] += pairs * chance.get(field, 1.0)
+    return [{
+        'reviewer_name': name,
+        'pairs': pairs,
+        'percent': agreements / float(pairs),
+        'kappa': kappa(agreements / float(pairs), expected / pairs),
+    } for name, (pairs, agreements, expected) in sorted(totals.items())]
+
+
+def cohen_kappa(a, b):
+    """Agreement of reviewers ``a`` and ``b`` on the subjects both reviewed.
+
+    :rtype: tuple
+    :return: (number of shared subjects, list of per-field dicts with the
+        percent agreement and Cohen's kappa).
+
+    """
+    by_subject = defaultdict(dict)
+    for subject, reviewer, codes in ReviewCoding.objects.filter(
+            reviewer_name__in=[a, b]).order_by('review').values_list(
+            'subject', 'reviewer_name', 'codes'):
+        by_subject[subject][reviewer] = json.loads(codes)
+    shared = [
+        codes for codes in by_subject.values() if a in codes and b in codes
+    ]
+    labels, ret = _labels(), []
+    if not shared or a == b:
+        return 0, ret
+    n = float(len(shared))
+    for field in fields():
+        pairs = [(s[a].get(field, ''), s[b].get(field, '')) for s in shared]
+        observed = sum(1 for x, y in pairs if x == y) / n
+        counts_a = Counter(x for x, _ in pairs)
+        counts_b = Counter(y for _, y in pairs)
+        expected = sum(
+            counts_a[c] * counts_b[c] for c in counts_a
+        ) / (n * n)
+        ret.append({
+            'field': field,
+            'label': labels.get(field, field),
+            'percent': observed,
+            'kappa': kappa(observed, expected),
+        })
+    return len(shared), ret
+
+
+@require_GET
+def dashboard(request, fmt):
+    """Agreement per field and per reviewer.
+
+    ``?reviewer=<name>`` adds that reviewer's scores per field, and
+    ``?a=<name>&b=<name>`` the agreement between two reviewers.
+
+    """
+    scores = field_scores()
+    data = {
+        'overall': overall(scores),
+        'fields': scores,
+        'reviewers': reviewer_scores(),
+    }
+    reviewer = request.GET.get('reviewer')
+    if reviewer:
+        data['reviewer'] = reviewer
+        data['reviewer_fields'] = reviewer_scores(reviewer)
+    a, b = request.GET.get('a'), request.GET.get('b')
+    if a and b:
+        subjects, pair = cohen_kappa(a, b)
+        data['pair'] = {'a': a, 'b': b, 'subjects': subjects, 'fields': pair}
+    if fmt == 'json':
+        return JsonResponse(data)
+    data['query'] = request.GET.urlencode()
+    return render(request, 'maps/agreement.html', data)
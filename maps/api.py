@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+"""Read-only JSON API.
+
+Listings are paginated by keyset on the primary key (``?after=<id>``), so
+any page costs the same as the first. ``?fields=a,b`` limits both the
+columns loaded and the ones serialised, ``?include=rel1,rel2`` embeds
+related objects, each relation fetched with one prefetch query, and any
+foreign key name filters by id (``/maps/api/maps/?event=3``). Maps and
+gazetteer areas also take ``?bbox=west,south,east,north`` or
+``?point=lon,lat`` to select what intersects a box or covers a point.
+Maps of archived events are restored on first access, by id or by
+``?event=``.
+
+Responses built only from models in the change feed carry the feed's
+latest sequence number as their ETag, so a client revalidating an
+unchanged listing gets a ``304`` for the cost of one indexed query.
+"""
+from django.conf import settings
+from django.http import Http404, HttpResponseBadRequest, JsonResponse
+from django.views.decorators.http import condition, require_GET
+
+from . import archive, spatial
+from .models import (
+    Actor, AdminArea, Change, ChangeFeedMixin, DataSource, Event, Map,
+    StatisticalOrIndicatorData,
+)
+from .serializers import field_value
+
+
+class BadRequest(ValueError):
+    pass
+
+
+class Resource(object):
+    """Serialises one model and builds the querysets to do so cheaply."""
+
+    def __init__(self, model):
+        self.model = model
+        self.fields = dict((f.name, f) for f in model._meta.fields)
+        self.relations = {}
+
+    def link(self, resources):
+        """Finds the relations that can be included.
+
+        :param dict resources: model to Resource, including ones registered
+            after this one.
+
+        """
+        self.relations = dict(
+            (f.name, f) for f in
+            self.model._meta.fields + self.model._meta.many_to_many
+            if f.rel and f.rel.to in resources
+        )
+
+    def parse(self, params):
+        """Validated (fields, includes) lists from query parameters."""
+        def names(param, allowed, default):
+            value = params.get(param)
+            if not value:
+                return list(default)
+            ret = value.split(',')
+            unknown = set(ret) - set(allowed)
+            if unknown:
+                raise BadRequest("Unknown {0}: {1}".format(
+                    param, ', '.join(sorted(unknown))
+                ))
+            return ret
+        fields = names('fields', self.fields, self.fields)
+        includes = names('include', self.relations, ())
+        return fields, includes
+
+    def queryset(self, fields, includes):
+        qs = self.model._default_manager.order_by('pk')
+        if set(fields) != set(self.fields):
+            # Included foreign keys need their id column to be prefetched.
+            qs = qs.only(*(set(fields) | (set(includes) & set(self.fields))))
+        if includes:
+            qs = qs.prefetch_related(*includes)
+        return qs
+
+    def serialise(self, obj, fields, includes=()):
+        ret = {'id': obj.pk}
+        for name in fields:
+            field = self.fields[name]
+            ret[name] = field_value(field, field.value_from_object(obj))
+        for name in includes:
+            target = by_model[self.relations[name].rel.to]
+            if name in self.fields:
+                related = getattr(obj, name)
+                ret[name] = related and target.serialise(
+                    related, list(target.fields)
+                )
+            else:
+                ret[name] = [
+                    target.serialise(related, list(target.fields))
+                    for related in getattr(obj, name).all()
+                ]
+        return ret
+
+
+by_model = dict(
+    (model, Resource(model)) for model in (
+        Event, Actor, DataSource, StatisticalOrIndicatorData, AdminArea, Map,
+    )
+)
+for resource in by_model.values():
+    resource.link(by_model)
+
+resources = {
+    'maps': by_model[Map],
+    'events': by_model[Event],
+    'actors': by_model[Actor],
+    'data-sources': by_model[DataSource],
+    'areas': by_model[AdminArea],
+}
+
+
+def get_resource(name):
+    try:
+        return resources[name]
+    except KeyError:
+        raise Http404
+
+
+def feed_etag(request, resource, pk=None):
+    """Change feed position, if the response only shows feed models."""
+    if resource not in resources:
+        return None
+    resource = resources[resource]
+    try:
+        _, includes = resource.parse(request.GET)
+    except ValueError:
+        return None
+    models = [resource.model] + [
+        resource.relations[name].rel.to for name in includes
+    ]
+    if not all(issubclass(m, ChangeFeedMixin) for m in models):
+        return None
+    last = Change.objects.order_by('-pk').values_list('pk', flat=True)[:1]
+    return 'feed-{0}'.format(last[0] if last else 0)
+
+
+@require_GET
+@condition(etag_func=feed_etag)
+def list_view(request, resource):
+    resource = get_resource(resource)
+    try:
+        fields, includes = resource.parse(request.GET)
+        after = int(request.GET.get('after', 0))
+        limit = min(
+            int(request.GET.get('limit', settings.MAPS_API_PAGE_SIZE)),
+            settings.MAPS_API_MAX_PAGE_SIZE
+        )
+        if limit < 1:
+            raise ValueError("limit must be at least 1")
+        filters = dict(
+            (resource.fields[k].attname, int(v))
+            for k, v in request.GET.items()
+            if k in resource.fields and resource.fields[k].rel
+        )
+        bbox = None
+        if resource.model in spatial.INDEXES:
+            bbox = spatial.parse_bbox(request.GET)
+    except ValueError as e:
+        return JsonResponse({'error': str(e) or "Bad request"}, status=400)
+
+    if resource.model is Map and 'event_id' in filters:
+        archive.restore_event(filters['event_id'])
+    qs = resource.queryset(fields, includes).filter(pk__gt=after, **filters)
+    if bbox:
+        qs = spatial.intersecting(qs, *bbox)
+    page = list(qs[:limit])
+
+    ret = {'data': [resource.serialise(o, fields, includes) for o in page]}
+    ret['next'] = None
+    if len(page) == limit:
+        params = request.GET.copy()
+        params['after'] = page[-1].pk
+        ret['next'] = request.build_absolute_uri('?' + params.urlencode())
+    return JsonResponse(ret)
+
+
+@require_GET
+@condition(etag_func=feed_etag)
+def detail_view(request, resource, pk):
+    resource = get_resource(resource)
+    try:
+        fields, includes = resource.parse(request.GET)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    try:
+        obj = resource.queryset(fields, includes).get(pk=pk)
+    except resource.model.DoesNotExist:
+        if resource.model is not Map or not archive.restore_map(pk):
+            raise Http404
+        obj = resource.queryset(fields, includes).get(pk=pk)
+    return JsonResponse({'data': resource.serialise(obj, fields, includes)})
+
+
+@require_GET
+def changes_feed(request):
+    """Long-polling change feed.
+
+    Returns the entries after the sequence number ``after``, waiting up to
+    ``wait`` seconds for new ones if there are none yet. Clients pass the
+    returned ``cursor`` as ``after`` on their next request.
+
+    """
+    try:
+        cursor = int(request.GET.get('after', 0))
+        limit = min(
+            int(request.GET.get('limit', settings.MAPS_CHANGES_PAGE_SIZE)),
+            settings.MAPS_CHANGES_PAGE_SIZE
+        )
+        if limit < 1:
+            raise ValueError("limit must be at least 1")
+        wait = min(
+            float(request.GET.get('wait', 0)), settings.MAPS_CHANGES_MAX_WAIT
+        )
+    except ValueError:
+        return HttpResponseBadRequest()
+
+    changes = Change.objects.wait_after(
+        cursor, limit, wait, settings.MAPS_CHANGES_POLL_INTERVAL
+    )
+    return JsonResponse({
+        'changes': [c.as_dict() for c in changes],
+        'cursor': changes[-1].pk if changes else cursor,
+    })
@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+"""Machine-facing routes, shared by the full site and the API-only app.
+
+Views are named by dotted path so a worker only imports the ones it
+serves.
+"""
+from django.conf.urls import patterns, url
+
+
+urlpatterns = patterns(
+    '',
+    url(r'^changes/$', 'maps.api.changes_feed', name="changes_feed"),
+    url(r'^api/(?P<resource>[\w-]+)/$', 'maps.api.list_view',
+        name="api_list"),
+    url(r'^api/(?P<resource>[\w-]+)/(?P<pk>\d+)/$', 'maps.api.detail_view',
+        name="api_detail"),
+    url(r'^events/(?P<pk>\d+)/report\.(?P<fmt>html|csv)$',
+        'maps.reports.serve', name="event_report"),
+    url(r'^agreement\.(?P<fmt>html|json)$', 'maps.agreement.dashboard',
+        name="agreement"),
+)
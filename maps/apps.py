@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import (
+    m2m_changed, post_delete, post_save, pre_delete, pre_save,
+)
+
+
+class MapsConfig(AppConfig):
+    name = 'maps'
+    verbose_name = "Maps"
+
+    def ready(self):
+        from . import (
+            agreement, duplicates, metadata, revisions, spatial, sqlite,
+        )
+        from .models import DataSource, Map
+
+        def index(sender, instance, using, **kwargs):
+            spatial.update(instance, using)
+
+        def unindex(sender, instance, using, **kwargs):
+            spatial.remove(instance, using)
+
+        for model in spatial.INDEXES:
+            post_save.connect(index, sender=model, weak=False,
+                              dispatch_uid='maps.spatial.update')
+            post_delete.connect(unindex, sender=model, weak=False,
+                                dispatch_uid='maps.spatial.remove')
+
+        def fingerprint(sender, instance, raw, **kwargs):
+            if not raw:
+                duplicates.index(instance)
+
+        post_save.connect(fingerprint, sender=Map, weak=False,
+                          dispatch_uid='maps.duplicates.index')
+
+        pre_save.connect(revisions.before_save, sender=Map,
+                         dispatch_uid='maps.revisions.before_save')
+        post_save.connect(revisions.after_save, sender=Map,
+                          dispatch_uid='maps.revisions.after_save')
+        for field in Map._meta.many_to_many:
+            m2m_changed.connect(revisions.relation_changed,
+                                sender=field.rel.through,
+                                dispatch_uid='maps.revisions.relation_changed')
+
+        def promote(sender, instance, using, raw, **kwargs):
+            if not raw:
+                metadata.sync_promoted([instance], using)
+
+        post_save.connect(promote, sender=DataSource, weak=False,
+                          dispatch_uid='maps.metadata.sync_promoted')
+
+        def unscore(sender, instance, using, **kwargs):
+            # Before the cascade removes the review's coding.
+            agreement.unscore(instance.pk, using)
+
+        pre_delete.connect(unscore, sender=Map, weak=False,
+                           dispatch_uid='maps.agreement.unscore')
+        post_save.connect(agreement.after_save, sender=Map,
+                          dispatch_uid='maps.agreement.after_save')
+        for field in Map._meta.many_to_many:
+            m2m_changed.connect(agreement.relation_changed,
+                                sender=field.rel.through,
+                                dispatch_uid='maps.agreement.relation_changed')
+
+        connection_created.connect(sqlite.configure,
+                                   dispatch_uid='maps.sqlite.configure')
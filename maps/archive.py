@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+"""Cold storage for the reviews of closed events.
+
+:func:`archive` moves an Event's maps, their many-to-many rows, the drafts
+they were promoted from and the statistical data no other map uses into a
+gzipped JSON file under ``settings.MAPS_ARCHIVE_ROOT``, and deletes them
+from the hot tables. What stays behind is an :class:`EventArchive` row and
+an :class:`ArchivedMap` stub per map, so archived reviews can still be
+found by id, title or reviewer.
+
+:func:`restore` reinserts everything under the original ids. Views reading
+a map, or an event's maps, call :func:`restore_map` / :func:`restore_event`
+when they find a stub, so clients never see the difference except for the
+first, slower request. Revision history stays in the hot tables;
+near-duplicate, spatial index and agreement entries are rebuilt on
+restore.
+"""
+import datetime
+import gzip
+import json
+import os
+
+from django.conf import settings
+from django.core import serializers
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections, router, transaction
+from django.db.models import F
+
+from . import agreement, duplicates, reports, spatial
+from .models import (
+    ArchivedMap, Change, DraftChange, Event, EventArchive, Map, ReviewDraft,
+    StatisticalOrIndicatorData,
+)
+
+#: Archived models, in the order they are restored.
+MODELS = (StatisticalOrIndicatorData, Map, ReviewDraft, DraftChange)
+
+
+class _Encoder(DjangoJSONEncoder):
+    # DjangoJSONEncoder rounds times to milliseconds; archived rows keep
+    # theirs exactly, so restored ETags and Last-Modified dates match.
+    def default(self, o):
+        if isinstance(o, (datetime.datetime, datetime.time)):
+            return o.isoformat()
+        return super(_Encoder, self).default(o)
+
+
+def _path(name):
+    return os.path.join(settings.MAPS_ARCHIVE_ROOT, name)
+
+
+def orphaned_stats(maps):
+    """Statistical data linked to ``maps`` and to no other map."""
+    through = Map.statistical_data.through
+    linked = through.objects.filter(map__in=maps).values_list(
+        'statisticalorindicatordata', flat=True
+    )
+    shared = through.objects.filter(
+        statisticalorindicatordata__in=linked
+    ).exclude(map__in=maps).values_list(
+        'statisticalorindicatordata', flat=True
+    )
+    return StatisticalOrIndicatorData.objects.filter(
+        pk__in=list(linked)
+    ).exclude(pk__in=list(shared))
+
+
+def archive(event):
+    """Moves the reviews of ``event`` to an archive file.
+
+    The maps are locked, written to the file and deleted in one
+    transaction, so none can change between being archived and deleted;
+    maps added meanwhile simply stay in the hot tables. If anything fails,
+    the file is removed and the hot tables are left whole.
+
+    :return: the EventArchive, or None if the event has no maps.
+
+    """
+    # Capture the final report; reports of archived events aren't rebuilt.
+    reports.build([event.pk])
+
+    if not os.path.isdir(settings.MAPS_ARCHIVE_ROOT):
+        os.makedirs(settings.MAPS_ARCHIVE_ROOT)
+    name = 'event-{0}.json.gz'.format(event.pk)
+    written = False
+    try:
+        using = router.db_for_write(Map)
+        with transaction.atomic(using=using), \
+                Change.objects.deferred_appends(using):
+            # Lock before reading, as in restore(): SELECT ... FOR UPDATE
+            # does nothing on SQLite, a write takes the database lock.
+            Map.objects.filter(event=event).update(event=F('event'))
+            maps = list(Map.objects.select_for_update().filter(
+                event=event
+            ).order_by('pk'))
+            if not maps:
+                return None
+            ids = [m.pk for m in maps]
+            drafts = list(ReviewDraft.objects.filter(review__in=ids))
+            stats = list(orphaned_stats(ids))
+            objects = stats + maps + drafts + list(
+                DraftChange.objects.filter(draft__in=[d.pk for d in drafts])
+            )
+            tmp = _path(name + '.tmp')
+            with gzip.open(tmp, 'wb', 9) as f:
+                f.write(json.dumps(
+                    serializers.serialize('python', objects), cls=_Encoder
+                ).encode('utf-8'))
+            os.rename(tmp, _path(name))
+            written = True
+
+            Map.objects.filter(pk__in=ids).delete()
+            StatisticalOrIndicatorData.objects.filter(
+                pk__in=[s.pk for s in stats]
+            ).delete()
+            ArchivedMap.objects.bulk_create([
+                ArchivedMap(id=m.pk, event=event, title=m.title,
+                            reviewer_name=m.reviewer_name)
+                for m in maps
+            ])
+            return EventArchive.objects.create(
+                event=event, file=name, maps=len(ids),
+                size=os.path.getsize(_path(name)),
+            )
+    except Exception:
+        if written:
+            os.remove(_path(name))
+        raise
+
+
+def _insert(model, objs, using):
+    """Inserts rows as stored, keeping ids and auto_now dates."""
+    fields = model._meta.local_concrete_fields
+    size = max(connections[using].ops.bulk_batch_size(fields, objs), 1)
+    for i in range(0, len(objs), size):
+        model._base_manager._insert(
+            objs[i:i + size], fields=fields, raw=True, using=using
+        )
+
+
+def restore(event):
+    """Moves the reviews of an archived ``event`` back to the hot tables.
+
+    :return: the number of maps restored, 0 if it wasn't archived.
+
+    """
+    using = router.db_for_write(Map)
+    archives = EventArchive.objects.filter(event=event)
+    with transaction.atomic(using=using), \
+            Change.objects.deferred_appends(using):
+        # A no-op write takes the lock before anything is read: the row
+        # lock on PostgreSQL, the database write lock on SQLite. A restore
+        # that was waiting on another one then finds the row gone.
+        if not archives.update(file=F('file')):
+            return 0
+        stored = archives.get()
+        with gzip.open(_path(stored.file), 'rb') as f:
+            deserialized = list(serializers.deserialize(
+                'python', json.loads(f.read().decode('utf-8'))
+            ))
+
+        by_model = dict((model, []) for model in MODELS)
+        for item in deserialized:
+            by_model[type(item.object)].append(item)
+        for model in MODELS:
+            _insert(model, [item.object for item in by_model[model]], using)
+        for field in Map._meta.many_to_many:
+            through = field.rel.through
+            source = through._meta.get_field(field.m2m_field_name())
+            target = through._meta.get_field(field.m2m_reverse_field_name())
+            through.objects.bulk_create([
+                through(**{source.attname: item.object.pk,
+                           target.attname: pk})
+                for item in by_model[Map]
+                for pk in item.m2m_data.get(field.name, ())
+            ])
+
+        restored = [item.object for item in by_model[Map]]
+        for instance in restored:
+            duplicates.index(instance)
+            spatial.update(instance, using)
+            agreement.score(instance, using)
+        # Reports follow the feed and need each map's event.
+        Change.objects.db_manager(using).append([
+            Change(model='map', object_id=m.pk, action=Change.SAVE,
+                   data=json.dumps(m.change_data()))
+            for m in restored
+        ])
+        Change.objects.db_manager(using).record(stored.event, Change.SAVE)
+        ArchivedMap.objects.filter(event=event).delete()
+        stored.delete()
+    os.remove(_path(stored.file))
+    return len(restored)
+
+
+def restore_event(event_id):
+    """Restores ``event_id`` if it is archived; True if it was."""
+    try:
+        event = Event.objects.get(pk=event_id, archive__isnull=False)
+    except Event.DoesNotExist:
+        return False
+    return bool(restore(event))
+
+
+def restore_map(map_id):
+    """Restores the event of the archived map ``map_id``; True if it was."""
+    event_id = ArchivedMap.objects.filter(pk=map_id).values_list(
+        'event', flat=True
+    ).first()
+    return event_id is not None and restore_event(event_id)
@@ -0,0 +1,120 @@
+/* Review page behaviour. Bundled after the vendored libraries into
+ * maps/js/review.js by `manage.py build_assets` with
+ * MAPS_BUNDLED_ASSETS; otherwise served as it is after the CDN ones. */
+$(function() {
+  var form = $('#review-form');
+
+  // Chosen is costly to set up on ~40 selects, most of which sit in
+  // collapsed indicator wells, so only enhance selects once visible.
+  var enhance = function(scope) {
+    $(scope).find('select.chosen:visible').each(function(ix, el) {
+      if (!$(el).data('chosen')) { $(el).chosen(); }
+    });
+  };
+
+  $('.dateinput').datepicker();
+
+  $('[data-indicator]').each(
+    function (ix, el) {
+      var indicator = $(el).data('indicator');
+      var well = $('<div class="well well-sm well_' + indicator + '"></div>');
+      var group_el = $(el).closest('div.form-group');
+      well.insertAfter(group_el);
+      $('.' + indicator).appendTo(well);
+
+      if (!$(el).prop('checked')) {
+        // initially hide fields that depend on the indicator being present
+        well.hide();
+      }
+
+      $(el).bind('change', function() {
+        // toggle the dependent fields with the changing of indicator state
+        well.toggle();
+        enhance(well);
+      });
+    }
+  );
+  enhance(form);
+
+  // Draft autosave: only fields changed since the last autosave are sent,
+  // as one small JSON object.
+  var draftUrl = form.data('draft-url');
+  var draftKey = window.localStorage && localStorage.getItem('map_review_draft');
+  var dirty = {}, pending = false;
+  var newKey = function() {
+    draftKey = (new Date().getTime().toString(36) +
+                Math.random().toString(36).slice(2)).slice(0, 32);
+    if (window.localStorage) { localStorage.setItem('map_review_draft', draftKey); }
+    $('#id_draft_key').val(draftKey);
+  };
+  var fieldValue = function(el) {
+    return el.type === 'checkbox' ? el.checked : $(el).val();
+  };
+
+  form.on('change', ':input[name]', function() {
+    if (this.type !== 'file' && this.name.indexOf('-') === -1) {
+      dirty[this.name] = fieldValue(this);
+      pending = true;
+    }
+  });
+  setInterval(function() {
+    if (!pending) { return; }
+    var sent = dirty;
+    dirty = {}; pending = false;
+    $.ajax({
+      url: draftUrl.replace('draftkey', draftKey), type: 'POST',
+      data: JSON.stringify(sent), contentType: 'application/json',
+      headers: {'X-CSRFToken': form.find('[name=csrfmiddlewaretoken]').val()}
+    }).fail(function() {
+      // keep the values for the next round
+      dirty = $.extend(sent, dirty); pending = true;
+    });
+  }, 15000);
+
+  if (!draftKey) {
+    newKey();
+  } else if (form.find('.has-error').length) {
+    $('#id_draft_key').val(draftKey);
+  } else {
+    $('#id_draft_key').val(draftKey);
+    $.getJSON(draftUrl.replace('draftkey', draftKey)).done(function(draft) {
+      $.each(draft.fields, function(name, value) {
+        var el = form.find('[name="' + name + '"]');
+        if (el.attr('type') === 'checkbox') {
+          if (el.prop('checked') !== value) { el.prop('checked', value).trigger('change'); }
+        } else {
+          el.val(value).trigger('chosen:updated');
+        }
+      });
+    }).fail(newKey);
+  }
+
+  // Possible duplicates: look up maps resembling the title, URL and file
+  // name once the reviewer stops typing.
+  var duplicatesUrl = form.data('duplicates-url');
+  var duplicates = $('<div class="alert alert-warning" id="possible-duplicates"></div>')
+    .hide().insertAfter(form.find('[name=title]').closest('div.form-group'));
+  var lookup = null;
+  form.on('change keyup', '[name=title], [name=url], [name=file_name]', function() {
+    clearTimeout(lookup);
+    lookup = setTimeout(function() {
+      var params = {};
+      $.each(['title', 'url', 'file_name'], function(ix, name) {
+        params[name] = form.find('[name=' + name + ']').val() || '';
+      });
+      if (!params.title && !params.url && !params.file_name) { return duplicates.hide(); }
+      $.getJSON(duplicatesUrl, params).done(function(data) {
+        duplicates.empty().toggle(data.duplicates.length > 0);
+        if (!data.duplicates.length) { return; }
+        duplicates.append($('<strong></strong>').text('Possible duplicates:'));
+        var list = $('<ul></ul>').appendTo(duplicates);
+        $.each(data.duplicates, function(ix, dup) {
+          $('<li></li>').append(
+            $('<a target="_blank"></a>').attr('href', dup.detail_url).text(dup.title),
+            document.createTextNode(' (' + Math.round(dup.score * 100) + '% similar)')
+          ).appendTo(list);
+        });
+      });
+    }, 500);
+  });
+});
@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+"""Chunked, resumable data backfills.
+
+A backfill is a function applied to a model's rows in primary-key ordered
+batches. Each batch runs in its own short transaction together with the
+update of its :class:`BackfillProgress` checkpoint, so an interrupted run
+resumes exactly where it stopped, and no lock is held for longer than one
+batch. Define backfills in an app's ``backfills`` module::
+
+    @backfill.register('map-title-lengths', Map, batch_size=1000)
+    def title_lengths(batch):
+        ...
+
+and either run them with ``manage.py backfill <name>``, or schedule them
+from a migration with :class:`ScheduleBackfill` and run everything pending
+with ``manage.py backfill --pending`` once the migration is deployed.
+"""
+import time
+
+from django.db import router, transaction
+from django.db.migrations.operations.base import Operation
+from django.utils import timezone
+from django.utils.module_loading import autodiscover_modules
+
+from .models import BackfillProgress, Change
+
+registry = {}
+
+
+class Backfill(object):
+
+    def __init__(self, name, model, function, batch_size=500, pause=0.0):
+        self.name = name
+        self.model = model
+        self.function = function
+        self.batch_size = batch_size
+        self.pause = pause
+
+    def progress(self):
+        """The checkpoint, read-only; unsaved if the backfill never ran.
+
+        Only :meth:`run` (and :class:`ScheduleBackfill`) create checkpoints,
+        since a saved, unfinished one is what makes a backfill pending.
+
+        """
+        return BackfillProgress.objects.filter(name=self.name).first() or (
+            BackfillProgress(name=self.name)
+        )
+
+    def start(self, restart=False):
+        """The checkpoint to resume from, created if needed."""
+        progress, _ = BackfillProgress.objects.get_or_create(name=self.name)
+        if restart:
+            progress.last_pk = None
+            progress.rows_done = 0
+            progress.finished = None
+            progress.save()
+        return progress
+
+    def remaining(self, progress):
+        qs = self.model._default_manager.order_by('pk')
+        if progress.last_pk is not None:
+            qs = qs.filter(pk__gt=progress.last_pk)
+        return qs
+
+    def next_batch(self, progress, batch_size):
+        """(first, last) primary keys of the next batch, or None."""
+        pks = list(self.remaining(progress).values_list(
+            'pk', flat=True
+        )[:batch_size])
+        return (pks[0], pks[-1], len(pks)) if pks else None
+
+    def apply(self, bounds):
+        first, last, _ = bounds
+        self.function(self.model._default_manager.filter(
+            pk__gte=first, pk__lte=last
+        ))
+
+    def run(self, batch_size=None, pause=None, restart=False, log=None):
+        """Processes the remaining batches; returns rows processed."""
+        batch_size = batch_size or self.batch_size
+        pause = self.pause if pause is None else pause
+        progress = self.start(restart)
+        done = 0
+        while True:
+            with transaction.atomic(), Change.objects.deferred_appends():
+                bounds = self.next_batch(progress, batch_size)
+                if bounds is None:
+                    progress.finished = timezone.now()
+                    progress.save()
+                    return done
+                self.apply(bounds)
+                progress.last_pk = bounds[1]
+                progress.rows_done += bounds[2]
+                progress.save()
+            done += bounds[2]
+            if log:
+                log(progress)
+            if pause:
+                time.sleep(pause)
+
+    def estimate(self, batch_size=None, pause=None):
+        """Times one batch, rolled back, and extrapolates.
+
+        :rtype: tuple
+        :return: (remaining rows, seconds per batch, estimated seconds).
+
+        """
+        batch_size = batch_size or self.batch_size
+        pause = self.pause if pause is None else pause
+        progress = self.progress()
+        remaining = self.remaining(progress).count()
+        if not remaining:
+            return 0, 0.0, 0.0
+
+        started = time.time()
+        try:
+            with transaction.atomic():
+                self.apply(self.next_batch(progress, batch_size))
+                raise _DryRun
+        except _DryRun:
+            pass
+        per_batch = time.time() - started
+        batches = -(-remaining // batch_size)
+        return remaining, per_batch, batches * per_batch + (batches - 1) * pause
+
+
+class _DryRun(Exception):
+    pass
+
+
+def register(name, model, batch_size=500, pause=0.0):
+    """Decorator registering a function as the backfill ``name``.
+
+    The function is called with a queryset of each batch of rows.
+
+    """
+    def decorator(function):
+        registry[name] = Backfill(name, model, function, batch_size, pause)
+        return function
+    return decorator
+
+
+def autodiscover():
+    autodiscover_modules('backfills')
+
+
+def pending():
+    """Registered backfills scheduled but not yet finished."""
+    names = BackfillProgress.objects.filter(
+        finished__isnull=True
+    ).values_list('name', flat=True)
+    return [registry[n] for n in names if n in registry]
+
+
+class ScheduleBackfill(Operation):
+    """Migration operation that schedules a backfill instead of running it.
+
+    Migrations run in a single transaction on PostgreSQL, which is just
+    what a backfill over a big table must avoid; this only records the
+    backfill as pending for ``manage.py backfill --pending``.
+    """
+    reduces_to_sql = False
+    reversible = True
+
+    def __init__(self, name):
+        self.name = name
+
+    def state_forwards(self, app_label, state):
+        pass
+
+    def database_forwards(self, app_label, schema_editor, from_state,
+                          to_state):
+        progress = from_state.render().get_model('maps', 'BackfillProgress')
+        db = schema_editor.connection.alias
+        if router.allow_migrate(db, progress):
+            progress.objects.using(db).get_or_create(name=self.name)
+
+    def database_backwards(self, app_label, schema_editor, from_state,
+                           to_state):
+        progress = from_state.render().get_model('maps', 'BackfillProgress')
+        db = schema_editor.connection.alias
+        if router.allow_migrate(db, progress):
+            progress.objects.using(db).filter(name=self.name).delete()
+
+    def describe(self):
+        return "Schedule backfill {0}".format(self.name)
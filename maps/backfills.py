@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+"""Backfills of the maps app; see :mod:`maps.backfill`."""
+from . import agreement, backfill, duplicates, metadata
+from .models import DataSource, Map
+
+
+@backfill.register('map-signatures', Map, batch_size=200)
+def map_signatures(batch):
+    """Fingerprints maps saved before near-duplicate detection existed."""
+    for instance in batch:
+        duplicates.index(instance)
+
+
+@backfill.register('datasource-meta', DataSource, batch_size=1000)
+def datasource_meta(batch):
+    """Copies the promoted metadata keys to their side table."""
+    metadata.sync_promoted(list(batch))
+
+
+@backfill.register('review-codings', Map, batch_size=200)
+def review_codings(batch):
+    """Scores the agreement of maps reviewed before it was tracked."""
+    for instance in batch:
+        agreement.score(instance)
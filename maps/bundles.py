@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+"""Static asset bundles for the review page.
+
+Third-party CSS and JS are vendored into ``maps/assets/vendor`` (fetched
+once from the URLs below) and concatenated, together with our own scripts
+from ``maps/assets/src``, into one stylesheet and one script under
+``maps/static``. ``collectstatic`` then fingerprints and pre-compresses them
+through :class:`maps.staticfiles.CompressedManifestStaticFilesStorage`.
+The review page only uses the bundles with ``settings.MAPS_BUNDLED_ASSETS``;
+until then it loads the libraries from the CDNs.
+
+Every vendored file is pinned by its SHA-256 in ``maps/assets/vendor.sha256``
+(``sha256sum`` format): downloads and bundle sources that don't match are
+refused. ``build_assets --pin`` records the checksums of files fetched for
+the first time and prints them. That trusts the first download, so check
+them against the digests the projects publish before committing them
+together with ``maps/assets/vendor``.
+"""
+import hashlib
+import os
+import re
+
+from django.utils.six.moves.urllib.request import urlopen
+
+ASSETS_ROOT = os.path.join(os.path.dirname(__file__), 'assets')
+STATIC_ROOT = os.path.join(os.path.dirname(__file__), 'static')
+CHECKSUMS = 'vendor.sha256'
+
+BOOTSTRAP = 'https://maxcdn.bootstrapcdn.com/bootstrap/3.3.0/'
+CHOSEN = 'https://cdnjs.cloudflare.com/ajax/libs/chosen/1.1.0/'
+DATEPICKER = 'https://cdnjs.cloudflare.com/ajax/libs/bootstrap-datepicker/1.3.0/'
+
+#: Vendored file name to the URL it is fetched from.
+VENDOR = (
+    ('bootstrap.min.css', BOOTSTRAP + 'css/bootstrap.min.css'),
+    ('bootstrap-theme.min.css', BOOTSTRAP + 'css/bootstrap-theme.min.css'),
+    ('chosen.min.css', CHOSEN + 'chosen.min.css'),
+    ('datepicker.min.css', DATEPICKER + 'css/datepicker.min.css'),
+    ('datepicker3.min.css', DATEPICKER + 'css/datepicker3.min.css'),
+    ('jquery.min.js', 'https://code.jquery.com/jquery-2.1.1.min.js'),
+    ('jquery-ui.min.js',
+     'https://ajax.googleapis.com/ajax/libs/jqueryui/1.10.2/jquery-ui.min.js'),
+    ('chosen.jquery.min.js', CHOSEN + 'chosen.jquery.min.js'),
+    ('bootstrap-datepicker.js', DATEPICKER + 'js/bootstrap-datepicker.js'),
+    ('bootstrap.min.js', BOOTSTRAP + 'js/bootstrap.min.js'),
+    ('chosen-sprite.png', CHOSEN + 'chosen-sprite.png'),
+    ('chosen-sprite@2x.png', CHOSEN + 'chosen-sprite@2x.png'),
+) + tuple(
+    ('glyphicons-halflings-regular.' + ext,
+     BOOTSTRAP + 'fonts/glyphicons-halflings-regular.' + ext)
+    for ext in ('eot', 'svg', 'ttf', 'woff', 'woff2')
+)
+
+#: Bundle path under ``maps/static`` to its sources under ``maps/assets``.
+BUNDLES = (
+    ('maps/css/review.css', (
+        'vendor/bootstrap.min.css',
+        'vendor/bootstrap-theme.min.css',
+        'vendor/chosen.min.css',
+        'vendor/datepicker.min.css',
+        'vendor/datepicker3.min.css',
+    )),
+    ('maps/js/review.js', (
+        'vendor/jquery.min.js',
+        'vendor/jquery-ui.min.js',
+        'vendor/chosen.jquery.min.js',
+        'vendor/bootstrap-datepicker.js',
+        'vendor/bootstrap.min.js',
+        'src/review.js',
+    )),
+)
+
+#: Files copied as they are to where the bundled CSS expects them.
+COPIES = (
+    ('vendor/chosen-sprite.png', 'maps/css/chosen-sprite.png'),
+    ('vendor/chosen-sprite@2x.png', 'maps/css/chosen-sprite@2x.png'),
+) + tuple(
+    ('vendor/glyphicons-halflings-regular.' + ext,
+     'maps/fonts/glyphicons-halflings-regular.' + ext)
+    for ext in ('eot', 'svg', 'ttf', 'woff', 'woff2')
+)
+
+# Source maps aren't shipped, so don't make browsers ask for them.
+SOURCE_MAP = re.compile(br'^\s*(//|/\*)[#@] sourceMappingURL=.*$', re.M)
+
+
+def _sha256(content):
+    return hashlib.sha256(content).hexdigest()
+
+
+def load_checksums():
+    """Pinned checksums, by vendored file name."""
+    path = os.path.join(ASSETS_ROOT, CHECKSUMS)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        pins = [line.split(None, 1) for line in f if line.strip()]
+    return dict((name.strip(), digest) for digest, name in pins)
+
+
+def _save_checksums(checksums):
+    with open(os.path.join(ASSETS_ROOT, CHECKSUMS), 'w') as f:
+        for name, _ in VENDOR:
+            if name in checksums:
+                f.write('{0}  {1}\n'.format(checksums[name], name))
+
+
+def verify(name, content, checksums):
+    """Checks vendored ``content`` against its pinned checksum.
+
+    :raises ValueError: if it differs or isn't pinned.
+
+    """
+    if name not in checksums:
+        raise ValueError(
+            "{0} has no pinned checksum; fetch it with "
+            "`build_assets --pin`".format(name)
+        )
+    if _sha256(content) != checksums[name]:
+        raise ValueError("{0} doesn't match its pinned checksum".format(name))
+
+
+def fetch_vendor(force=False, pin=False):
+    """Downloads missing vendored files.
+
+    :param bool force: download files already present again.
+    :param bool pin: trust and record the checksums of files not pinned
+        yet; pinned ones must still match.
+    :return: ``(name, sha256)`` of each file fetched.
+    :raises ValueError: if a download doesn't match its checksum, before
+        anything is written.
+
+    """
+    checksums = load_checksums()
+    fetched = {}
+    vendor_dir = os.path.join(ASSETS_ROOT, 'vendor')
+    for name, url in VENDOR:
+        path = os.path.join(vendor_dir, name)
+        if os.path.exists(path) and not force:
+            continue
+        response = urlopen(url)
+        try:
+            content = response.read()
+        finally:
+            response.close()
+        if pin and name not in checksums:
+            checksums[name] = _sha256(content)
+        verify(name, content, checksums)
+        fetched[name] = content
+
+    if not os.path.isdir(vendor_dir):
+        os.makedirs(vendor_dir)
+    for name, content in fetched.items():
+        with open(os.path.join(vendor_dir, name), 'wb') as f:
+            f.write(content)
+    if pin:
+        _save_checksums(checksums)
+    return [
+        (name, _sha256(fetched[name])) for name, _ in VENDOR
+        if name in fetched
+    ]
+
+
+def _read(source, checksums):
+    with open(os.path.join(ASSETS_ROOT, source), 'rb') as f:
+        content = f.read()
+    if source.startswith('vendor/'):
+        verify(source[len('vendor/'):], content, checksums)
+    return content
+
+
+def _write(name, content):
+    path = os.path.join(STATIC_ROOT, name)
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with open(path, 'wb') as f:
+        f.write(content)
+
+
+def build():
+    """Writes the bundles and copied files; returns the paths written.
+
+    :raises ValueError: if a vendored file doesn't match its checksum.
+
+    """
+    checksums = load_checksums()
+    written = []
+    for name, sources in BUNDLES:
+        parts = []
+        for source in sources:
+            parts.append(
+                SOURCE_MAP.sub(b'', _read(source, checksums)).strip()
+            )
+        # A separating ';' keeps concatenated scripts from running together.
+        separator = b'\n;\n' if name.endswith('.js') else b'\n'
+        _write(name, separator.join(parts) + b'\n')
+        written.append(name)
+    for source, name in COPIES:
+        _write(name, _read(source, checksums))
+        written.append(name)
+    return written
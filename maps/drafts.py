@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""Autosaved review drafts.
+
+The review page periodically posts only the fields changed since its last
+autosave. Each autosave is a single bulk insert of :class:`DraftChange`
+rows (JSON-encoded values); :func:`coalesce` later folds pending changes
+into :attr:`ReviewDraft.data` in batches, either when a draft is read or
+promoted or from the ``coalesce_drafts`` management command.
+
+Drafts are keyed by reviewer and draft key: :func:`reviewer` gives each
+browser session a reviewer id, so a draft key alone never reaches someone
+else's draft.
+"""
+import json
+import uuid
+
+from django.db import transaction
+
+from . import sqlite
+from .models import ReviewDraft, DraftChange
+
+#: Session key of the reviewer id.
+SESSION_KEY = 'maps_reviewer'
+
+def reviewer(request):
+    """The reviewer id of ``request``'s session, created if needed."""
+    if SESSION_KEY not in request.session:
+        request.session[SESSION_KEY] = uuid.uuid4().hex
+    return request.session[SESSION_KEY]
+
+
+@sqlite.write_transaction
+def record_changes(reviewer, key, fields):
+    """Appends changed field values to a reviewer's draft ``key``.
+
+    :param str reviewer: reviewer id, see :func:`reviewer`.
+    :param str key: client-generated draft key.
+    :param dict fields: field name to (JSON-serialisable) value.
+
+    """
+    draft, _ = ReviewDraft.objects.get_or_create(reviewer=reviewer, key=key)
+    DraftChange.objects.bulk_create([
+        DraftChange(draft=draft, field=name, value=json.dumps(value))
+        for name, value in fields.items()
+    ])
+    return draft
+
+
+@sqlite.write_transaction
+def coalesce(drafts=None):
+    """Folds pending changes into their drafts' data.
+
+    :param drafts: queryset of drafts to coalesce, defaults to all drafts
+        with pending changes.
+    :rtype: int
+    :return: number of changes folded.
+
+    """
+    changes = DraftChange.objects.order_by('pk')
+    if drafts is not None:
+        changes = changes.filter(draft__in=drafts)
+
+    with transaction.atomic():
+        pending = {}
+        folded = []
+        for pk, draft_id, field, value in changes.values_list(
+                'pk', 'draft', 'field', 'value').iterator():
+            pending.setdefault(draft_id, {})[field] = json.loads(value)
+            folded.append(pk)
+        if not folded:
+            return 0
+
+        for draft in ReviewDraft.objects.select_for_update().filter(
+                pk__in=pending.keys()):
+            data = json.loads(draft.data)
+            data.update(pending[draft.pk])
+            draft.data = json.dumps(data)
+            if data.get('reviewer_name'):
+                draft.reviewer_name = data['reviewer_name'][:300]
+            draft.save(update_fields=['data', 'reviewer_name', 'updated'])
+
+        # Delete only what was read: on PostgreSQL, changes committed
+        # meanwhile can have lower ids than the last one read.
+        for chunk in sqlite.chunks(folded):
+            DraftChange.objects.filter(pk__in=chunk).delete()
+    return len(folded)
+
+
+def _unpromoted(reviewer, key):
+    return ReviewDraft.objects.filter(
+        reviewer=reviewer, key=key, review__isnull=True
+    )
+
+
+def load(reviewer, key):
+    """Returns the coalesced data of an unpromoted draft, or None."""
+    drafts = _unpromoted(reviewer, key)
+    coalesce(drafts)
+    data = drafts.values_list('data', flat=True).first()
+    return json.loads(data) if data is not None else None
+
+
+@sqlite.write_transaction
+def promote(reviewer, key, review):
+    """Marks a reviewer's draft ``key`` as submitted as ``review``."""
+    drafts = _unpromoted(reviewer, key)
+    coalesce(drafts)
+    drafts.update(review=review)
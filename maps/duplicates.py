@@ -0,0 +1,305 @@
+# -*- coding: utf-8 -*-
+"""Near-duplicate detection for maps.
+
+The same agency map is often reviewed several times under a slightly
+different title, file name or URL. Each Map gets a MinHash signature of its
+normalised title shingles and URL and file name tokens, split into
+locality-sensitive hashing bands: maps sharing a band bucket are candidates,
+confirmed by the similarity their signatures estimate. Maps whose PDFs have
+the same SHA-1 are duplicates outright.
+
+Signatures are refreshed whenever a Map is saved, so looking up the
+possible duplicates of a review costs a few indexed queries, and
+:func:`clusters` groups the whole corpus in one pass over the buckets
+instead of comparing every pair of maps.
+"""
+import hashlib
+import json
+import os
+import random
+import re
+import unicodedata
+import zlib
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import six
+from django.utils.six.moves.urllib.parse import urlsplit
+
+from .models import Map, MapBand, MapSignature
+
+#: MinHash permutations, as BANDS bands of ROWS rows. Maps whose token sets
+#: have Jaccard similarity s share a bucket with probability
+#: 1 - (1 - s**ROWS)**BANDS: about 0.93 at s=0.5, 0.27 at s=0.25.
+BANDS = 20
+ROWS = 3
+
+#: Title shingle length, in characters.
+SHINGLE = 4
+
+#: URL and file name tokens too common to tell maps apart.
+STOP_TOKENS = frozenset((
+    'http', 'https', 'www', 'com', 'org', 'int', 'pdf', 'png', 'jpg', 'html',
+    'htm', 'php', 'aspx', 'files', 'file', 'download', 'uploads', 'sites',
+    'default', 'resources', 'docs', 'map', 'maps',
+))
+
+_PRIME = (1 << 61) - 1
+_rng = random.Random(20150501)
+_PERMUTATIONS = [
+    (_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME))
+    for _ in range(BANDS * ROWS)
+]
+
+
+def normalise(text):
+    """Lower-cased ASCII words of ``text``, single-space separated."""
+    text = unicodedata.normalize('NFKD', six.text_type(text or ''))
+    text = text.encode('ascii', 'ignore').decode('ascii').lower()
+    return ' '.join(re.findall(r'[a-z0-9]+', text))
+
+
+def _words(text):
+    return [
+        w for w in normalise(text).split()
+        if w not in STOP_TOKENS and not w.isdigit()
+    ]
+
+
+def tokens(title=None, url=None, file_name=None, pdf_name=None):
+    """The set of features compared between maps."""
+    ret = set()
+    title = normalise(title)
+    if title:
+        ret.update(
+            't:' + title[i:i + SHINGLE]
+            for i in range(max(len(title) - SHINGLE + 1, 1))
+        )
+    if url:
+        parts = urlsplit(url)
+        host = parts.netloc.lower()
+        if host.startswith('www.'):
+            host = host[4:]
+        if host:
+            ret.add('h:' + host)
+        ret.update('u:' + w for w in _words(parts.path))
+    for name in (file_name, pdf_name):
+        if name:
+            ret.update(
+                'u:' + w for w in _words(os.path.splitext(
+                    os.path.basename(name)
+                )[0])
+            )
+    return ret
+
+
+def signature(features):
+    """MinHash signature of a set of features, or None if it is empty."""
+    if not features:
+        return None
+    hashes = [zlib.crc32(f.encode('utf-8')) & 0xffffffff for f in features]
+    return [
+        min((a * h + b) % _PRIME for h in hashes)
+        for a, b in _PERMUTATIONS
+    ]
+
+
+def buckets(sig):
+    """LSH bucket ids of a signature, one per band."""
+    ret = []
+    for band in range(BANDS):
+        rows = sig[band * ROWS:(band + 1) * ROWS]
+        digest = hashlib.md5('{0}:{1}'.format(
+            band, ','.join(str(v) for v in rows)
+        ).encode('ascii')).hexdigest()
+        ret.append(int(digest[:15], 16))
+    return ret
+
+
+def similarity(sig_a, sig_b):
+    """Jaccard similarity estimated from two signatures."""
+    return sum(1 for a, b in zip(sig_a, sig_b) if a == b) / float(len(sig_a))
+
+
+def pdf_digest(field_file):
+    """SHA-1 of an uploaded PDF, or '' if there is none or it's missing."""
+    if not field_file:
+        return ''
+    sha1 = hashlib.sha1()
+    try:
+        field_file.open('rb')
+        try:
+            for chunk in field_file.chunks():
+                sha1.update(chunk)
+        finally:
+            field_file.close()
+    except (IOError, OSError):
+        return ''
+    return sha1.hexdigest()
+
+
+def map_tokens(instance):
+    return tokens(
+        instance.title, instance.url, instance.file_name,
+        instance.pdf.name if instance.pdf else None,
+    )
+
+
+def index(instance):
+    """Brings the signature and buckets of a saved Map up to date.
+
+    The PDF is only hashed again when a different file was attached.
+
+    """
+    sig = signature(map_tokens(instance))
+    minhash = json.dumps(sig)
+    pdf_name = instance.pdf.name if instance.pdf else ''
+    try:
+        stored = MapSignature.objects.get(map=instance)
+    except MapSignature.DoesNotExist:
+        stored = MapSignature(map=instance, pdf_name=None)
+    if stored.minhash == minhash and stored.pdf_name == pdf_name:
+        return stored
+    if stored.pdf_name != pdf_name:
+        stored.pdf_name = pdf_name
+        stored.pdf_sha1 = pdf_digest(instance.pdf)
+    if stored.minhash == minhash:
+        stored.save()
+        return stored
+
+    with transaction.atomic(savepoint=False):
+        stored.minhash = minhash
+        stored.save()
+        MapBand.objects.filter(map=instance).delete()
+        if sig:
+            MapBand.objects.bulk_create([
+                MapBand(map=instance, bucket=b) for b in buckets(sig)
+            ])
+    return stored
+
+
+def candidates(sig, pdf_sha1=None, exclude=None, threshold=None):
+    """(map id, score) pairs of maps similar to a signature, best first.
+
+    :param list sig: MinHash signature, or None.
+    :param str pdf_sha1: also match maps with this exact PDF (score 1).
+    :param int exclude: id of the map being compared, left out.
+    :param float threshold: lowest similarity reported, defaults to
+        ``settings.MAPS_DUPLICATE_THRESHOLD``.
+
+    """
+    if threshold is None:
+        threshold = settings.MAPS_DUPLICATE_THRESHOLD
+    scores = {}
+    if pdf_sha1:
+        for pk in MapSignature.objects.filter(
+                pdf_sha1=pdf_sha1).values_list('map_id', flat=True):
+            scores[pk] = 1.0
+    if sig:
+        ids = MapBand.objects.filter(
+            bucket__in=buckets(sig)
+        ).values_list('map_id', flat=True).distinct()
+        for pk, minhash in MapSignature.objects.filter(
+                map_id__in=list(ids)).values_list('map_id', 'minhash'):
+            score = similarity(sig, json.loads(minhash))
+            if score >= threshold:
+                scores[pk] = max(score, scores.get(pk, 0))
+    scores.pop(exclude, None)
+    return sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+
+
+def possible_duplicates(title=None, url=None, file_name=None, exclude=None,
+                        limit=10):
+    """(Map, score) pairs resembling a review being entered."""
+    found = candidates(
+        signature(tokens(title, url, file_name)), exclude=exclude
+    )[:limit]
+    maps = Map.objects.only('title', 'url', 'file_name').in_bulk(
+        [pk for pk, _ in found]
+    )
+    return [(maps[pk], score) for pk, score in found if pk in maps]
+
+
+def duplicates_of(instance):
+    """(map id, score) pairs of maps resembling a saved, indexed Map."""
+    try:
+        stored = MapSignature.objects.get(map=instance)
+    except MapSignature.DoesNotExist:
+        stored = index(instance)
+    return candidates(
+        json.loads(stored.minhash), stored.pdf_sha1, exclude=instance.pk
+    )
+
+
+def clusters(threshold=None):
+    """Groups of map ids that are duplicates of one another.
+
+    One ordered pass over the bucket table: within a bucket, each map is
+    compared with one representative of each group already found there,
+    rather than with every other member. Maps with the same PDF are always
+    grouped.
+
+    :rtype: list of sorted lists of map ids, largest group first.
+
+    """
+    if threshold is None:
+        threshold = settings.MAPS_DUPLICATE_THRESHOLD
+    sigs = dict(
+        (pk, json.loads(minhash)) for pk, minhash in
+        MapSignature.objects.values_list('map_id', 'minhash').iterator()
+    )
+    parent = {}
+
+    def find(pk):
+        root = pk
+        while parent.get(root, root) != root:
+            root = parent[root]
+        while pk != root:
+            parent[pk], pk = root, parent.get(pk, pk)
+        return root
+
+    def union(a, b):
+        a, b = find(a), find(b)
+        if a != b:
+            parent[max(a, b)] = min(a, b)
+
+    def group(rows):
+        last, members = None, []
+        for key, pk in rows:
+            if key != last:
+                if len(members) > 1:
+                    yield members
+                last, members = key, []
+            members.append(pk)
+        if len(members) > 1:
+            yield members
+
+    for members in group(MapBand.objects.order_by(
+            'bucket', 'map').values_list('bucket', 'map_id').iterator()):
+        representatives = []
+        for pk in members:
+            if pk not in sigs:
+                continue
+            for other in representatives:
+                if (find(other) == find(pk) or
+                        similarity(sigs[pk], sigs[other]) >= threshold):
+                    union(other, pk)
+                    break
+            else:
+                representatives.append(pk)
+
+    for members in group(MapSignature.objects.exclude(pdf_sha1='').order_by(
+            'pdf_sha1', 'map').values_list('pdf_sha1', 'map_id').iterator()):
+        for pk in members[1:]:
+            union(members[0], pk)
+
+    groups = {}
+    for pk in list(parent):
+        groups.setdefault(find(pk), []).append(pk)
+    for root, members in groups.items():
+        if root not in members:
+            members.append(root)
+    return sorted(
+        (sorted(members) for members in groups.values()),
+        key=lambda members: (-len(members), members[0])
+    )
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+import json
+
+from django import forms
+from django.core.exceptions import ValidationError
+from django.db import models
+from django.utils import six
+
+
+class JSONDictFormField(forms.CharField):
+    """Edits a dict as a JSON object in a textarea."""
+    widget = forms.Textarea
+
+    def prepare_value(self, value):
+        if isinstance(value, dict):
+            return json.dumps(value, indent=2, sort_keys=True)
+        return value
+
+    def to_python(self, value):
+        if isinstance(value, dict):
+            return value
+        if not value:
+            return {}
+        try:
+            value = json.loads(value)
+        except ValueError:
+            raise ValidationError("Enter a valid JSON object.")
+        if not isinstance(value, dict):
+            raise ValidationError("Enter a valid JSON object.")
+        return value
+
+
+class JSONDictField(six.with_metaclass(models.SubfieldBase, models.Field)):
+    """A dict of metadata stored as JSON.
+
+    The column is ``jsonb`` on PostgreSQL, so it can carry a GIN index, and
+    JSON text elsewhere, which SQLite's JSON functions (and expression
+    indexes over them) read directly. See :mod:`maps.metadata`.
+    """
+    description = "Dictionary stored as JSON"
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('default', dict)
+        kwargs.setdefault('blank', True)
+        super(JSONDictField, self).__init__(*args, **kwargs)
+
+    def db_type(self, connection):
+        if connection.vendor == 'postgresql':
+            return 'jsonb'
+        return 'text'
+
+    def to_python(self, value):
+        # psycopg2 already decodes jsonb columns.
+        if isinstance(value, dict):
+            return value
+        if not value:
+            return {}
+        return json.loads(value)
+
+    def get_prep_value(self, value):
+        if value is None:
+            return None
+        return json.dumps(value, sort_keys=True)
+
+    def value_to_string(self, obj):
+        return self.get_prep_value(self._get_val_from_obj(obj))
+
+    def formfield(self, **kwargs):
+        defaults = {'form_class': JSONDictFormField}
+        defaults.update(kwargs)
+        return super(JSONDictField, self).formfield(**defaults)
@@ -1,12 +1,16 @@
 # -*- coding: utf-8 -*-
 from django import forms
 from django.db import models
+from django.db.models import Q
+from django.forms.models import BaseModelFormSet, modelformset_factory
 
 from crispy_forms.helper import FormHelper
-from crispy_forms.layout import Layout, Fieldset, Submit, Field
-from crispy_forms.bootstrap import FormActions
+from crispy_forms.layout import Layout, Fieldset, Field, Div
 
-from .models import Map
+from .models import Actor, DataSource, Event, Map, StatisticalOrIndicatorData
+
+#: Models with entries soft-deleted by :mod:`maps.reference`.
+REFERENCE_MODELS = (Actor, DataSource, Event)
 
 
 def fields_of(indicator, *fields):
@@ -46,6 +50,18 @@ class CreateReviewForm(forms.ModelForm):
 
     def __init__(self, *args, **kwargs):
         super(CreateReviewForm, self).__init__(*args, **kwargs)
+        # Offer only current reference data, and whatever the review being
+        # edited already refers to.
+        for name, field in self.fields.items():
+            queryset = getattr(field, 'queryset', None)
+            if queryset is None or queryset.model not in REFERENCE_MODELS:
+                continue
+            current = self.initial.get(name) or []
+            if not isinstance(current, (list, tuple)):
+                current = [current]
+            field.queryset = queryset.filter(
+                Q(is_active=True) | Q(pk__in=list(current))
+            )
         # The default widget is a checkbox one, but we want to use chosen
         # so revert to regular select:
         for f in self.fields:
@@ -148,6 +164,13 @@ class CreateReviewForm(forms.ModelForm):
                 'situational_data_date',
                 'day_offset',
                 Field('extent', css_class='chosen'),
+                Div(
+                    Div('extent_west', css_class='col-sm-3'),
+                    Div('extent_south', css_class='col-sm-3'),
+                    Div('extent_east', css_class='col-sm-3'),
+                    Div('extent_north', css_class='col-sm-3'),
+                    css_class='row',
+                ),
                 Field('authors_or_producers', css_class='chosen'),
                 Field('donors', css_class='chosen'),
                 'is_part_of_series',
@@ -184,7 +207,91 @@ class CreateReviewForm(forms.ModelForm):
                     'statistical_data',
                 )
             ),
-            FormActions(
-                Submit('save', 'Save changes'),
-            )
         )
+        # The template wraps the review and its inline formsets in a
+        # single <form>, so don't render our own tag or submit button.
+        self.helper.form_tag = False
+        self.helper.disable_csrf = True
+
+
+def data_source_slots():
+    """Choices of Map relations a newly created DataSource can fill."""
+    ret = [('', 'Not linked to this map')]
+    for f in Map._meta.fields + Map._meta.many_to_many:
+        if getattr(f.rel, 'to', None) is DataSource:
+            ret.append((f.name, f.name.replace('_', ' ').capitalize()))
+    return ret
+
+
+class NewDataSourceForm(forms.ModelForm):
+    """Creates a DataSource alongside the review that uses it."""
+    use_for = forms.ChoiceField(
+        choices=data_source_slots(), required=False
+    )
+
+    class Meta:
+        model = DataSource
+        fields = ('source_type', 'name')
+
+    def attach(self, review, linked):
+        slot = self.cleaned_data.get('use_for')
+        if not slot:
+            return
+        if slot in linked:
+            linked[slot].add(self.instance.pk)
+        else:
+            setattr(review, slot, self.instance)
+
+
+class NewStatisticalDataForm(forms.ModelForm):
+    """Creates indicator/statistics data attached to the review."""
+    class Meta:
+        model = StatisticalOrIndicatorData
+        fields = (
+            'data_type',
+            'is_pre_or_post',
+            'data_date_earliest',
+            'data_date_latest',
+            'data_source',
+        )
+
+    def attach(self, review, linked):
+        linked['statistical_data'].add(self.instance.pk)
+
+
+class BaseInlineCreateFormSet(BaseModelFormSet):
+    """Formset that only ever creates rows linked to a review."""
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('queryset', self.model._default_manager.none())
+        super(BaseInlineCreateFormSet, self).__init__(*args, **kwargs)
+
+    def save_for_review(self, review, linked):
+        """Saves new rows and links them to ``review``.
+
+        Called by :func:`maps.pipeline.save_review` before the Map row is
+        written, so forms may set foreign keys on ``review`` or add pks to
+        ``linked`` (a dict of many-to-many field name to pk set).
+
+        """
+        saved = [id(obj) for obj in self.save()]
+        for form in self.forms:
+            if id(form.instance) in saved:
+                form.attach(review, linked)
+
+
+NewDataSourceFormSet = modelformset_factory(
+    DataSource, form=NewDataSourceForm, formset=BaseInlineCreateFormSet,
+    extra=1, can_delete=False,
+)
+NewStatisticalDataFormSet = modelformset_factory(
+    StatisticalOrIndicatorData, form=NewStatisticalDataForm,
+    formset=BaseInlineCreateFormSet, extra=1, can_delete=False,
+)
+
+
+def review_formsets(data=None):
+    """Inline creation formsets shown alongside :class:`CreateReviewForm`."""
+    return [
+        NewDataSourceFormSet(data, prefix='new_sources'),
+        NewStatisticalDataFormSet(data, prefix='new_stats'),
+    ]
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+import datetime
+from optparse import make_option
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max
+from django.utils import timezone
+
+from maps import archive
+from maps.models import Event
+
+
+class Command(BaseCommand):
+    args = '[<event id> ...]'
+    help = ("Moves the reviews of the given events, or of the events "
+            "without review updates for --inactive-days, to compressed "
+            "archive files. With --restore, moves them back.")
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--inactive-days', type='int', default=None,
+            help="Days without a review update after which an event is "
+                 "archived (default: settings.MAPS_ARCHIVE_AFTER_DAYS)."
+        ),
+        make_option(
+            '--restore', action='store_true', default=False,
+            help="Restore the given archived events instead."
+        ),
+        make_option(
+            '--dry-run', action='store_true', default=False,
+            help="Only list the events that would be archived."
+        ),
+    )
+
+    def handle(self, *args, **options):
+        verbose = int(options.get('verbosity', 1)) > 0
+        try:
+            ids = [int(arg) for arg in args]
+        except ValueError:
+            raise CommandError("Event ids must be integers.")
+
+        if options['restore']:
+            if not ids:
+                raise CommandError("Give the ids of the events to restore.")
+            for pk in ids:
+                restored = archive.restore_event(pk)
+                if verbose:
+                    self.stdout.write("Event {0}: {1}".format(
+                        pk, "restored" if restored else "not archived"
+                    ))
+            return
+
+        events = Event.objects.filter(archive__isnull=True)
+        if ids:
+            events = events.filter(pk__in=ids)
+        else:
+            days = options['inactive_days']
+            if days is None:
+                days = settings.MAPS_ARCHIVE_AFTER_DAYS
+            cutoff = timezone.now() - datetime.timedelta(days=days)
+            events = events.annotate(
+                last_update=Max('map__updated_at')
+            ).filter(last_update__lt=cutoff)
+
+        for event in events.order_by('pk'):
+            if options['dry_run']:
+                self.stdout.write(u"Would archive {0}".format(event))
+                continue
+            stored = archive.archive(event)
+            if verbose and stored:
+                self.stdout.write(u"Archived {0}: {1} maps, {2} bytes".format(
+                    event, stored.maps, stored.size
+                ))
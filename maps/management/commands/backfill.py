@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from maps import backfill
+
+
+class Command(BaseCommand):
+    args = '[<name> ...]'
+    help = ("Runs backfills in primary-key ordered, checkpointed batches. "
+            "Without arguments, lists registered backfills.")
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--pending', action='store_true', default=False,
+            help="Run every scheduled backfill that hasn't finished."
+        ),
+        make_option(
+            '--batch-size', type='int', default=None,
+            help="Rows per batch (default: the backfill's own)."
+        ),
+        make_option(
+            '--pause', type='float', default=None,
+            help="Seconds to sleep between batches."
+        ),
+        make_option(
+            '--restart', action='store_true', default=False,
+            help="Start over instead of resuming from the checkpoint."
+        ),
+        make_option(
+            '--dry-run', action='store_true', default=False,
+            help="Time one batch (rolled back) and estimate the runtime."
+        ),
+    )
+
+    def handle(self, *names, **options):
+        backfill.autodiscover()
+        if options['pending']:
+            todo = backfill.pending()
+        elif names:
+            try:
+                todo = [backfill.registry[n] for n in names]
+            except KeyError as e:
+                raise CommandError("Unknown backfill {0}".format(e))
+        else:
+            for name, bf in sorted(backfill.registry.items()):
+                progress = bf.progress()
+                if progress.finished:
+                    status = 'finished'
+                elif progress.pk:
+                    status = 'pending'
+                else:
+                    status = 'not started'
+                self.stdout.write("{0}\t{1} rows done\t{2}".format(
+                    name, progress.rows_done, status
+                ))
+            return
+
+        for bf in todo:
+            if options['dry_run']:
+                rows, per_batch, total = bf.estimate(
+                    options['batch_size'], options['pause']
+                )
+                self.stdout.write(
+                    "{0}: {1} rows left, {2:.2f}s per batch, "
+                    "about {3:.0f}s in total".format(
+                        bf.name, rows, per_batch, total
+                    )
+                )
+                continue
+
+            def log(progress):
+                if int(options['verbosity']) > 1:
+                    self.stdout.write("{0}: {1} rows, up to pk {2}".format(
+                        progress.name, progress.rows_done, progress.last_pk
+                    ))
+            done = bf.run(
+                options['batch_size'], options['pause'],
+                restart=options['restart'], log=log
+            )
+            self.stdout.write("{0}: processed {1} rows".format(bf.name, done))
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from maps import bundles
+
+
+class Command(BaseCommand):
+    help = ("Vendors third-party assets and builds the review page bundles. "
+            "Run collectstatic afterwards to fingerprint and compress them.")
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--refetch', action='store_true', default=False,
+            help="Download vendored files again even if present."
+        ),
+        make_option(
+            '--pin', action='store_true', default=False,
+            help="Record the checksums of vendored files fetched for the "
+                 "first time in maps/assets/vendor.sha256. Check them "
+                 "against the published digests before committing."
+        ),
+    )
+
+    def handle(self, *args, **options):
+        verbose = int(options.get('verbosity', 1)) > 0
+        try:
+            fetched = bundles.fetch_vendor(
+                force=options['refetch'], pin=options['pin']
+            )
+            for name, digest in fetched:
+                if verbose:
+                    self.stdout.write("Fetched {0} (sha256 {1})".format(
+                        name, digest
+                    ))
+            for name in bundles.build():
+                if verbose:
+                    self.stdout.write("Wrote {0}".format(name))
+        except ValueError as e:
+            raise CommandError(str(e))
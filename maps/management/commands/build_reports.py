@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+from optparse import make_option
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from maps import reports
+from maps.models import Change
+
+
+class Command(BaseCommand):
+    help = ("Rebuilds the per-event reports made stale by changes since "
+            "the last build.")
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--all', action='store_true', default=False,
+            help="Rebuild every event's report."
+        ),
+        make_option(
+            '--follow', action='store_true', default=False,
+            help="Keep waiting for changes and rebuilding."
+        ),
+    )
+
+    def handle(self, *args, **options):
+        verbose = int(options.get('verbosity', 1)) > 0
+        if options['all']:
+            built = reports.rebuild_all()
+            if verbose:
+                self.stdout.write("Built {0} reports.".format(len(built)))
+        while True:
+            built = reports.refresh()
+            if verbose and built:
+                self.stdout.write("Rebuilt reports of events {0}.".format(
+                    ', '.join(str(pk) for pk in sorted(built))
+                ))
+                self.stdout.flush()
+            if not options['follow']:
+                return
+            Change.objects.wait_after(
+                reports.load_manifest()['cursor'], 1,
+                settings.MAPS_CHANGES_MAX_WAIT,
+                settings.MAPS_CHANGES_POLL_INTERVAL,
+            )
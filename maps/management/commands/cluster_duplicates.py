@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from maps import backfill, duplicates
+from maps.models import Map
+
+
+class Command(BaseCommand):
+    help = ("Groups maps that are near-duplicates of one another, by "
+            "title, URL and file name similarity or identical PDF.")
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--threshold', type='float', default=None,
+            help="Lowest similarity (0-1) counted as a duplicate."
+        ),
+        make_option(
+            '--reindex', action='store_true', default=False,
+            help="Fingerprint every map again first."
+        ),
+    )
+
+    def handle(self, *args, **options):
+        if options['reindex']:
+            backfill.autodiscover()
+            backfill.registry['map-signatures'].run(restart=True)
+
+        groups = duplicates.clusters(options['threshold'])
+        titles = Map.objects.only('title').in_bulk(
+            [pk for group in groups for pk in group]
+        )
+        for group in groups:
+            self.stdout.write(u'{0}: {1}'.format(
+                ', '.join(str(pk) for pk in group),
+                ' | '.join(titles[pk].title for pk in group if pk in titles)
+            ))
+        if int(options.get('verbosity', 1)) > 0:
+            self.stdout.write("{0} groups of duplicates.".format(len(groups)))
@@ -0,0 +1,13 @@
+# -*- coding: utf-8 -*-
+from django.core.management.base import BaseCommand
+
+from maps.drafts import coalesce
+
+
+class Command(BaseCommand):
+    help = "Folds pending autosaved changes into their review drafts."
+
+    def handle(self, *args, **options):
+        folded = coalesce()
+        if int(options.get('verbosity', 1)) > 0:
+            self.stdout.write("Coalesced {0} draft changes.".format(folded))
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+import csv
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from maps import spatial
+from maps.models import AdminArea, Change
+
+COLUMNS = ('code', 'name', 'level', 'parent', 'west', 'south', 'east', 'north')
+
+
+class Command(BaseCommand):
+    args = '<file.csv>'
+    help = ("Loads administrative areas from a CSV file with the columns "
+            "{0} (parent being the parent's code) and rebuilds the spatial "
+            "index. Existing areas are updated by code.".format(
+                ', '.join(COLUMNS)))
+
+    def handle(self, *args, **options):
+        if len(args) != 1:
+            raise CommandError("Give the path of one CSV file.")
+        with open(args[0], 'rb') as f:
+            rows = list(csv.DictReader(f))
+        missing = set(COLUMNS) - set(rows[0] if rows else COLUMNS)
+        if missing:
+            raise CommandError(
+                "Missing columns: {0}".format(', '.join(sorted(missing)))
+            )
+
+        with transaction.atomic(), Change.objects.deferred_appends():
+            existing = dict(
+                (a.code, a) for a in AdminArea.objects.filter(
+                    code__in=[r['code'] for r in rows]
+                )
+            )
+            new = []
+            for row in rows:
+                area = existing.get(row['code']) or AdminArea(code=row['code'])
+                area.name = row['name'].decode('utf-8')
+                area.level = int(row['level'])
+                for column in ('west', 'south', 'east', 'north'):
+                    setattr(area, column, float(row[column]))
+                if area.pk:
+                    area.save()
+                else:
+                    new.append(area)
+            AdminArea.objects.bulk_create(new)
+
+            # Parents may come after their children, so link them last.
+            ids = dict(AdminArea.objects.values_list('code', 'pk'))
+            for row in rows:
+                parent = row['parent'] and ids.get(row['parent'])
+                if row['parent'] and not parent:
+                    raise CommandError(
+                        "Unknown parent {0} of {1}".format(
+                            row['parent'], row['code'])
+                    )
+                AdminArea.objects.filter(code=row['code']).update(
+                    parent=parent or None
+                )
+            # Bulk writes bypass save(), so record them in the change feed.
+            Change.objects.record_many(
+                AdminArea, [ids[row['code']] for row in rows], Change.SAVE
+            )
+            spatial.rebuild(AdminArea)
+
+        if int(options.get('verbosity', 1)) > 0:
+            self.stdout.write("Loaded {0} areas ({1} new).".format(
+                len(rows), len(new)
+            ))
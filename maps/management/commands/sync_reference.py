@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from maps import reference
+
+
+class Command(BaseCommand):
+    args = '<{0}> <file.json|file.csv>'.format(
+        '|'.join(sorted(reference.CATALOGUES))
+    )
+    help = ("Brings actors, clusters, events or data sources in line with a "
+            "catalogue file, matching them by name (GLIDE number for "
+            "events). Entries missing from the file are deactivated.")
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--keep-missing', action='store_true', default=False,
+            help="Leave entries missing from the file active."
+        ),
+        make_option(
+            '--dry-run', action='store_true', default=False,
+            help="Only report what would change."
+        ),
+    )
+
+    def handle(self, *args, **options):
+        if len(args) != 2 or args[0] not in reference.CATALOGUES:
+            raise CommandError("Usage: sync_reference {0}".format(self.args))
+        try:
+            counts = reference.sync(
+                args[0], reference.read(args[1]),
+                retire=not options['keep_missing'],
+                dry_run=options['dry_run'],
+            )
+        except (IOError, ValueError) as e:
+            raise CommandError(str(e))
+        if int(options.get('verbosity', 1)) > 0:
+            self.stdout.write(
+                "{prefix}{inserted} inserted, {updated} updated, "
+                "{retired} deactivated, {unchanged} unchanged.".format(
+                    prefix="Dry run: " if options['dry_run'] else "",
+                    **counts
+                )
+            )
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+import json
+from optparse import make_option
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from maps.models import Change
+
+
+class Command(BaseCommand):
+    help = ("Prints change feed entries after a cursor, one JSON object "
+            "per line.")
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--after', type='int', default=0,
+            help="Sequence number to start after (default: 0)."
+        ),
+        make_option(
+            '--follow', action='store_true', default=False,
+            help="Keep waiting for new entries."
+        ),
+    )
+
+    def handle(self, *args, **options):
+        cursor = options['after']
+        limit = settings.MAPS_CHANGES_PAGE_SIZE
+        interval = settings.MAPS_CHANGES_POLL_INTERVAL
+        while True:
+            if options['follow']:
+                changes = Change.objects.wait_after(
+                    cursor, limit, settings.MAPS_CHANGES_MAX_WAIT, interval
+                )
+            else:
+                changes = list(Change.objects.after(cursor)[:limit])
+                if not changes:
+                    return
+            for change in changes:
+                self.stdout.write(json.dumps(change.as_dict()))
+            if changes:
+                cursor = changes[-1].pk
+            self.stdout.flush()
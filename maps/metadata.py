@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""Indexed lookups on ``DataSource.meta``.
+
+Metadata is a JSON object per source (see :class:`maps.fields.JSONDictField`)
+and is queried with ``DataSource.objects.has_meta(key)`` and
+``DataSource.objects.meta(key=value, key__lte=value, ...)``. The lookups
+are index-backed:
+
+* on PostgreSQL the ``jsonb`` column has a GIN index, which serves key
+  presence (``?``) and equality (``@>``);
+* on SQLite the keys in :data:`INDEXED_KEYS` have expression indexes on
+  ``json_extract``, which serve all lookups on them;
+* keys listed in ``settings.MAPS_PROMOTED_META_KEYS`` are also copied to the
+  :class:`DataSourceMeta` side table whenever a source is saved, indexed on
+  (key, text) and (key, number). Lookups on them use it on any database,
+  including the range lookups a GIN index can't serve. After changing the
+  setting, fill the table with ``manage.py backfill datasource-meta
+  --restart``.
+
+SQLite rebuilds a table when one of its columns is altered, dropping the
+expression indexes; a migration altering DataSource has to create them
+again.
+"""
+import json
+import numbers
+import re
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils import six
+
+from .models import DataSourceMeta
+
+#: Keys with an expression index on SQLite, created by migration 0012.
+INDEXED_KEYS = ('sensor', 'resolution', 'provider')
+
+OPERATORS = {'exact': '=', 'gt': '>', 'gte': '>=', 'lt': '<', 'lte': '<='}
+
+_KEY_RE = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+
+def _check_key(key):
+    # Keys end up in SQL text: SQLite only uses an expression index when
+    # the JSON path is a literal.
+    if not _KEY_RE.match(key):
+        raise ValueError("Invalid metadata key: {0!r}".format(key))
+
+
+def _typed(value):
+    """(text, number) side-table columns holding ``value``."""
+    if isinstance(value, numbers.Number) and not isinstance(value, bool):
+        return None, float(value)
+    if isinstance(value, six.string_types):
+        return value[:255], None
+    return json.dumps(value, sort_keys=True)[:255], None
+
+
+def _column(queryset):
+    connection = connections[queryset.db]
+    return connection, '{0}.{1}'.format(
+        connection.ops.quote_name(queryset.model._meta.db_table),
+        connection.ops.quote_name('meta'),
+    )
+
+
+def _unsupported(connection):
+    return NotImplementedError(
+        "Metadata lookups on {0} are only supported for keys in "
+        "MAPS_PROMOTED_META_KEYS".format(connection.vendor)
+    )
+
+
+def _promoted(queryset, key, **lookup):
+    return queryset.filter(pk__in=DataSourceMeta.objects.filter(
+        key=key, **lookup
+    ).values('source'))
+
+
+def has_key(queryset, key):
+    """Restricts ``queryset`` to sources with a non-null ``key``."""
+    _check_key(key)
+    if key in settings.MAPS_PROMOTED_META_KEYS:
+        return _promoted(queryset, key)
+    connection, column = _column(queryset)
+    if connection.vendor == 'postgresql':
+        return queryset.extra(
+            where=['{0} ? %s'.format(column)], params=[key]
+        )
+    if connection.vendor == 'sqlite':
+        return queryset.extra(where=[
+            "json_extract({0}, '$.{1}') IS NOT NULL".format(column, key)
+        ])
+    raise _unsupported(connection)
+
+
+def filter_meta(queryset, lookups):
+    """Restricts ``queryset`` by ``key[__operator]=value`` lookups.
+
+    :raises ValueError: on an unknown operator or malformed key.
+
+    """
+    for name, value in sorted(lookups.items()):
+        key, _, operator = name.partition('__')
+        operator = operator or 'exact'
+        if operator not in OPERATORS:
+            raise ValueError("Unknown metadata lookup: {0}".format(name))
+        _check_key(key)
+        text, number = _typed(value)
+
+        if key in settings.MAPS_PROMOTED_META_KEYS:
+            if number is None:
+                lookup = {'text__' + operator: text}
+            else:
+                lookup = {'number__' + operator: number}
+            queryset = _promoted(queryset, key, **lookup)
+            continue
+
+        connection, column = _column(queryset)
+        sql = OPERATORS[operator]
+        if connection.vendor == 'postgresql':
+            if operator == 'exact':
+                where, params = '{0} @> %s'.format(column), [
+                    json.dumps({key: value})
+                ]
+            elif number is not None:
+                where = (
+                    "(CASE WHEN jsonb_typeof({0} -> %s) = 'number' "
+                    "THEN ({0} ->> %s)::numeric END) {1} %s"
+                ).format(column, sql)
+                params = [key, key, value]
+            else:
+                where = '({0} ->> %s) {1} %s'.format(column, sql)
+                params = [key, text]
+        elif connection.vendor == 'sqlite':
+            where = "json_extract({0}, '$.{1}') {2} %s".format(
+                column, key, sql
+            )
+            params = [value if number is not None else text]
+        else:
+            raise _unsupported(connection)
+        queryset = queryset.extra(where=[where], params=params)
+    return queryset
+
+
+def sync_promoted(sources, using=None):
+    """Rewrites the side-table rows of saved ``sources``."""
+    keys = settings.MAPS_PROMOTED_META_KEYS
+    if not keys:
+        return
+    manager = DataSourceMeta.objects.db_manager(using)
+    with transaction.atomic(using=manager.db, savepoint=False):
+        manager.filter(source__in=[s.pk for s in sources]).delete()
+        rows = []
+        for source in sources:
+            for key in keys:
+                if source.meta.get(key) is not None:
+                    text, number = _typed(source.meta[key])
+                    rows.append(DataSourceMeta(
+                        source=source, key=key, text=text, number=number
+                    ))
+        manager.bulk_create(rows)
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+from django.conf import settings
+from django.http import JsonResponse
+from django.utils.crypto import constant_time_compare
+
+from . import routers
+
+PIN_COOKIE = 'maps_primary'
+
+
+class PinPrimaryMiddleware(object):
+    """Pins requests to the primary database where replica lag would show.
+
+    Unsafe requests always use the primary. A request that wrote sets a
+    short-lived cookie so the same client keeps reading from the primary
+    for ``settings.MAPS_REPLICA_STICKY_SECONDS``.
+    """
+
+    def process_request(self, request):
+        routers.reset()
+        if (request.method not in ('GET', 'HEAD', 'OPTIONS') or
+                PIN_COOKIE in request.COOKIES):
+            routers.pin_to_primary()
+
+    def process_response(self, request, response):
+        if routers.has_written():
+            response.set_cookie(
+                PIN_COOKIE, '1',
+                max_age=settings.MAPS_REPLICA_STICKY_SECONDS, httponly=True
+            )
+        routers.reset()
+        return response
+
+
+def _api_views():
+    from . import api_urls
+    return set(pattern.callback for pattern in api_urls.urlpatterns)
+
+
+class TokenAuthMiddleware(object):
+    """Requires one of ``settings.MAPS_API_TOKENS``, when any are set.
+
+    Only the views of :mod:`maps.api_urls` are protected, which the full
+    site serves as well as the API-only application. Clients send
+    ``Authorization: Token <token>``. Tokens are checked against settings
+    alone, so no session, user or database row is loaded.
+    """
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        tokens = settings.MAPS_API_TOKENS
+        if not tokens or view_func not in _api_views():
+            return None
+        scheme, _, token = request.META.get(
+            'HTTP_AUTHORIZATION', ''
+        ).partition(' ')
+        token = token.strip()
+        if scheme.lower() == 'token' and token and any(
+                constant_time_compare(token, t) for t in tokens):
+            return None
+        response = JsonResponse(
+            {'error': "Authentication credentials were not provided."},
+            status=401
+        )
+        response['WWW-Authenticate'] = 'Token'
+        return response
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('maps', '0003_auto_20141123_1852'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DraftChange',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('field', models.CharField(max_length=100)),
+                ('value', models.TextField(blank=True)),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.CreateModel(
+            name='ReviewDraft',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('key', models.CharField(unique=True, max_length=40)),
+                ('reviewer_name', models.CharField(max_length=300, blank=True)),
+                ('data', models.TextField(default=b'{}')),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('review', models.ForeignKey(related_name='drafts', blank=True, to='maps.Map', help_text=b'The review this draft was promoted to, once submitted.', null=True)),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterIndexTogether(
+            name='reviewdraft',
+            index_together=set([('reviewer_name', 'updated')]),
+        ),
+        migrations.AddField(
+            model_name='draftchange',
+            name='draft',
+            field=models.ForeignKey(related_name='changes', to='maps.ReviewDraft'),
+            preserve_default=True,
+        ),
+        migrations.AlterField(
+            model_name='map',
+            name='authors_or_producers',
+            field=models.ManyToManyField(help_text=b"Name of the organisation(s) that authored the map - this should include all organisations acknowledged in the map marginalia by logos/name, or as part of the map title as having authored/produced the map. Organisations attributed with funding the map production should be entered in the 'Donor' field.", related_name='author_or_producer_of', to='maps.Actor'),
+            preserve_default=True,
+        ),
+    ]
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('maps', '0004_auto_20261019_0225'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MapRevision',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('number', models.PositiveIntegerField()),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('is_checkpoint', models.BooleanField(default=False)),
+                ('field_data', models.TextField()),
+                ('m2m_data', models.TextField()),
+                ('map', models.ForeignKey(related_name='revisions', on_delete=django.db.models.deletion.DO_NOTHING, db_constraint=False, to='maps.Map')),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterUniqueTogether(
+            name='maprevision',
+            unique_together=set([('map', 'number')]),
+        ),
+        migrations.AddField(
+            model_name='map',
+            name='revision',
+            field=models.PositiveIntegerField(default=0, help_text=b'Number of the latest MapRevision of this map.', editable=False),
+            preserve_default=True,
+        ),
+    ]
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('maps', '0005_auto_20261019_0226'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Change',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('model', models.CharField(max_length=50)),
+                ('object_id', models.PositiveIntegerField()),
+                ('action', models.CharField(max_length=10, choices=[(b'save', b'Saved'), (b'delete', b'Deleted')])),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('data', models.TextField(default=b'{}')),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('maps', '0006_change'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='map',
+            name='updated_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, auto_now=True),
+            preserve_default=False,
+        ),
+    ]
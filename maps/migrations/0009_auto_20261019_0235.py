@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('maps', '0008_backfillprogress'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AdminArea',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('name', models.CharField(max_length=200)),
+                ('code', models.CharField(help_text=b'Place code (e.g. P-code) identifying the area.', unique=True, max_length=50)),
+                ('level', models.PositiveSmallIntegerField(help_text=b'Administrative level, 0 being the country.')),
+                ('west', models.FloatField()),
+                ('south', models.FloatField()),
+                ('east', models.FloatField()),
+                ('north', models.FloatField()),
+                ('parent', models.ForeignKey(related_name='children', blank=True, to='maps.AdminArea', null=True)),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AddField(
+            model_name='map',
+            name='extent_east',
+            field=models.FloatField(help_text=b'Easternmost longitude shown on the map.', null=True, blank=True),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name='map',
+            name='extent_north',
+            field=models.FloatField(help_text=b'Northernmost latitude shown on the map.', null=True, blank=True),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name='map',
+            name='extent_south',
+            field=models.FloatField(help_text=b'Southernmost latitude shown on the map.', null=True, blank=True),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name='map',
+            name='extent_west',
+            field=models.FloatField(help_text=b'Westernmost longitude shown on the map.', null=True, blank=True),
+            preserve_default=True,
+        ),
+    ]
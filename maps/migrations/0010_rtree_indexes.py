@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, OperationalError
+
+# (R*Tree table, indexed table, west, south, east, north columns)
+RTREES = (
+    ('maps_map_rtree', 'maps_map',
+     'extent_west', 'extent_south', 'extent_east', 'extent_north'),
+    ('maps_adminarea_rtree', 'maps_adminarea',
+     'west', 'south', 'east', 'north'),
+)
+
+
+def create_rtrees(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    cursor = schema_editor.connection.cursor()
+    for table, source, west, south, east, north in RTREES:
+        try:
+            cursor.execute(
+                'CREATE VIRTUAL TABLE {0} USING rtree('
+                'id, min_x, max_x, min_y, max_y)'.format(table)
+            )
+        except OperationalError:
+            # SQLite built without the R*Tree module: maps.spatial falls
+            # back to its in-memory index.
+            return
+        cursor.execute(
+            'INSERT INTO {0} (id, min_x, max_x, min_y, max_y) '
+            'SELECT id, {2}, {4}, {3}, {5} FROM {1} '
+            'WHERE {2} IS NOT NULL'.format(
+                table, source, west, south, east, north
+            )
+        )
+
+
+def drop_rtrees(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    cursor = schema_editor.connection.cursor()
+    for rtree in RTREES:
+        cursor.execute('DROP TABLE IF EXISTS {0}'.format(rtree[0]))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('maps', '0009_auto_20261019_0235'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_rtrees, drop_rtrees),
+    ]
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+from maps.backfill import ScheduleBackfill
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('maps', '0010_rtree_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MapBand',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('bucket', models.BigIntegerField(db_index=True)),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.CreateModel(
+            name='MapSignature',
+            fields=[
+                ('map', models.OneToOneField(related_name='signature', primary_key=True, serialize=False, to='maps.Map')),
+                ('minhash', models.TextField()),
+                ('pdf_name', models.CharField(max_length=100, blank=True)),
+                ('pdf_sha1', models.CharField(db_index=True, max_length=40, blank=True)),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AddField(
+            model_name='mapband',
+            name='map',
+            field=models.ForeignKey(related_name='lsh_bands', to='maps.Map'),
+            preserve_default=True,
+        ),
+        ScheduleBackfill('map-signatures'),
+    ]
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import json
+import re
+
+from django.db import models, migrations, OperationalError
+from django.utils import six
+import maps.fields
+
+# Keep in step with maps.metadata.INDEXED_KEYS.
+INDEXED_KEYS = ('sensor', 'resolution', 'provider')
+
+HSTORE_PAIR = re.compile(
+    r'"((?:[^"\\]|\\.)*)"\s*=>\s*(NULL|"((?:[^"\\]|\\.)*)")'
+)
+NUMBER = re.compile(r'^-?(0|[1-9][0-9]*)(\.[0-9]+)?([eE][-+]?[0-9]+)?$')
+
+
+def loose(value):
+    """hstore only holds strings; type them like hstore_to_json_loose."""
+    if not isinstance(value, six.string_types):
+        return value
+    if NUMBER.match(value):
+        return float(value) if value.strip('-0123456789') else int(value)
+    return {'t': True, 'f': False}.get(value, value)
+
+
+def parse_hstore(raw):
+    if not raw:
+        return {}
+    if isinstance(raw, dict):
+        return raw
+    try:
+        value = json.loads(raw)
+        if isinstance(value, dict):
+            return value
+    except ValueError:
+        pass
+    unescape = lambda s: re.sub(r'\\(.)', r'\1', s)
+    return dict(
+        (unescape(m.group(1)), None if m.group(2) == 'NULL' else
+         unescape(m.group(3)))
+        for m in HSTORE_PAIR.finditer(raw)
+    )
+
+
+def copy_hstore(apps, schema_editor):
+    connection = schema_editor.connection
+    cursor = connection.cursor()
+    if connection.vendor == 'postgresql':
+        cursor.execute(
+            'UPDATE maps_datasource SET meta_json = hstore_to_json_loose(meta)::jsonb '
+            'WHERE meta IS NOT NULL'
+        )
+        return
+    cursor.execute('SELECT id, meta FROM maps_datasource')
+    for pk, raw in cursor.fetchall():
+        cursor.execute(
+            'UPDATE maps_datasource SET meta_json = %s WHERE id = %s',
+            [json.dumps(dict(
+                (k, loose(v)) for k, v in parse_hstore(raw).items()
+            ), sort_keys=True), pk]
+        )
+
+
+def copy_back(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'postgresql':
+        connection.cursor().execute(
+            'UPDATE maps_datasource SET meta = hstore(ARRAY(SELECT '
+            'ARRAY[key, value] FROM jsonb_each_text(meta_json)))'
+        )
+
+
+def create_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(
+            'CREATE INDEX maps_datasource_meta_gin ON maps_datasource '
+            'USING gin (meta)'
+        )
+    elif vendor == 'sqlite':
+        for key in INDEXED_KEYS:
+            try:
+                schema_editor.execute(
+                    "CREATE INDEX maps_datasource_meta_{0} ON maps_datasource "
+                    "(json_extract(meta, '$.{0}'))".format(key)
+                )
+            except OperationalError:
+                # SQLite before 3.9 or without JSON functions.
+                return
+
+
+def drop_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS maps_datasource_meta_gin')
+    elif vendor == 'sqlite':
+        for key in INDEXED_KEYS:
+            schema_editor.execute(
+                'DROP INDEX IF EXISTS maps_datasource_meta_{0}'.format(key)
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('maps', '0011_map_signatures'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='datasource',
+            name='meta_json',
+            field=maps.fields.JSONDictField(default=dict, blank=True),
+            preserve_default=True,
+        ),
+        migrations.RunPython(copy_hstore, copy_back),
+        migrations.RemoveField(
+            model_name='datasource',
+            name='meta',
+        ),
+        migrations.RenameField(
+            model_name='datasource',
+            old_name='meta_json',
+            new_name='meta',
+        ),
+        migrations.AlterField(
+            model_name='datasource',
+            name='meta',
+            field=maps.fields.JSONDictField(default=dict, help_text=b'Further details, such as sensor, resolution or provider.', blank=True),
+            preserve_default=True,
+        ),
+        migrations.RunPython(create_indexes, drop_indexes),
+        migrations.CreateModel(
+            name='DataSourceMeta',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('key', models.CharField(max_length=50)),
+                ('text', models.CharField(max_length=255, null=True)),
+                ('number', models.FloatField(null=True)),
+                ('source', models.ForeignKey(related_name='promoted_meta', to='maps.DataSource')),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterIndexTogether(
+            name='datasourcemeta',
+            index_together=set([('key', 'text'), ('key', 'number')]),
+        ),
+    ]
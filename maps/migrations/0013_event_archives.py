@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('maps', '0012_datasource_json_meta'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedMap',
+            fields=[
+                ('id', models.IntegerField(serialize=False, primary_key=True)),
+                ('title', models.CharField(max_length=300)),
+                ('reviewer_name', models.CharField(max_length=300)),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.CreateModel(
+            name='EventArchive',
+            fields=[
+                ('event', models.OneToOneField(related_name='archive', primary_key=True, serialize=False, to='maps.Event')),
+                ('file', models.CharField(max_length=255)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('maps', models.PositiveIntegerField()),
+                ('size', models.PositiveIntegerField(help_text=b'Size of the archive file, in bytes.')),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AddField(
+            model_name='archivedmap',
+            name='event',
+            field=models.ForeignKey(related_name='archived_maps', to='maps.Event'),
+            preserve_default=True,
+        ),
+    ]
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations, OperationalError
+
+# Keep in step with maps.metadata.INDEXED_KEYS.
+INDEXED_KEYS = ('sensor', 'resolution', 'provider')
+
+
+def recreate_meta_indexes(apps, schema_editor):
+    # SQLite adds or drops a column by rebuilding the table, which loses
+    # the expression indexes created by migration 0012.
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for key in INDEXED_KEYS:
+        try:
+            schema_editor.execute(
+                "CREATE INDEX IF NOT EXISTS maps_datasource_meta_{0} "
+                "ON maps_datasource (json_extract(meta, '$.{0}'))".format(key)
+            )
+        except OperationalError:
+            return
+
+
+def noop(apps, schema_editor):
+    pass
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('maps', '0013_event_archives'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='actor',
+            name='is_active',
+            field=models.BooleanField(default=True, help_text=b'Cleared when the entry leaves its reference catalogue; see maps.reference.'),
+            preserve_default=True,
+        ),
+        migrations.RunPython(noop, recreate_meta_indexes),
+        migrations.AddField(
+            model_name='datasource',
+            name='is_active',
+            field=models.BooleanField(default=True, help_text=b'Cleared when the entry leaves its reference catalogue; see maps.reference.'),
+            preserve_default=True,
+        ),
+        migrations.RunPython(recreate_meta_indexes, noop),
+        migrations.AddField(
+            model_name='event',
+            name='is_active',
+            field=models.BooleanField(default=True, help_text=b'Cleared when the entry leaves its reference catalogue; see maps.reference.'),
+            preserve_default=True,
+        ),
+    ]
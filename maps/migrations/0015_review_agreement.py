@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+from maps.backfill import ScheduleBackfill
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('maps', '0014_reference_is_active'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FieldAgreement',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('field', models.CharField(unique=True, max_length=100)),
+                ('subjects', models.PositiveIntegerField(default=0, help_text=b'Subjects reviewed by two reviewers or more.')),
+                ('pairs', models.PositiveIntegerField(default=0)),
+                ('agreements', models.PositiveIntegerField(default=0)),
+                ('subject_agreement', models.FloatField(default=0, help_text=b'Sum over subjects of their share of agreeing pairs.')),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.CreateModel(
+            name='FieldCategory',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('field', models.CharField(max_length=100)),
+                ('code', models.CharField(max_length=80)),
+                ('ratings', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.CreateModel(
+            name='ReviewCoding',
+            fields=[
+                ('review', models.OneToOneField(related_name='coding', primary_key=True, serialize=False, to='maps.Map')),
+                ('subject', models.CharField(max_length=40, db_index=True)),
+                ('reviewer_name', models.CharField(max_length=300, db_index=True)),
+                ('codes', models.TextField(help_text=b'JSON object of field name to code.')),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.CreateModel(
+            name='ReviewerAgreement',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('reviewer_name', models.CharField(max_length=300)),
+                ('field', models.CharField(max_length=100)),
+                ('pairs', models.PositiveIntegerField(default=0)),
+                ('agreements', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterUniqueTogether(
+            name='revieweragreement',
+            unique_together=set([('reviewer_name', 'field')]),
+        ),
+        migrations.AlterUniqueTogether(
+            name='fieldcategory',
+            unique_together=set([('field', 'code')]),
+        ),
+        ScheduleBackfill('review-codings'),
+    ]
@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('maps', '0015_review_agreement'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='change',
+            index_together=set([('model', 'object_id')]),
+        ),
+    ]
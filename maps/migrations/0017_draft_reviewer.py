@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('maps', '0016_change_object_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reviewdraft',
+            name='reviewer',
+            field=models.CharField(default='', help_text=b"Reviewer id kept in the session of the draft's author.", max_length=40),
+            preserve_default=False,
+        ),
+        migrations.AlterField(
+            model_name='reviewdraft',
+            name='key',
+            field=models.CharField(max_length=40),
+            preserve_default=True,
+        ),
+        migrations.AlterUniqueTogether(
+            name='reviewdraft',
+            unique_together=set([('reviewer', 'key')]),
+        ),
+    ]
@@ -1,9 +1,17 @@
-from django.db import models
+import json
+import time
+from contextlib import contextmanager
+
+from django.db import connections, models, router, transaction
+from django.db.models.signals import post_delete, pre_save
+from django.dispatch import receiver
+from django.core.exceptions import ValidationError
 from django.core.validators import RegexValidator
-from django_hstore import hstore
 
 from multiselectfield import MultiSelectField
 
+from .fields import JSONDictField
+
 
 def make_choices(*choices):
     """Just dupes choices name/value"""
@@ -20,10 +28,153 @@ DATA_TYPES = make_choices(
 )
 
 
-class Actor(models.Model):
+#: PostgreSQL advisory lock key serialising appends to the change feed.
+FEED_LOCK = 0x6d617073
+
+
+class ChangeManager(models.Manager):
+    def append(self, changes):
+        """Inserts feed entries, in order, in the current transaction.
+
+        On PostgreSQL, sequence numbers are handed out when rows are
+        inserted but become visible when their transaction commits, so a
+        reader could see N + 1 before N and skip N for good. Appends
+        therefore queue on a transaction-level advisory lock, making
+        sequence numbers visible in order. SQLite has a single writer
+        anyway. The lock is held until commit, so longer transactions
+        hold back their appends with :meth:`deferred_appends`.
+
+        """
+        connection = connections[self.db]
+        pending = getattr(connection, 'maps_feed_pending', None)
+        if pending is not None:
+            pending.extend(changes)
+            return
+        with transaction.atomic(using=self.db, savepoint=False):
+            if connection.vendor == 'postgresql':
+                connection.cursor().execute(
+                    'SELECT pg_advisory_xact_lock(%s)', [FEED_LOCK]
+                )
+            self.bulk_create(changes)
+
+    @contextmanager
+    def deferred_appends(self, using=None):
+        """Holds back the appends made in the block until it ends.
+
+        They are then inserted together, so the feed lock is only held
+        from the end of the block to commit; use it as the innermost
+        block of a transaction. Appends made in a savepoint rolled back
+        within the block would still be written.
+
+        """
+        using = using or router.db_for_write(Change)
+        connection = connections[using]
+        if getattr(connection, 'maps_feed_pending', None) is not None:
+            yield
+            return
+        connection.maps_feed_pending = pending = []
+        try:
+            yield
+        finally:
+            connection.maps_feed_pending = None
+        if pending:
+            self.db_manager(using).append(pending)
+
+    def record(self, instance, action):
+        """Appends a feed entry for ``instance``."""
+        self.append([Change(
+            model=instance._meta.model_name,
+            object_id=instance.pk,
+            action=action,
+            data=json.dumps(instance.change_data()),
+        )])
+
+    def record_many(self, model, object_ids, action, using=None):
+        """Appends feed entries for rows written in bulk."""
+        self.db_manager(using).append([
+            Change(model=model._meta.model_name, object_id=pk, action=action)
+            for pk in object_ids
+        ])
+
+    def after(self, cursor):
+        """Entries with a sequence number greater than ``cursor``."""
+        return self.filter(pk__gt=cursor).order_by('pk')
+
+    def wait_after(self, cursor, limit, timeout, interval=1.0):
+        """Up to ``limit`` entries after ``cursor``.
+
+        Polls every ``interval`` seconds, for at most ``timeout`` seconds,
+        until at least one entry is available.
+
+        """
+        deadline = time.time() + timeout
+        while True:
+            changes = list(self.after(cursor)[:limit])
+            if changes or time.time() + interval > deadline:
+                return changes
+            time.sleep(interval)
+
+
+class Change(models.Model):
+    """An entry in the change feed; the primary key is its sequence number.
+
+    Entries are written in the same transaction as the change they describe
+    (see :class:`ChangeFeedMixin`), so consumers that remember the last
+    sequence number they processed only ever need to read what follows it.
+    """
+    SAVE = 'save'
+    DELETE = 'delete'
+
+    model = models.CharField(max_length=50)
+    object_id = models.PositiveIntegerField()
+    action = models.CharField(
+        max_length=10,
+        choices=((SAVE, 'Saved'), (DELETE, 'Deleted')),
+    )
+    created = models.DateTimeField(auto_now_add=True)
+    data = models.TextField(default='{}')
+
+    objects = ChangeManager()
+
+    class Meta:
+        index_together = [('model', 'object_id')]
+
+    def as_dict(self):
+        return {
+            'seq': self.pk,
+            'model': self.model,
+            'id': self.object_id,
+            'action': self.action,
+            'created': self.created.isoformat(),
+            'data': json.loads(self.data),
+        }
+
+
+class ChangeFeedMixin(object):
+    """Records every save and delete of a model in the change feed."""
+
+    def change_data(self):
+        """Small JSON-serialisable dict stored with each feed entry."""
+        return {}
+
+    def save(self, *args, **kwargs):
+        using = kwargs.get('using') or router.db_for_write(
+            self.__class__, instance=self
+        )
+        with transaction.atomic(using=using, savepoint=False):
+            super(ChangeFeedMixin, self).save(*args, **kwargs)
+            Change.objects.db_manager(using).record(self, Change.SAVE)
+
+
+class Actor(ChangeFeedMixin, models.Model):
     """An actor in the scene."""
     is_cluster = models.BooleanField(default=False)
     name = models.CharField(max_length=200)
+    is_active = models.BooleanField(
+        default=True,
+        help_text="Cleared when the entry leaves its reference catalogue; "
+                  "see maps.reference."
+    )
 
     def __unicode__(self):
         if self.is_cluster:
@@ -31,7 +182,7 @@ class Actor(models.Model):
         return self.name
 
 
-class Event(models.Model):
+class Event(ChangeFeedMixin, models.Model):
     """Represents an event (disaster)."""
     EVENT_OPTIONS = (
         ("CW", "Cold Wave"),
@@ -73,9 +224,29 @@ class Event(models.Model):
             message="That doesn't look like a valid GLIDE number."
         )]
     )
+    is_active = models.BooleanField(
+        default=True,
+        help_text="Cleared when the entry leaves its reference catalogue; "
+                  "see maps.reference."
+    )
+
+
+class MetadataQuerySet(models.QuerySet):
+    """Filters on the keys of a ``meta`` dict; see :mod:`maps.metadata`."""
+
+    def has_meta(self, key):
+        from .metadata import has_key
+        return has_key(self, key)
+
+    def meta(self, **lookups):
+        """``meta(sensor='MODIS', resolution__lte=250)``; the lookups
+        are ``exact`` (the default), ``gt``, ``gte``, ``lt`` and ``lte``.
+        """
+        from .metadata import filter_meta
+        return filter_meta(self, lookups)
 
 
-class DataSource(models.Model):
+class DataSource(ChangeFeedMixin, models.Model):
     """Satellite name and sensor type."""
     source_type = models.CharField(
         choices=(
@@ -96,13 +267,60 @@ class DataSource(models.Model):
         ), max_length=20,
     )
     name = models.CharField(max_length=255)
-    meta = hstore.DictionaryField()
+    meta = JSONDictField(
+        help_text="Further details, such as sensor, resolution or provider."
+    )
+    is_active = models.BooleanField(
+        default=True,
+        help_text="Cleared when the entry leaves its reference catalogue; "
+                  "see maps.reference."
+    )
+
+    objects = MetadataQuerySet.as_manager()
+
+    def __unicode__(self):
+        if self.meta.get('sensor'):
+            return "{0} - {1}".format(self.name, self.meta['sensor'])
+        return self.name
+
+
+class DataSourceMeta(models.Model):
+    """Promoted copy of one ``DataSource.meta`` entry, for indexed lookups.
+
+    Only kept for the keys in ``settings.MAPS_PROMOTED_META_KEYS``.
+    """
+    source = models.ForeignKey(DataSource, related_name='promoted_meta')
+    key = models.CharField(max_length=50)
+    text = models.CharField(max_length=255, null=True)
+    number = models.FloatField(null=True)
+
+    class Meta:
+        index_together = [('key', 'text'), ('key', 'number')]
+
+
+class AdminArea(ChangeFeedMixin, models.Model):
+    """Gazetteer entry: an administrative area and its bounding box."""
+    name = models.CharField(max_length=200)
+    code = models.CharField(
+        max_length=50, unique=True,
+        help_text="Place code (e.g. P-code) identifying the area."
+    )
+    level = models.PositiveSmallIntegerField(
+        help_text="Administrative level, 0 being the country."
+    )
+    parent = models.ForeignKey(
+        'self', related_name='children', null=True, blank=True,
+    )
+    west = models.FloatField()
+    south = models.FloatField()
+    east = models.FloatField()
+    north = models.FloatField()
 
     def __unicode__(self):
-        return "{0} - {1}".format(self.name, self.sensor_type)
+        return self.name
 
 
-class StatisticalOrIndicatorData(models.Model):
+class StatisticalOrIndicatorData(ChangeFeedMixin, models.Model):
     data_type = models.CharField(
         max_length=255,
         null=True, blank=True,
@@ -128,7 +346,7 @@ class StatisticalOrIndicatorData(models.Model):
     )
 
 
-class Map(models.Model):
+class Map(ChangeFeedMixin, models.Model):
     """Storage of a Map object."""
     reviewer_name = models.CharField(max_length=300)
     file_name = models.CharField(
@@ -181,6 +399,24 @@ class Map(models.Model):
             'Region 8',
         ),
     )
+    # Bounding box of the mapped area in WGS84 degrees, indexed by
+    # maps.spatial for "maps covering here" queries.
+    extent_west = models.FloatField(
+        null=True, blank=True,
+        help_text="Westernmost longitude shown on the map."
+    )
+    extent_south = models.FloatField(
+        null=True, blank=True,
+        help_text="Southernmost latitude shown on the map."
+    )
+    extent_east = models.FloatField(
+        null=True, blank=True,
+        help_text="Easternmost longitude shown on the map."
+    )
+    extent_north = models.FloatField(
+        null=True, blank=True,
+        help_text="Northernmost latitude shown on the map."
+    )
 
     authors_or_producers = models.ManyToManyField(
         Actor,
@@ -509,3 +745,221 @@ class Map(models.Model):
 #        AdditionalDataset
 #    )
     indirect_datasets = models.TextField(blank=True, null=True)
+
+    # Bookkeeping
+    revision = models.PositiveIntegerField(
+        default=0, editable=False,
+        help_text="Number of the latest MapRevision of this map."
+    )
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def change_data(self):
+        data = {'event': self.event_id, 'revision': self.revision}
+        # The event a map moved from needs its report rebuilt too.
+        previous = getattr(self, '_stored_event_id', None)
+        if previous is not None and previous != self.event_id:
+            data['previous_event'] = previous
+        return data
+
+    def clean(self):
+        bbox = (
+            self.extent_west, self.extent_south,
+            self.extent_east, self.extent_north,
+        )
+        if all(v is None for v in bbox):
+            return
+        if any(v is None for v in bbox):
+            raise ValidationError(
+                "Give all four extent coordinates, or none of them."
+            )
+        west, south, east, north = bbox
+        if not (-180 <= west <= east <= 180 and -90 <= south <= north <= 90):
+            raise ValidationError(
+                "The extent must run west to east and south to north, "
+                "within -180..180 and -90..90 degrees."
+            )
+
+
+class MapRevision(models.Model):
+    """One edit of a Map; see :mod:`maps.revisions`.
+
+    Deltas hold only the changed fields and many-to-many membership
+    changes; checkpoints hold full values. The log outlives deleted maps.
+    """
+    map = models.ForeignKey(
+        Map,
+        related_name='revisions',
+        db_constraint=False, on_delete=models.DO_NOTHING,
+    )
+    number = models.PositiveIntegerField()
+    created = models.DateTimeField(auto_now_add=True)
+    is_checkpoint = models.BooleanField(default=False)
+    field_data = models.TextField()
+    m2m_data = models.TextField()
+
+    class Meta:
+        unique_together = [('map', 'number')]
+
+
+class MapSignature(models.Model):
+    """Near-duplicate fingerprint of a Map; see :mod:`maps.duplicates`."""
+    map = models.OneToOneField(
+        Map, primary_key=True, related_name='signature',
+    )
+    minhash = models.TextField()
+    pdf_name = models.CharField(max_length=100, blank=True)
+    pdf_sha1 = models.CharField(max_length=40, blank=True, db_index=True)
+
+
+class MapBand(models.Model):
+    """One LSH band bucket of a :class:`MapSignature`.
+
+    ``bucket`` hashes the band number together with its MinHash values, so
+    maps sharing any bucket agree on a whole band.
+    """
+    map = models.ForeignKey(Map, related_name='lsh_bands')
+    bucket = models.BigIntegerField(db_index=True)
+
+
+class ReviewDraft(models.Model):
+    """A review in progress, autosaved from the browser field by field.
+
+    Autosave requests only append :class:`DraftChange` rows; these are
+    folded into ``data`` (a JSON object of field name to value) in batches
+    by :func:`maps.drafts.coalesce`. Drafts belong to the reviewer whose
+    browser session created them, and are looked up by reviewer and key.
+    """
+    reviewer = models.CharField(
+        max_length=40,
+        help_text="Reviewer id kept in the session of the draft's author."
+    )
+    key = models.CharField(max_length=40)
+    reviewer_name = models.CharField(max_length=300, blank=True)
+    data = models.TextField(default='{}')
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+    review = models.ForeignKey(
+        Map,
+        related_name='drafts',
+        null=True, blank=True,
+        help_text="The review this draft was promoted to, once submitted."
+    )
+
+    class Meta:
+        unique_together = [('reviewer', 'key')]
+        index_together = [('reviewer_name', 'updated')]
+
+    def __unicode__(self):
+        return u"Draft {0} by {1}".format(self.key, self.reviewer_name)
+
+
+class DraftChange(models.Model):
+    """A single autosaved field value, pending coalescing into its draft."""
+    draft = models.ForeignKey(ReviewDraft, related_name='changes')
+    field = models.CharField(max_length=100)
+    value = models.TextField(blank=True)
+
+
+class EventArchive(models.Model):
+    """An Event whose reviews were moved to cold storage; see
+    :mod:`maps.archive`."""
+    event = models.OneToOneField(
+        Event, primary_key=True, related_name='archive',
+    )
+    file = models.CharField(max_length=255)
+    created = models.DateTimeField(auto_now_add=True)
+    maps = models.PositiveIntegerField()
+    size = models.PositiveIntegerField(
+        help_text="Size of the archive file, in bytes."
+    )
+
+
+class ArchivedMap(models.Model):
+    """Stub left in place of an archived Map, under the same id."""
+    id = models.IntegerField(primary_key=True)
+    event = models.ForeignKey(Event, related_name='archived_maps')
+    title = models.CharField(max_length=300)
+    reviewer_name = models.CharField(max_length=300)
+
+
+class ReviewCoding(models.Model):
+    """Compact per-field encoding of a review, for agreement scoring.
+
+    Reviews with the same ``subject`` are reviews of the same underlying
+    map; see :mod:`maps.agreement`.
+    """
+    review = models.OneToOneField(
+        Map, primary_key=True, related_name='coding',
+    )
+    subject = models.CharField(max_length=40, db_index=True)
+    reviewer_name = models.CharField(max_length=300, db_index=True)
+    codes = models.TextField(help_text="JSON object of field name to code.")
+
+
+class FieldAgreement(models.Model):
+    """Running agreement totals of one review field over all subjects."""
+    field = models.CharField(max_length=100, unique=True)
+    subjects = models.PositiveIntegerField(
+        default=0, help_text="Subjects reviewed by two reviewers or more."
+    )
+    pairs = models.PositiveIntegerField(default=0)
+    agreements = models.PositiveIntegerField(default=0)
+    subject_agreement = models.FloatField(
+        default=0,
+        help_text="Sum over subjects of their share of agreeing pairs."
+    )
+
+
+class FieldCategory(models.Model):
+    """How often a field was coded ``code``, in subjects with two reviews
+    or more; the category distribution behind chance agreement."""
+    field = models.CharField(max_length=100)
+    code = models.CharField(max_length=80)
+    ratings = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = [('field', 'code')]
+
+
+class ReviewerAgreement(models.Model):
+    """Running totals of a reviewer's agreement with their peers."""
+    reviewer_name = models.CharField(max_length=300)
+    field = models.CharField(max_length=100)
+    pairs = models.PositiveIntegerField(default=0)
+    agreements = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = [('reviewer_name', 'field')]
+
+
+@receiver(post_delete)
+def record_delete(sender, instance, using, **kwargs):
+    # Deletes (including cascades and queryset deletes) run inside the
+    # collector's transaction, and so does this receiver.
+    if isinstance(instance, ChangeFeedMixin):
+        Change.objects.db_manager(using).record(instance, Change.DELETE)
+
+
+@receiver(pre_save, sender=Map)
+def remember_event(sender, instance, raw, using, **kwargs):
+    """Keeps the stored event of a map about to be saved, for its feed
+    entry."""
+    if raw or instance.pk is None:
+        instance._stored_event_id = None
+        return
+    instance._stored_event_id = Map.objects.db_manager(using).filter(
+        pk=instance.pk
+    ).values_list('event', flat=True).first()
+
+
+class BackfillProgress(models.Model):
+    """Checkpoint of a resumable backfill; see :mod:`maps.backfill`."""
+    name = models.CharField(max_length=100, unique=True)
+    last_pk = models.IntegerField(null=True, blank=True)
+    rows_done = models.PositiveIntegerField(default=0)
+    scheduled = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+    finished = models.DateTimeField(null=True, blank=True)
+
+    def __unicode__(self):
+        return self.name
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""Single-transaction save path for map reviews.
+
+``ModelForm.save()`` inserts the Map row and then runs a clear-and-add cycle
+for every many-to-many relation. :func:`save_review` writes the Map, any
+catalogue rows created inline through formsets and all through-table rows
+inside one atomic block, with one bulk insert (and at most one delete) per
+relation. Every save that changes something appends a revision to the
+log kept by :mod:`maps.revisions` and rescores the review's agreement with
+other reviews of the same map (:mod:`maps.agreement`).
+"""
+from django.db import OperationalError, transaction
+
+from . import agreement, revisions, sqlite
+from .models import Change, Map
+
+
+def m2m_field_names():
+    """Names of the many-to-many relations on Map."""
+    return [f.name for f in Map._meta.many_to_many]
+
+
+def sync_m2m(instance, field_name, wanted, created=False, replace=True):
+    """Makes the through rows of a relation match a set of target pks.
+
+    :param instance: saved Map instance.
+    :param str field_name: name of the many-to-many field on Map.
+    :param set wanted: primary keys of the related objects to link.
+    :param bool created: skips the lookup of existing rows for new maps.
+    :param bool replace: also removes rows not present in ``wanted``.
+    :rtype: tuple
+    :return: (added, removed) sets of related primary keys.
+
+    """
+    field = instance._meta.get_field(field_name)
+    through = field.rel.through
+    source = through._meta.get_field(field.m2m_field_name())
+    target = through._meta.get_field(field.m2m_reverse_field_name())
+
+    wanted = set(wanted)
+    current = set()
+    if not created:
+        current = set(
+            through.objects.filter(
+                **{source.attname: instance.pk}
+            ).values_list(target.attname, flat=True)
+        )
+
+    added = wanted - current
+    removed = current - wanted if replace else set()
+
+    if removed:
+        through.objects.filter(**{
+            source.attname: instance.pk,
+            target.attname + '__in': removed,
+        }).delete()
+    if added:
+        through.objects.bulk_create([
+            through(**{source.attname: instance.pk, target.attname: pk})
+            for pk in added
+        ])
+    return added, removed
+
+
+@sqlite.write_transaction
+def save_review(form, formsets=()):
+    """Saves a validated review form and its inline-creation formsets.
+
+    On SQLite, the whole save is retried while the database is locked.
+
+    :param form: a valid ModelForm for Map.
+    :param formsets: valid formsets providing ``save_for_review``.
+    :rtype: Map
+    :return: the saved Map instance.
+
+    """
+    pk = form.instance.pk
+    try:
+        return _save(form, formsets)
+    except OperationalError:
+        # Rolled back: a retry has to insert a new review again.
+        form.instance.pk = pk
+        raise
+
+
+def _save(form, formsets):
+    instance = form.save(commit=False)
+    # Feed entries go in last, so the feed lock is held briefly.
+    with transaction.atomic(), Change.objects.deferred_appends(), \
+            revisions.recorded_by_caller(instance):
+        created = instance.pk is None
+        if not created:
+            revision, before = revisions.stored_snapshot(instance.pk)
+
+        linked = dict((name, set()) for name in m2m_field_names())
+        for formset in formsets:
+            formset.save_for_review(instance, linked)
+
+        if created:
+            instance.revision = 1
+            instance.save()
+            changes = None
+
+        m2m_changes = {}
+        for name, extra in linked.items():
+            if name in form.cleaned_data:
+                wanted = set(o.pk for o in form.cleaned_data[name] or ())
+                delta = sync_m2m(
+                    instance, name, wanted | extra, created=created
+                )
+            elif extra:
+                delta = sync_m2m(
+                    instance, name, extra, created=created, replace=False
+                )
+            else:
+                continue
+            if any(delta):
+                m2m_changes[name] = delta
+
+        if not created:
+            changes = revisions.field_changes(
+                before, revisions.snapshot(instance)
+            )
+            if not (changes or m2m_changes):
+                return instance
+            instance.revision = revision + 1
+            instance.save()
+
+        revisions.record(instance, changes, m2m_changes)
+        agreement.score(instance)
+    return instance
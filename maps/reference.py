@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+"""Synchronisation of reference data with catalogue files.
+
+Actors, clusters, GLIDE events and data sources are maintained in
+catalogues kept outside the application. :func:`sync` compares a
+catalogue with the database in one pass, matching rows by natural key
+(name, or ``glide_number`` for events), and writes only the difference in
+bulk: new entries are inserted, changed ones updated in place, so primary
+keys referenced by reviews never change, and entries no longer listed are
+soft-deleted by clearing ``is_active``. Syncing the same file twice
+writes nothing the second time.
+
+Catalogue files are JSON (a list of objects, or a fixture such as
+``maps/fixtures/actors.json``) or CSV with a header row; see
+``manage.py sync_reference``.
+"""
+import csv
+import io
+import json
+import os
+
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import router, transaction
+from django.db.models import Max
+from django.utils import six
+
+from . import metadata
+from .models import Actor, Change, DataSource, Event
+from .sqlite import chunks
+
+
+class Catalogue(object):
+    """A kind of reference data and how to match it.
+
+    :param model: model synced.
+    :param str key: natural key field.
+    :param tuple fields: fields taken from the catalogue, key included.
+    :param dict scope: field values shared by all rows of the catalogue;
+        only database rows within this scope are compared and retired.
+
+    """
+
+    def __init__(self, model, key, fields, scope=None):
+        self.model = model
+        self.key = key
+        self.fields = fields
+        self.scope = scope or {}
+
+    def clean(self, row):
+        """Field values of a catalogue row; None to skip the row."""
+        for name, value in self.scope.items():
+            if name in row and _boolean(row[name]) != value:
+                return None
+        if self.model is Event and not row.get('event_type'):
+            # The GLIDE number starts with the event type.
+            row = dict(row, event_type=(row.get('glide_number') or '')[:2])
+        ret = {}
+        for name in self.fields:
+            field = self.model._meta.get_field(name)
+            value = row.get(name)
+            if value is None or value == '':
+                value = field.get_default()
+            ret[name] = field.clean(value, None)
+        return ret
+
+
+CATALOGUES = {
+    'actors': Catalogue(Actor, 'name', ('name',), {'is_cluster': False}),
+    'clusters': Catalogue(Actor, 'name', ('name',), {'is_cluster': True}),
+    'events': Catalogue(
+        Event, 'glide_number', ('glide_number', 'event_type', 'start_date')
+    ),
+    'datasources': Catalogue(
+        DataSource, 'name', ('name', 'source_type', 'meta')
+    ),
+}
+
+
+def _boolean(value):
+    if isinstance(value, bool):
+        return value
+    value = six.text_type(value).strip().lower()
+    return value in ('1', 't', 'true', 'y', 'yes')
+
+
+def read(path):
+    """Rows of a JSON or CSV catalogue file, as dicts."""
+    if os.path.splitext(path)[1].lower() == '.csv':
+        with open(path, 'rb') as f:
+            return [
+                dict((k, v.decode('utf-8')) for k, v in row.items())
+                for row in csv.DictReader(f)
+            ]
+    with io.open(path, encoding='utf-8') as f:
+        rows = json.load(f)
+    if not isinstance(rows, list):
+        raise ValueError("{0}: expected a list of objects".format(path))
+    # Fixture entries keep their values under "fields".
+    return [row.get('fields', row) for row in rows]
+
+
+def sync(catalogue, rows, retire=True, dry_run=False, using=None):
+    """Makes the database match a catalogue.
+
+    :param catalogue: a :class:`Catalogue`, or its name in
+        :data:`CATALOGUES`.
+    :param rows: catalogue entries, as dicts of field values.
+    :param bool retire: soft-delete the rows missing from the catalogue.
+    :param bool dry_run: only count what would change.
+    :return: counts of ``inserted``, ``updated``, ``retired`` and
+        ``unchanged`` rows.
+    :raises ValueError: on invalid or duplicate entries.
+
+    """
+    if not isinstance(catalogue, Catalogue):
+        catalogue = CATALOGUES[catalogue]
+    model, key = catalogue.model, catalogue.key
+    using = using or router.db_for_write(model)
+    manager = model._default_manager.db_manager(using)
+
+    entries, errors = {}, []
+    for number, row in enumerate(rows, 1):
+        try:
+            cleaned = catalogue.clean(row)
+        except ValidationError as e:
+            errors.append("entry {0}: {1}".format(
+                number, '; '.join(e.messages)
+            ))
+            continue
+        if cleaned is None:
+            continue
+        if cleaned[key] in entries:
+            errors.append("entry {0}: duplicate {1} {2!r}".format(
+                number, key, cleaned[key]
+            ))
+        entries[cleaned[key]] = cleaned
+    if errors:
+        raise ValueError('\n'.join(errors[:20]))
+
+    with transaction.atomic(using=using):
+        # Of rows sharing a key, the oldest is the catalogue's entry.
+        existing, spare = {}, []
+        for obj in manager.filter(**catalogue.scope).order_by('pk'):
+            if getattr(obj, key) in existing:
+                spare.append(obj)
+            else:
+                existing[getattr(obj, key)] = obj
+
+        new, changed = [], []
+        for value, cleaned in entries.items():
+            obj = existing.pop(value, None)
+            if obj is None:
+                new.append(model(**dict(catalogue.scope, **cleaned)))
+                continue
+            diff = dict(
+                (name, v) for name, v in cleaned.items()
+                if getattr(obj, name) != v
+            )
+            if not obj.is_active:
+                diff['is_active'] = True
+            if diff:
+                changed.append((obj.pk, diff))
+        retired = [
+            obj.pk for obj in list(existing.values()) + spare
+            if retire and obj.is_active
+        ]
+        counts = {
+            'inserted': len(new),
+            'updated': len(changed),
+            'retired': len(retired),
+            'unchanged': len(entries) - len(new) - len(changed),
+        }
+        if dry_run:
+            return counts
+
+        last = manager.aggregate(last=Max('pk'))['last'] or 0
+        manager.bulk_create(new)
+        # Rows needing the same change share one update per chunk.
+        groups = {}
+        for pk, diff in changed:
+            group = json.dumps(diff, sort_keys=True, cls=DjangoJSONEncoder)
+            groups.setdefault(group, (diff, []))[1].append(pk)
+        for diff, pks in groups.values():
+            for chunk in chunks(pks):
+                manager.filter(pk__in=chunk).update(**diff)
+        for chunk in chunks(retired):
+            manager.filter(pk__in=chunk).update(is_active=False)
+
+        # Bulk writes bypass save(), so record them in the change feed here.
+        saved = list(manager.filter(
+            pk__gt=last, **catalogue.scope
+        ).values_list('pk', flat=True)) + [pk for pk, _ in changed]
+        Change.objects.record_many(model, saved + retired, Change.SAVE, using)
+        if model is DataSource:
+            for chunk in chunks(saved):
+                metadata.sync_promoted(
+                    list(manager.filter(pk__in=chunk)), using
+                )
+    return counts
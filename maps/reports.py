@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*-
+"""Per-event review reports, prebuilt on disk.
+
+Each Event's report (maps per day after onset, top producers and donors,
+data layers used and data-source freshness) is computed from aggregate
+queries and written as HTML and CSV under ``settings.MAPS_REPORTS_ROOT``,
+so viewing one only reads a file.
+
+:func:`refresh` follows the change feed from the position of the last
+build and rebuilds only the reports of events a change touched: the
+event of a saved or deleted Map (and, if it moved, the event its feed
+entry says it left), an edited Event, and the events whose maps cite an
+edited Actor or DataSource. Rebuilds therefore scale with churn, not with
+the number of events. Run it from a single process, e.g. ``manage.py
+build_reports``.
+"""
+import csv
+import io
+import json
+import operator
+import os
+import re
+import tempfile
+
+from django.conf import settings
+from django.db.models import Count, Max, Q
+from django.http import Http404, HttpResponse
+from django.template.loader import render_to_string
+from django.utils import six, timezone
+from django.utils.six.moves import reduce
+from django.views.decorators.http import require_GET
+
+from .models import Actor, Change, DataSource, Event, EventArchive, Map
+
+FORMATS = {
+    'html': 'text/html; charset=utf-8',
+    'csv': 'text/csv; charset=utf-8',
+}
+
+#: How many producers and donors a report lists.
+TOP = 10
+
+
+def layer_fields():
+    return [
+        f for f in Map._meta.fields
+        if f.name.startswith('has_') and
+        f.get_internal_type() == 'BooleanField'
+    ]
+
+
+def source_fields():
+    return [
+        f for f in Map._meta.fields + Map._meta.many_to_many
+        if f.rel and f.rel.to is DataSource
+    ]
+
+
+def report_data(event):
+    """Aggregates of the maps of ``event``, as plain data."""
+    maps = Map.objects.filter(event=event)
+
+    per_day = list(maps.values_list('day_offset').annotate(
+        n=Count('id')
+    ).order_by('day_offset'))
+
+    def top(related_name):
+        return [
+            (six.text_type(actor), actor.n) for actor in Actor.objects.filter(
+                **{related_name + '__event': event}
+            ).annotate(n=Count(related_name)).order_by('-n', 'name')[:TOP]
+        ]
+
+    # One grouped query over all layer flags instead of one per layer.
+    flags = layer_fields()
+    layers = dict((f.name, 0) for f in flags)
+    for row in maps.values(*[f.name for f in flags]).annotate(n=Count('id')):
+        for f in flags:
+            if row[f.name]:
+                layers[f.name] += row['n']
+
+    sources = {}
+    for field in source_fields():
+        rows = maps.exclude(**{field.name: None}).values(
+            field.name
+        ).annotate(n=Count('id'), last=Max('production_date'))
+        for row in rows:
+            pk, n, last = row[field.name], row['n'], row['last']
+            uses, latest = sources.get(pk, (0, None))
+            if latest is None or (last is not None and last > latest):
+                latest = last
+            sources[pk] = (uses + n, latest)
+    names = DataSource.objects.in_bulk(list(sources))
+    freshness = sorted(
+        (six.text_type(names[pk]), n, last,
+         (last - event.start_date).days if last else None)
+        for pk, (n, last) in sources.items() if pk in names
+    )
+
+    return {
+        'event': event,
+        'total': maps.count(),
+        'per_day': per_day,
+        'producers': top('author_or_producer_of'),
+        'donors': top('donor_to'),
+        'layers': [(f.verbose_name, layers[f.name]) for f in flags],
+        'sources': freshness,
+        'built': timezone.now(),
+    }
+
+
+def render_csv(data):
+    out = io.BytesIO()
+    writer = csv.writer(out)
+    writer.writerow(['section', 'label', 'maps', 'detail'])
+    writer.writerow(['total', data['event'].glide_number, data['total'], ''])
+    for day, n in data['per_day']:
+        writer.writerow(['day_offset', day, n, ''])
+    for section in ('producers', 'donors', 'layers'):
+        for label, n in data[section]:
+            writer.writerow([section, label.encode('utf-8'), n, ''])
+    for name, n, last, days in data['sources']:
+        writer.writerow([
+            'source', name.encode('utf-8'), n,
+            '' if last is None else '{0} (day {1})'.format(last, days),
+        ])
+    return out.getvalue()
+
+
+def path(event_id, fmt):
+    return os.path.join(
+        settings.MAPS_REPORTS_ROOT, 'event-{0}.{1}'.format(event_id, fmt)
+    )
+
+
+def _write(filename, content):
+    """Replaces ``filename`` atomically, so readers never see half a file."""
+    handle, tmp = tempfile.mkstemp(dir=os.path.dirname(filename))
+    with os.fdopen(handle, 'wb') as f:
+        f.write(content)
+    os.chmod(tmp, 0o644)
+    os.rename(tmp, filename)
+
+
+def _manifest_path():
+    return os.path.join(settings.MAPS_REPORTS_ROOT, 'manifest.json')
+
+
+def load_manifest():
+    """{'cursor': last change applied}."""
+    try:
+        with open(_manifest_path()) as f:
+            return {'cursor': json.load(f)['cursor']}
+    except (IOError, ValueError, KeyError):
+        return {'cursor': 0}
+
+
+def save_manifest(manifest):
+    _write(_manifest_path(), json.dumps(manifest).encode('utf-8'))
+
+
+def built_event_ids():
+    """Ids of the events that have a report on disk."""
+    if not os.path.isdir(settings.MAPS_REPORTS_ROOT):
+        return set()
+    return set(
+        int(match.group(1)) for match in (
+            re.match(r'event-(\d+)\.html$', name)
+            for name in os.listdir(settings.MAPS_REPORTS_ROOT)
+        ) if match
+    )
+
+
+def build(event_ids):
+    """(Re)writes the reports of ``event_ids``, dropping deleted events.
+
+    Reports of archived events are left as they were when archived.
+
+    """
+    if not os.path.isdir(settings.MAPS_REPORTS_ROOT):
+        os.makedirs(settings.MAPS_REPORTS_ROOT)
+    events = Event.objects.in_bulk(list(event_ids))
+    archived = set(EventArchive.objects.filter(
+        event__in=list(events)
+    ).values_list('event', flat=True))
+    for pk in event_ids:
+        if pk in archived:
+            continue
+        if pk not in events:
+            for fmt in FORMATS:
+                if os.path.exists(path(pk, fmt)):
+                    os.remove(path(pk, fmt))
+            continue
+        data = report_data(events[pk])
+        _write(path(pk, 'html'), render_to_string(
+            'maps/report.html', data
+        ).encode('utf-8'))
+        _write(path(pk, 'csv'), render_csv(data))
+
+
+def touched_events(changes):
+    """Ids of the events whose reports ``changes`` make stale."""
+    events = set()
+    actors, sources = set(), set()
+    for change in changes:
+        if change.model == 'map':
+            data = json.loads(change.data)
+            for key in ('event', 'previous_event'):
+                if data.get(key):
+                    events.add(data[key])
+        elif change.model == 'event':
+            events.add(change.object_id)
+        elif change.model == 'actor':
+            actors.add(change.object_id)
+        elif change.model == 'datasource':
+            sources.add(change.object_id)
+
+    cited = []
+    if actors:
+        cited += [Q(authors_or_producers__in=actors), Q(donors__in=actors)]
+    if sources:
+        cited += [Q(**{f.name + '__in': sources}) for f in source_fields()]
+    if cited:
+        events.update(Map.objects.filter(
+            reduce(operator.or_, cited)
+        ).values_list('event', flat=True).distinct())
+    return events
+
+
+def refresh(batch_size=1000):
+    """Rebuilds the reports the change feed invalidated since last time.
+
+    The feed position is only saved once the reports are written, so an
+    interrupted refresh is simply repeated.
+
+    :return: ids of the events rebuilt.
+
+    """
+    manifest = load_manifest()
+    cursor = manifest['cursor']
+    stale = set()
+    while True:
+        changes = list(Change.objects.after(cursor)[:batch_size])
+        if not changes:
+            break
+        stale |= touched_events(changes)
+        cursor = changes[-1].pk
+    if cursor != manifest['cursor']:
+        build(stale)
+        save_manifest({'cursor': cursor})
+    return stale
+
+
+def rebuild_all():
+    """Rebuilds every report and moves the feed position to the end."""
+    last = Change.objects.order_by('-pk').values_list('pk', flat=True)[:1]
+    ids = set(Event.objects.values_list('pk', flat=True))
+    build(ids | built_event_ids())
+    save_manifest({'cursor': last[0] if last else 0})
+    return ids
+
+
+@require_GET
+def serve(request, pk, fmt):
+    """Sends a prebuilt report, building it first if it never was.
+
+    The manifest is left to :func:`refresh`, the only writer of it.
+
+    """
+    filename = path(pk, fmt)
+    if not os.path.isfile(filename):
+        if not Event.objects.filter(pk=pk).exists():
+            raise Http404
+        build([int(pk)])
+        if not os.path.isfile(filename):
+            # Archived before reports were built.
+            raise Http404
+    with open(filename, 'rb') as f:
+        response = HttpResponse(f.read(), content_type=FORMATS[fmt])
+    if fmt == 'csv':
+        response['Content-Disposition'] = (
+            'attachment; filename="event-{0}-report.csv"'.format(pk)
+        )
+    return response
@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+"""Append-only revision history for Map.
+
+Every edit of a Map appends a :class:`MapRevision` holding only the changed
+field values and the many-to-many membership deltas. Every
+``settings.MAPS_REVISION_CHECKPOINT_INTERVAL`` revisions (and for the first
+one) a full checkpoint is stored instead, so :func:`version` never replays
+more than one interval of deltas.
+
+:func:`maps.pipeline.save_review` records one revision per review edit,
+relations included. Any other ``save()`` of a Map, and any change to its
+many-to-many relations through the related managers, is recorded by the
+signal receivers below (connected in :mod:`maps.apps`), one revision per
+write.
+"""
+import json
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Change, Map, MapRevision
+from .serializers import field_value
+
+#: Map fields that are bookkeeping rather than review data.
+UNTRACKED_FIELDS = ('id', 'revision', 'updated_at')
+
+
+def tracked_fields():
+    return [f for f in Map._meta.fields if f.name not in UNTRACKED_FIELDS]
+
+
+def snapshot(instance):
+    """Field name to normalised value for an in-memory Map."""
+    return dict(
+        (f.name, field_value(f, f.value_from_object(instance)))
+        for f in tracked_fields()
+    )
+
+
+def stored_snapshot(pk, using=None):
+    """Locks the Map row ``pk`` and returns (revision, snapshot) from the db.
+
+    Bound ModelForms update their instance during validation, so the values
+    an edit replaces have to be read back from the database.
+
+    :raises IndexError: if there is no such row.
+
+    """
+    fields = tracked_fields()
+    row = Map.objects.db_manager(using).select_for_update().filter(
+        pk=pk
+    ).values('revision', *[f.name for f in fields])[0]
+    return row['revision'], dict(
+        (f.name, field_value(f, row[f.name])) for f in fields
+    )
+
+
+def field_changes(before, after):
+    """The entries of ``after`` that differ from ``before``."""
+    return dict(
+        (name, value) for name, value in after.items()
+        if before.get(name) != value
+    )
+
+
+def m2m_membership(instance):
+    """Relation name to sorted list of related pks, for checkpoints."""
+    ret = {}
+    for field in Map._meta.many_to_many:
+        ret[field.name] = sorted(
+            getattr(instance, field.name).values_list('pk', flat=True)
+        )
+    return ret
+
+
+def record(instance, changes, m2m_changes, fields=None, using=None):
+    """Appends the revision ``instance.revision`` to the log.
+
+    :param instance: the saved Map.
+    :param dict changes: changed field name to new normalised value.
+    :param dict m2m_changes: relation name to (added, removed) pk sets.
+    :param dict fields: stored field values, for a checkpoint; defaults to
+        those of ``instance``.
+    :rtype: MapRevision
+
+    """
+    number = instance.revision
+    interval = settings.MAPS_REVISION_CHECKPOINT_INTERVAL
+    revisions = MapRevision.objects.db_manager(using)
+    if number == 1 or number % interval == 0:
+        return revisions.create(
+            map=instance, number=number, is_checkpoint=True,
+            field_data=json.dumps(fields or snapshot(instance)),
+            m2m_data=json.dumps(m2m_membership(instance)),
+        )
+    return revisions.create(
+        map=instance, number=number,
+        field_data=json.dumps(changes),
+        m2m_data=json.dumps(dict(
+            (name, {'+': sorted(added), '-': sorted(removed)})
+            for name, (added, removed) in m2m_changes.items()
+        )),
+    )
+
+
+def version(map_id, number):
+    """Reconstructs a historical version of a Map.
+
+    :param int map_id: primary key of the Map.
+    :param int number: revision number to rebuild.
+    :rtype: tuple
+    :return: (fields, m2m) - dicts of field name to value and of relation
+        name to set of related pks.
+    :raises MapRevision.DoesNotExist: if the revision wasn't recorded.
+
+    """
+    revisions = MapRevision.objects.filter(map_id=map_id)
+    base = revisions.filter(
+        is_checkpoint=True, number__lte=number
+    ).order_by('-number').values_list('number', flat=True)[:1]
+    if not base or not revisions.filter(number=number).exists():
+        raise MapRevision.DoesNotExist(
+            "Map {0} has no revision {1}".format(map_id, number)
+        )
+
+    fields, m2m = {}, {}
+    for rev in revisions.filter(
+            number__gte=base[0], number__lte=number).order_by('number'):
+        fields.update(json.loads(rev.field_data))
+        if rev.is_checkpoint:
+            m2m = dict(
+                (k, set(v)) for k, v in json.loads(rev.m2m_data).items()
+            )
+            continue
+        for name, delta in json.loads(rev.m2m_data).items():
+            m2m.setdefault(name, set()).update(delta['+'])
+            m2m[name].difference_update(delta['-'])
+    return fields, m2m
+
+
+def changes_since(revision_id, limit=None):
+    """Revisions appended after the global revision id ``revision_id``.
+
+    Ordered by primary key, so callers can page through the log by passing
+    the last id they saw.
+
+    """
+    qs = MapRevision.objects.filter(pk__gt=revision_id).order_by('pk')
+    return qs[:limit] if limit else qs
+
+
+@contextmanager
+def recorded_by_caller(instance):
+    """Keeps the receivers below from recording saves of ``instance``.
+
+    For callers that record a single revision for a save and the relation
+    changes that follow it. The agreement receivers leave scoring to them
+    too.
+
+    """
+    instance._revision_by_caller = True
+    try:
+        yield
+    finally:
+        del instance._revision_by_caller
+
+
+def by_caller(instance):
+    """Whether the current save of ``instance`` is recorded by its caller."""
+    return getattr(instance, '_revision_by_caller', False)
+
+
+def before_save(sender, instance, raw, using, **kwargs):
+    """``pre_save`` receiver numbering the revision a save will create."""
+    if raw or by_caller(instance):
+        return
+    stored = None
+    if instance.pk is not None:
+        try:
+            stored = stored_snapshot(instance.pk, using)
+        except IndexError:
+            pass
+    if stored is None:
+        instance.revision = 1
+        instance._revision_changes = None
+        return
+    revision, before = stored
+    changes = field_changes(before, snapshot(instance))
+    instance.revision = revision + 1 if changes else revision
+    instance._revision_changes = changes
+
+
+def after_save(sender, instance, raw, using, **kwargs):
+    """``post_save`` receiver appending the revision of a save."""
+    if not hasattr(instance, '_revision_changes'):
+        return
+    changes = instance._revision_changes
+    del instance._revision_changes
+    if changes is None or changes:
+        record(instance, changes, {}, using=using)
+
+
+def relation_name(through):
+    """Name of the Map relation stored in the table ``through``."""
+    for field in Map._meta.many_to_many:
+        if field.rel.through is through:
+            return field.name
+
+
+def relation_changed(sender, instance, action, reverse, pk_set, using,
+                     **kwargs):
+    """``m2m_changed`` receiver recording a relation change as a revision.
+
+    The save path of :mod:`maps.pipeline` writes through rows directly and
+    doesn't come through here.
+
+    """
+    name = relation_name(sender)
+    if name is None:
+        return
+    if action == 'pre_clear':
+        # Remember what is cleared, as post_clear has no pk_set.
+        if reverse:
+            accessor = Map._meta.get_field(name).related.get_accessor_name()
+            related = getattr(instance, accessor)
+        else:
+            related = getattr(instance, name)
+        instance._revision_cleared = set(
+            related.values_list('pk', flat=True)
+        )
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if action == 'post_clear':
+        pk_set = instance._revision_cleared
+        del instance._revision_cleared
+    if not pk_set:
+        return
+    if reverse:
+        deltas = [(pk, set([instance.pk])) for pk in pk_set]
+    else:
+        deltas = [(instance.pk, set(pk_set))]
+    with transaction.atomic(using=using, savepoint=False):
+        for map_id, pks in deltas:
+            delta = (pks, set()) if action == 'post_add' else (set(), pks)
+            _record_m2m(map_id, name, delta, using)
+
+
+def _record_m2m(map_id, name, delta, using):
+    revision, fields = stored_snapshot(map_id, using)
+    maps = Map.objects.db_manager(using)
+    # update() skips auto_now; Last-Modified follows updated_at.
+    maps.filter(pk=map_id).update(
+        revision=revision + 1, updated_at=timezone.now()
+    )
+    instance = maps.get(pk=map_id)
+    record(instance, {}, {name: delta}, fields, using)
+    Change.objects.db_manager(using).record(instance, Change.SAVE)
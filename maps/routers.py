@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""Read-replica database routing.
+
+Reads go to one of ``settings.MAPS_READ_REPLICAS`` unless the current
+thread is pinned to the primary, which happens:
+
+* for the rest of a request (or management command) once it has written,
+  so it reads its own writes;
+* inside a transaction on the primary;
+* for requests using an unsafe method, and for
+  ``settings.MAPS_REPLICA_STICKY_SECONDS`` after a request that wrote (see
+  :class:`maps.middleware.PinPrimaryMiddleware`), to cover replication lag.
+
+Writes always go to the primary, ``default``.
+"""
+import random
+import threading
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+_state = threading.local()
+
+
+def pin_to_primary():
+    """Sends this thread's reads to the primary until :func:`reset`."""
+    _state.pinned = True
+
+
+def is_pinned():
+    return getattr(_state, 'pinned', False)
+
+
+def has_written():
+    return getattr(_state, 'written', False)
+
+
+def reset():
+    _state.pinned = False
+    _state.written = False
+
+
+class ReplicaRouter(object):
+
+    def db_for_read(self, model, **hints):
+        replicas = settings.MAPS_READ_REPLICAS
+        if (not replicas or is_pinned() or
+                connections[DEFAULT_DB_ALIAS].in_atomic_block):
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        _state.written = True
+        pin_to_primary()
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary.
+        return True
+
+    def allow_migrate(self, db, model):
+        # Replicas get their schema through replication.
+        if db in settings.MAPS_READ_REPLICAS:
+            return settings.MAPS_MIGRATE_REPLICAS
+        return None
@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+"""Conversion of model field values to plain JSON-compatible values."""
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models
+
+
+def field_value(field, value):
+    """Returns ``value`` of ``field`` as it would come back from JSON.
+
+    Accepts both attribute values and raw database values, so the two can
+    be compared: relations give their primary key, files their name and
+    dates their ISO format.
+
+    """
+    if not field.rel:
+        value = field.to_python(value)
+    if isinstance(field, models.FileField):
+        value = getattr(value, 'name', value) or None
+    return json.loads(json.dumps(value, cls=DjangoJSONEncoder))
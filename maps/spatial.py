@@ -0,0 +1,283 @@
+# -*- coding: utf-8 -*-
+"""Spatial index over map extents and gazetteer areas.
+
+Bounding boxes of :class:`Map` extents and :class:`AdminArea` entries are
+indexed in an R-tree, so "what covers this point" and "what intersects
+this box" are index lookups. On SQLite this is an R*Tree virtual table
+kept up to date on every save and delete; elsewhere, or on SQLite builds
+without the R*Tree module, each process bulk-loads an in-memory
+:class:`STRTree` from the bounding-box columns and follows the change feed:
+rows saved or deleted since the tree was built are looked up again and
+overlaid on it, and the tree is only reloaded once that overlay grows
+large. Writes in bulk must therefore be recorded in the feed.
+"""
+import math
+
+from django.db import connections, router
+
+from .models import AdminArea, Change, Map
+from .sqlite import CHUNK, chunks
+
+#: Indexed model to (R*Tree table name, bbox columns: W, S, E, N).
+INDEXES = {
+    Map: ('maps_map_rtree', (
+        'extent_west', 'extent_south', 'extent_east', 'extent_north',
+    )),
+    AdminArea: ('maps_adminarea_rtree', ('west', 'south', 'east', 'north')),
+}
+
+
+class STRTree(object):
+    """Static R-tree bulk-loaded with Sort-Tile-Recursive packing.
+
+    :param items: iterable of (id, (west, south, east, north)).
+    :param int capacity: maximum entries per node.
+
+    """
+
+    def __init__(self, items, capacity=16):
+        # Entries are (west, south, east, north, payload, is_item): items
+        # carry their id, inner nodes the list of their child entries.
+        self.capacity = capacity
+        level = [tuple(bbox) + (key, True) for key, bbox in items]
+        self.size = len(level)
+        while len(level) > capacity:
+            level = self._pack(level)
+        self.root = level
+
+    def _pack(self, entries):
+        capacity = self.capacity
+        pages = int(math.ceil(len(entries) / float(capacity)))
+        slices = int(math.ceil(math.sqrt(pages)))
+        per_slice = slices * capacity
+
+        entries = sorted(entries, key=lambda e: e[0] + e[2])
+        nodes = []
+        for i in range(0, len(entries), per_slice):
+            vertical = sorted(
+                entries[i:i + per_slice], key=lambda e: e[1] + e[3]
+            )
+            for j in range(0, len(vertical), capacity):
+                group = vertical[j:j + capacity]
+                nodes.append((
+                    min(e[0] for e in group), min(e[1] for e in group),
+                    max(e[2] for e in group), max(e[3] for e in group),
+                    group, False,
+                ))
+        return nodes
+
+    def query(self, west, south, east, north):
+        """Ids of entries whose box intersects the given one."""
+        found = []
+        stack = [self.root]
+        while stack:
+            for e in stack.pop():
+                if (e[0] <= east and e[2] >= west and
+                        e[1] <= north and e[3] >= south):
+                    if e[5]:
+                        found.append(e[4])
+                    else:
+                        stack.append(e[4])
+        return found
+
+
+def _rtree_available(model):
+    """Whether ``model``'s R*Tree table exists on its database."""
+    db = router.db_for_read(model)
+    key = (db, model)
+    if key not in _rtree_available.cache:
+        connection = connections[db]
+        if connection.vendor != 'sqlite':
+            return False
+        if INDEXES[model][0] not in connection.introspection.table_names():
+            # Not cached: the table may yet be created by a migration.
+            return False
+        _rtree_available.cache[key] = True
+    return _rtree_available.cache[key]
+_rtree_available.cache = {}
+
+
+class _Index(object):
+    """In-memory index of a model as of the change feed entry ``seq``.
+
+    ``overlay`` holds the boxes of the rows changed since the tree was
+    built (None for rows deleted or without a box); they take precedence
+    over the tree's entries.
+
+    """
+
+    def __init__(self, model, using):
+        self.model = model
+        self.using = using
+        self.seq = _last_change(model, using)
+        columns = INDEXES[model][1]
+        rows = model._default_manager.using(using).exclude(
+            **{columns[0] + '__isnull': True}
+        ).values_list('pk', *columns)
+        self.tree = STRTree(
+            (row[0], tuple(row[1:])) for row in rows.iterator()
+        )
+        self.overlay = {}
+
+    def refresh(self):
+        """Overlays the rows changed since; False if too many changed."""
+        changed = Change.objects.using(self.using).filter(
+            model=self.model._meta.model_name, pk__gt=self.seq
+        ).order_by('pk').values_list('pk', 'object_id')
+        ids = set()
+        for seq, object_id in changed.iterator():
+            ids.add(object_id)
+            self.seq = seq
+        # Rows already overlaid are read again but don't grow the overlay.
+        added = len(ids - set(self.overlay))
+        if len(self.overlay) + added > max(self.tree.size // 8, CHUNK):
+            return False
+        columns = INDEXES[self.model][1]
+        for chunk in chunks(sorted(ids)):
+            self.overlay.update(dict.fromkeys(chunk))
+            for row in self.model._default_manager.using(self.using).filter(
+                pk__in=chunk
+            ).values_list('pk', *columns):
+                if None not in row:
+                    self.overlay[row[0]] = tuple(row[1:])
+        return True
+
+    def query(self, west, south, east, north):
+        found = [
+            pk for pk in self.tree.query(west, south, east, north)
+            if pk not in self.overlay
+        ]
+        found.extend(
+            pk for pk, bbox in self.overlay.items()
+            if bbox is not None and bbox[0] <= east and bbox[2] >= west and
+            bbox[1] <= north and bbox[3] >= south
+        )
+        return found
+
+
+def _last_change(model, using):
+    last = Change.objects.using(using).filter(
+        model=model._meta.model_name
+    ).order_by('-pk').values_list('pk', flat=True)[:1]
+    return last[0] if last else 0
+
+
+_indexes = {}
+
+
+def _index(model):
+    """The in-memory index of ``model``, brought up to date."""
+    using = router.db_for_read(model)
+    index = _indexes.get((using, model))
+    if index is None or not index.refresh():
+        index = _indexes[(using, model)] = _Index(model, using)
+    return index
+
+
+def intersecting(queryset, west, south, east, north):
+    """Restricts ``queryset`` to rows whose box intersects the given one."""
+    model = queryset.model
+    table, columns = INDEXES[model]
+    exact = {
+        columns[0] + '__lte': east, columns[2] + '__gte': west,
+        columns[1] + '__lte': north, columns[3] + '__gte': south,
+    }
+    if _rtree_available(model):
+        # R*Tree stores 32-bit floats rounded outwards, so its matches are
+        # candidates to check against the exact columns.
+        return queryset.extra(where=[
+            '{0}.{1} IN (SELECT id FROM {2} WHERE min_x <= %s AND '
+            'max_x >= %s AND min_y <= %s AND max_y >= %s)'.format(
+                model._meta.db_table, model._meta.pk.column, table
+            )
+        ], params=[east, west, north, south]).filter(**exact)
+    found = _index(model).query(west, south, east, north)
+    if len(found) <= CHUNK:
+        return queryset.filter(pk__in=found)
+    # Too many ids to pass as parameters; not selective enough for the
+    # index to help either.
+    return queryset.filter(**exact)
+
+
+def covering(queryset, lon, lat):
+    """Restricts ``queryset`` to rows whose box contains the point."""
+    return intersecting(queryset, lon, lat, lon, lat)
+
+
+def maps_covering(lon, lat):
+    return covering(Map.objects.all(), lon, lat)
+
+
+def maps_intersecting(west, south, east, north):
+    return intersecting(Map.objects.all(), west, south, east, north)
+
+
+def areas_covering(lon, lat):
+    return covering(AdminArea.objects.all(), lon, lat)
+
+
+def parse_bbox(params):
+    """(west, south, east, north) from ``?bbox=`` or ``?point=``, or None.
+
+    :raises ValueError: if the parameter is malformed.
+
+    """
+    if params.get('bbox'):
+        bbox = tuple(float(v) for v in params['bbox'].split(','))
+    elif params.get('point'):
+        lon, lat = (float(v) for v in params['point'].split(','))
+        bbox = (lon, lat, lon, lat)
+    else:
+        return None
+    if len(bbox) != 4:
+        raise ValueError("bbox takes west,south,east,north")
+    return bbox
+
+
+def update(instance, using=None):
+    """Brings the index entry of a saved instance up to date."""
+    model = type(instance)
+    if not _rtree_available(model):
+        return
+    table, columns = INDEXES[model]
+    bbox = [getattr(instance, c) for c in columns]
+    cursor = connections[using or router.db_for_write(model)].cursor()
+    if None in bbox:
+        cursor.execute(
+            'DELETE FROM {0} WHERE id = %s'.format(table), [instance.pk]
+        )
+    else:
+        west, south, east, north = bbox
+        cursor.execute(
+            'INSERT OR REPLACE INTO {0} (id, min_x, max_x, min_y, max_y) '
+            'VALUES (%s, %s, %s, %s, %s)'.format(table),
+            [instance.pk, west, east, south, north]
+        )
+
+
+def remove(instance, using=None):
+    model = type(instance)
+    if not _rtree_available(model):
+        return
+    cursor = connections[using or router.db_for_write(model)].cursor()
+    cursor.execute(
+        'DELETE FROM {0} WHERE id = %s'.format(INDEXES[model][0]),
+        [instance.pk]
+    )
+
+
+def rebuild(model, using=None):
+    """Reloads the whole index of ``model``, after bulk writes."""
+    if not _rtree_available(model):
+        return
+    table, columns = INDEXES[model]
+    cursor = connections[using or router.db_for_write(model)].cursor()
+    cursor.execute('DELETE FROM {0}'.format(table))
+    cursor.execute(
+        'INSERT INTO {0} (id, min_x, max_x, min_y, max_y) '
+        'SELECT {1}, {2}, {4}, {3}, {5} FROM {6} WHERE {2} IS NOT NULL'.format(
+            table, model._meta.pk.column,
+            *(list(columns) + [model._meta.db_table])
+        )
+    )
+
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""Tuning for deployments on a single SQLite file.
+
+* :func:`configure` applies ``settings.MAPS_SQLITE_PRAGMAS`` to every new
+  SQLite connection: write-ahead logging so readers never wait for the
+  writer, a busy timeout so writers wait for each other instead of failing
+  at once, ``synchronous=NORMAL`` (safe with WAL) and larger page cache
+  and memory map. Connections are kept open between requests
+  (``CONN_MAX_AGE``), so this runs once per connection, not per request.
+* :func:`write_transaction` runs a function in a transaction and retries
+  it, with randomised exponential backoff, when SQLite still reports the
+  database locked; with ``settings.MAPS_SQLITE_SINGLE_WRITER`` the writes
+  of a process also queue on one lock, so threads contend for the file no
+  more than processes do.
+
+Neither does anything on other databases. :func:`chunks` splits id lists
+for ``pk__in`` lookups, which SQLite caps at 999 parameters.
+"""
+import random
+import threading
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.db import (
+    DEFAULT_DB_ALIAS, OperationalError, connections, transaction,
+)
+
+#: Ids per query when filtering, updating or deleting by id.
+CHUNK = 500
+
+_write_lock = threading.RLock()
+
+
+def chunks(items, size=CHUNK):
+    """``items`` in lists of at most ``size``."""
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def configure(sender, connection, **kwargs):
+    """``connection_created`` receiver applying the pragmas."""
+    if connection.vendor != 'sqlite':
+        return
+    cursor = connection.cursor()
+    for name, value in settings.MAPS_SQLITE_PRAGMAS:
+        cursor.execute('PRAGMA {0} = {1}'.format(name, value))
+
+
+def is_locked(error):
+    """Whether an OperationalError is SQLite's SQLITE_BUSY/SQLITE_LOCKED."""
+    return 'locked' in str(error) or 'busy' in str(error)
+
+
+class _WriterLock(object):
+
+    def __enter__(self):
+        self.locked = settings.MAPS_SQLITE_SINGLE_WRITER
+        if self.locked:
+            _write_lock.acquire()
+
+    def __exit__(self, *exc_info):
+        if self.locked:
+            _write_lock.release()
+
+
+def write_transaction(func):
+    """Runs ``func`` in a transaction on SQLite, retried while locked.
+
+    Only an outermost transaction can be retried; called inside one,
+    ``func`` just runs. ``func`` must be safe to run again after a
+    rollback.
+
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        connection = connections[DEFAULT_DB_ALIAS]
+        if connection.vendor != 'sqlite' or connection.in_atomic_block:
+            return func(*args, **kwargs)
+        delay = settings.MAPS_SQLITE_RETRY_DELAY
+        for attempt in range(settings.MAPS_SQLITE_RETRIES + 1):
+            try:
+                with _WriterLock():
+                    with transaction.atomic():
+                        return func(*args, **kwargs)
+            except OperationalError as e:
+                if attempt == settings.MAPS_SQLITE_RETRIES or (
+                        not is_locked(e)):
+                    raise
+            time.sleep(delay * (2 ** attempt) * random.uniform(0.5, 1.5))
+    return wrapper
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""Fingerprinted, pre-compressed static files.
+
+:class:`CompressedManifestStaticFilesStorage` adds a content hash to every
+collected file name and writes ``.gz`` (and, when the optional ``brotli``
+package is installed, ``.br``) siblings of text assets, so that no
+compression happens per request. Files missing from the manifest, such as
+bundles ``build_assets`` wasn't run for, get their plain URL and a logged
+error rather than failing the page. :func:`serve` sends those files with
+far-future cache headers for deployments without a front-end web server.
+"""
+import gzip
+import logging
+import mimetypes
+import os
+import posixpath
+import re
+import time
+from wsgiref.util import FileWrapper
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import (
+    ManifestStaticFilesStorage, StaticFilesStorage,
+)
+from django.http import Http404, StreamingHttpResponse
+from django.utils import six
+from django.utils.http import http_date
+from django.utils.six.moves.urllib.parse import unquote
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE = ('.css', '.js', '.svg', '.ttf', '.eot', '.json', '.txt')
+
+# name.0123456789ab.ext, as written by ManifestStaticFilesStorage.
+HASHED_NAME = re.compile(r'\.[0-9a-f]{12}\.[^./]+$')
+
+# A year; hashed names change whenever their content does.
+FAR_FUTURE = 365 * 24 * 60 * 60
+
+logger = logging.getLogger(__name__)
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+
+    def url(self, name, force=False):
+        try:
+            return super(CompressedManifestStaticFilesStorage, self).url(
+                name, force
+            )
+        except ValueError:
+            # collectstatic (force) must still fail on missing references.
+            if force:
+                raise
+            logger.error("Static file %s was not collected", name)
+            return StaticFilesStorage.url(self, name)
+
+    def post_process(self, paths, dry_run=False, **options):
+        processed = super(
+            CompressedManifestStaticFilesStorage, self
+        ).post_process(paths, dry_run=dry_run, **options)
+        for name, hashed_name, was_processed in processed:
+            if (not dry_run and isinstance(hashed_name, six.string_types) and
+                    hashed_name.endswith(COMPRESSIBLE)):
+                self.compress(hashed_name)
+            yield name, hashed_name, was_processed
+
+    def compress(self, name):
+        """Writes pre-compressed variants of ``name`` if they're smaller."""
+        path = self.path(name)
+        with open(path, 'rb') as f:
+            content = f.read()
+
+        with open(path + '.gz', 'wb') as raw:
+            gz = gzip.GzipFile(
+                filename='', mode='wb', fileobj=raw, compresslevel=9, mtime=0
+            )
+            gz.write(content)
+            gz.close()
+        if os.path.getsize(path + '.gz') >= len(content):
+            os.remove(path + '.gz')
+
+        if brotli is not None:
+            compressed = brotli.compress(content)
+            if len(compressed) < len(content):
+                with open(path + '.br', 'wb') as f:
+                    f.write(compressed)
+
+
+def serve(request, path):
+    """Serves a collected static file, preferring a pre-compressed copy.
+
+    Fingerprinted names are cached by browsers for a year; anything else
+    must be revalidated.
+
+    """
+    path = posixpath.normpath(unquote(path)).lstrip('/')
+    if path.startswith('..') or path.endswith(('.gz', '.br')):
+        raise Http404
+    fullpath = os.path.join(settings.STATIC_ROOT, path)
+    if not os.path.isfile(fullpath):
+        raise Http404
+
+    content_type, _ = mimetypes.guess_type(fullpath)
+    accepted = request.META.get('HTTP_ACCEPT_ENCODING', '')
+    encoding = None
+    for candidate, suffix in (('br', '.br'), ('gzip', '.gz')):
+        if candidate in accepted and os.path.isfile(fullpath + suffix):
+            encoding = candidate
+            fullpath += suffix
+            break
+
+    response = StreamingHttpResponse(
+        FileWrapper(open(fullpath, 'rb')),
+        content_type=content_type or 'application/octet-stream'
+    )
+    stat = os.stat(fullpath)
+    response['Content-Length'] = stat.st_size
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    response['Vary'] = 'Accept-Encoding'
+    if encoding:
+        response['Content-Encoding'] = encoding
+    if HASHED_NAME.search(path):
+        response['Cache-Control'] = 'public, max-age={0}'.format(FAR_FUTURE)
+        response['Expires'] = http_date(time.time() + FAR_FUTURE)
+    else:
+        response['Cache-Control'] = 'public, max-age=0, must-revalidate'
+    return response
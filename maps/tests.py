@@ -1,3 +1,1339 @@
-from django.test import TestCase
+import datetime
+import io
+import json
+import os
+import shutil
+import tempfile
+from unittest import skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.db import (
+    IntegrityError, OperationalError, connection, transaction,
+)
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.test.client import Client, RequestFactory
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.http import HttpResponse
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.urlresolvers import resolve
+from django.utils import six, timezone
+from django.utils.functional import empty
+
+from . import (
+    agreement, api, archive, backfill, bundles, drafts, duplicates, pipeline,
+    reference, reports, revisions, routers, spatial, sqlite,
+)
+from .forms import CreateReviewForm, review_formsets
+from .middleware import PIN_COOKIE, PinPrimaryMiddleware, TokenAuthMiddleware
+from .models import (
+    Actor, AdminArea, ArchivedMap, BackfillProgress, Change, DataSource,
+    DraftChange, Event, EventArchive, FieldAgreement, Map, MapRevision,
+    ReviewCoding, ReviewDraft, StatisticalOrIndicatorData,
+)
+
+
+@override_settings(MAPS_READ_REPLICAS=('replica',))
+class ReplicaRouterTest(SimpleTestCase):
+
+    def setUp(self):
+        routers.reset()
+
+    def tearDown(self):
+        routers.reset()
+
+    def test_reads_go_to_replica(self):
+        self.assertEqual(Actor.objects.all().db, 'replica')
+
+    def test_writes_pin_reads_to_primary(self):
+        routers.ReplicaRouter().db_for_write(Actor)
+        self.assertEqual(Actor.objects.all().db, 'default')
+
+    def test_reads_in_transaction_use_primary(self):
+        with transaction.atomic():
+            self.assertEqual(Actor.objects.all().db, 'default')
+
+    @override_settings(MAPS_READ_REPLICAS=())
+    def test_no_replicas(self):
+        self.assertEqual(Actor.objects.all().db, 'default')
+
+
+@override_settings(MAPS_READ_REPLICAS=('replica',))
+class PinPrimaryMiddlewareTest(SimpleTestCase):
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.middleware = PinPrimaryMiddleware()
+
+    def tearDown(self):
+        routers.reset()
+
+    def test_unsafe_requests_use_primary(self):
+        self.middleware.process_request(self.factory.post('/'))
+        self.assertEqual(Actor.objects.all().db, 'default')
+
+    def test_write_sets_sticky_cookie(self):
+        request = self.factory.post('/')
+        self.middleware.process_request(request)
+        routers.ReplicaRouter().db_for_write(Actor)
+        response = self.middleware.process_response(request, HttpResponse())
+        self.assertEqual(
+            response.cookies[PIN_COOKIE]['max-age'],
+            settings.MAPS_REPLICA_STICKY_SECONDS
+        )
+        self.assertFalse(routers.is_pinned())
+
+    def test_sticky_cookie_pins_reads(self):
+        request = self.factory.get('/')
+        request.COOKIES[PIN_COOKIE] = '1'
+        self.middleware.process_request(request)
+        self.assertEqual(Actor.objects.all().db, 'default')
+
+    def test_plain_reads_use_replica(self):
+        request = self.factory.get('/')
+        self.middleware.process_request(request)
+        self.assertEqual(Actor.objects.all().db, 'replica')
+        response = self.middleware.process_response(request, HttpResponse())
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+
+@override_settings(MAPS_API_TOKENS=('s3cret',))
+class TokenAuthMiddlewareTest(SimpleTestCase):
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.middleware = TokenAuthMiddleware()
+
+    def process(self, path, **headers):
+        match = resolve(path)
+        return self.middleware.process_view(
+            self.factory.get(path, **headers), match.func, match.args,
+            match.kwargs
+        )
+
+    def test_valid_token(self):
+        self.assertIsNone(
+            self.process('/maps/changes/', HTTP_AUTHORIZATION='Token s3cret')
+        )
+
+    def test_missing_or_wrong_token(self):
+        for header in ('', 'Token nope', 'Basic s3cret'):
+            for path in ('/maps/changes/', '/maps/api/maps/',
+                         '/maps/agreement.json'):
+                response = self.process(path, HTTP_AUTHORIZATION=header)
+                self.assertEqual(response.status_code, 401)
+
+    def test_site_pages_open(self):
+        self.assertIsNone(self.process('/maps/review/'))
+
+    def test_full_site(self):
+        self.assertEqual(self.client.get('/maps/api/maps/').status_code, 401)
+
+    @override_settings(MAPS_API_TOKENS=())
+    def test_open_without_tokens(self):
+        self.assertIsNone(self.process('/maps/changes/'))
+
+
+@skipUnless(
+    'replica' in settings.DATABASES,
+    "Run with --settings=map_review.settings.test_replicas"
+)
+class TwoDatabaseRoutingTest(TransactionTestCase):
+    """Uses an unreplicated second SQLite file, so a lagging replica."""
+    multi_db = True
+
+    def tearDown(self):
+        routers.reset()
+
+    def test_read_your_own_writes(self):
+        Actor.objects.create(name='OCHA')
+        self.assertTrue(Actor.objects.filter(name='OCHA').exists())
+
+    def test_other_readers_use_replica(self):
+        Actor.objects.create(name='OCHA')
+        routers.reset()
+        self.assertFalse(Actor.objects.filter(name='OCHA').exists())
+
+
+class BackfillTest(TestCase):
+
+    def setUp(self):
+        for i in range(7):
+            Actor.objects.create(name='Actor {0}'.format(i))
+        self.batches = []
+        self.fail_at = None
+        self.backfill = backfill.Backfill(
+            'test-actors', Actor, self.process, batch_size=3
+        )
+
+    def process(self, batch):
+        if len(self.batches) == self.fail_at:
+            raise RuntimeError
+        self.batches.append(batch.count())
+        batch.update(is_cluster=True)
+
+    def test_batches_in_pk_order(self):
+        self.assertEqual(self.backfill.run(), 7)
+        self.assertEqual(self.batches, [3, 3, 1])
+        self.assertFalse(Actor.objects.filter(is_cluster=False).exists())
+        self.assertIsNotNone(
+            BackfillProgress.objects.get(name='test-actors').finished
+        )
+
+    def test_resumes_after_interruption(self):
+        self.fail_at = 1
+        self.assertRaises(RuntimeError, self.backfill.run)
+        self.assertEqual(Actor.objects.filter(is_cluster=True).count(), 3)
+        self.fail_at = None
+        self.assertEqual(self.backfill.run(), 4)
+        self.assertEqual(self.batches, [3, 3, 1])
+
+    def test_estimate_rolls_back(self):
+        rows, per_batch, total = self.backfill.estimate()
+        self.assertEqual(rows, 7)
+        self.assertFalse(Actor.objects.filter(is_cluster=True).exists())
+        # Estimating must not schedule the backfill.
+        self.assertFalse(
+            BackfillProgress.objects.filter(name='test-actors').exists()
+        )
+
+    def test_listing_schedules_nothing(self):
+        backfill.registry['test-actors'] = self.backfill
+        self.addCleanup(backfill.registry.pop, 'test-actors')
+        out = six.StringIO()
+        call_command('backfill', stdout=out)
+        self.assertIn('test-actors\t0 rows done\tnot started', out.getvalue())
+        self.assertNotIn(self.backfill, backfill.pending())
+        self.backfill.run()
+        self.assertIsNotNone(self.backfill.progress().finished)
+
+
+class BundlesTest(SimpleTestCase):
+
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        os.makedirs(os.path.join(root, 'src'))
+        with open(os.path.join(root, 'src', 'review.js'), 'wb') as f:
+            f.write(b'review();')
+        for name in ('ASSETS_ROOT', 'STATIC_ROOT', 'urlopen'):
+            self.addCleanup(setattr, bundles, name, getattr(bundles, name))
+        bundles.ASSETS_ROOT = root
+        bundles.STATIC_ROOT = os.path.join(root, 'static')
+        bundles.urlopen = lambda url: io.BytesIO(url.encode('utf-8'))
+
+    def test_pinned_downloads(self):
+        with self.assertRaises(ValueError):
+            bundles.fetch_vendor()
+        self.assertFalse(os.path.exists(os.path.join(bundles.ASSETS_ROOT,
+                                                     'vendor')))
+        self.assertEqual(len(bundles.fetch_vendor(pin=True)),
+                         len(bundles.VENDOR))
+        self.assertEqual(len(bundles.load_checksums()), len(bundles.VENDOR))
+        self.assertEqual(
+            [name for name, _ in bundles.fetch_vendor(force=True)],
+            [name for name, _ in bundles.VENDOR]
+        )
+        self.assertIn('maps/js/review.js', bundles.build())
+
+        bundles.urlopen = lambda url: io.BytesIO(b'tampered')
+        with self.assertRaises(ValueError):
+            bundles.fetch_vendor(force=True)
+
+    def test_build_checks_vendored_files(self):
+        bundles.fetch_vendor(pin=True)
+        path = os.path.join(bundles.ASSETS_ROOT, 'vendor', 'jquery.min.js')
+        with open(path, 'ab') as f:
+            f.write(b'alert(1);')
+        with self.assertRaises(ValueError):
+            bundles.build()
+
+
+class ReviewPageTest(TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        override = override_settings(STATIC_ROOT=self.root)
+        override.enable()
+        self.addCleanup(override.disable)
+        # The storage reads the manifest once; start from a fresh one.
+        staticfiles_storage._wrapped = empty
+        self.addCleanup(setattr, staticfiles_storage, '_wrapped', empty)
+
+    def test_loads_libraries_from_cdns_by_default(self):
+        response = self.client.get('/maps/review/')
+        self.assertContains(response, '/jquery-2.1.1.min.js')
+        self.assertContains(response, '/static/maps/src/review.js')
+        self.assertNotContains(response, '/static/maps/js/review.js')
+
+    @override_settings(MAPS_BUNDLED_ASSETS=True)
+    def test_renders_without_collected_bundles(self):
+        response = self.client.get('/maps/review/')
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '/static/maps/css/review.css')
+        self.assertNotContains(response, '/jquery-2.1.1.min.js')
+
+    @override_settings(MAPS_BUNDLED_ASSETS=True)
+    def test_uses_fingerprinted_bundles(self):
+        with open(os.path.join(self.root, 'staticfiles.json'), 'w') as f:
+            json.dump({'version': '1.0', 'paths': {
+                'maps/css/review.css': 'maps/css/review.0123456789ab.css',
+                'maps/js/review.js': 'maps/js/review.0123456789ab.js',
+            }}, f)
+        response = self.client.get('/maps/review/')
+        for name in ('css/review.0123456789ab.css',
+                     'js/review.0123456789ab.js'):
+            self.assertContains(response, '/static/maps/' + name)
+
+
+class STRTreeTest(SimpleTestCase):
+
+    def test_query_matches_scan(self):
+        boxes = dict(
+            (i, (i % 20, i // 20, i % 20 + 1.5, i // 20 + 1.5))
+            for i in range(400)
+        )
+        tree = spatial.STRTree(boxes.items(), capacity=4)
+        query = (3.2, 7.1, 5.0, 8.0)
+        expected = [
+            i for i, (w, s, e, n) in boxes.items()
+            if w <= query[2] and e >= query[0] and
+            s <= query[3] and n >= query[1]
+        ]
+        self.assertEqual(sorted(tree.query(*query)), sorted(expected))
+
+    def test_empty(self):
+        self.assertEqual(spatial.STRTree([]).query(0, 0, 1, 1), [])
+
+
+class SpatialIndexTest(TestCase):
+
+    def setUp(self):
+        self.country = AdminArea.objects.create(
+            name='Nepal', code='NP', level=0,
+            west=80.0, south=26.3, east=88.2, north=30.5
+        )
+        self.district = AdminArea.objects.create(
+            name='Kathmandu', code='NP-KTM', level=1, parent=self.country,
+            west=85.2, south=27.6, east=85.6, north=27.8
+        )
+
+    def test_point_lookup(self):
+        self.assertEqual(
+            set(spatial.areas_covering(85.3, 27.7)),
+            set([self.country, self.district])
+        )
+        self.assertEqual(list(spatial.areas_covering(84.0, 28.0)),
+                         [self.country])
+
+    def test_index_follows_updates(self):
+        self.district.west, self.district.east = 84.0, 84.5
+        self.district.save()
+        self.assertEqual(list(spatial.areas_covering(85.3, 27.7)),
+                         [self.country])
+        self.country.delete()
+        self.assertFalse(spatial.areas_covering(85.3, 27.7).exists())
+
+    def test_row_moved_twice(self):
+        list(spatial.areas_covering(85.3, 27.7))
+        for west in (10.0, 20.0):
+            self.district.west, self.district.east = west, west + 1
+            self.district.save()
+            list(spatial.areas_covering(west + 0.5, 27.7))
+        self.assertEqual(list(spatial.areas_covering(20.5, 27.7)),
+                         [self.district])
+        self.assertFalse(spatial.areas_covering(10.5, 27.7).exists())
+
+    def test_exact_edges(self):
+        area = AdminArea.objects.create(
+            name='Edge', code='E', level=0,
+            west=121.3, south=0.0, east=122.0, north=1.0
+        )
+        self.assertEqual(list(spatial.areas_covering(121.3, 0.5)), [area])
+        self.assertFalse(spatial.areas_covering(121.29999, 0.5).exists())
+
+
+class InMemorySpatialIndexTest(SpatialIndexTest):
+    """The index used without SQLite's R*Tree module."""
+
+    def setUp(self):
+        available = spatial._rtree_available
+        spatial._rtree_available = lambda model: False
+        self.addCleanup(setattr, spatial, '_rtree_available', available)
+        # Feed sequence numbers are reused after each test's rollback.
+        spatial._indexes.clear()
+        super(InMemorySpatialIndexTest, self).setUp()
+
+    def test_overlays_changes_without_reloading(self):
+        list(spatial.areas_covering(85.3, 27.7))
+        index = spatial._indexes[('default', AdminArea)]
+        self.district.west, self.district.east = 84.0, 84.5
+        self.district.save()
+        self.assertEqual(list(spatial.areas_covering(84.2, 27.7)),
+                         [self.country, self.district])
+        self.assertIs(spatial._indexes[('default', AdminArea)], index)
+
+    def test_large_results(self):
+        AdminArea.objects.bulk_create([
+            AdminArea(name='Ward', code='W{0}'.format(i), level=2,
+                      west=85.0, south=27.0, east=86.0, north=28.0)
+            for i in range(sqlite.CHUNK + 1)
+        ])
+        Change.objects.record_many(
+            AdminArea, AdminArea.objects.values_list('pk', flat=True),
+            Change.SAVE
+        )
+        self.assertEqual(spatial.areas_covering(85.3, 27.7).count(),
+                         sqlite.CHUNK + 3)
+
+
+class DuplicatesTest(TestCase):
+
+    def setUp(self):
+        self.event = Event.objects.create(
+            event_type='TC', start_date=datetime.date(2013, 11, 8),
+            glide_number='TC-2013-000139-PHL',
+        )
+
+    def make_map(self, title, **kwargs):
+        return Map.objects.create(
+            reviewer_name='R', title=title, language='en', event=self.event,
+            day_offset=1, extent='Country', **kwargs
+        )
+
+    def test_similar_titles_found(self):
+        first = self.make_map(
+            'Philippines: Typhoon Haiyan - Affected Population (as of 12 Nov)',
+            url='http://reliefweb.int/map/haiyan-affected-population.pdf',
+        )
+        second = self.make_map(
+            'Philippines - Typhoon Haiyan: affected population as of 12 Nov',
+            file_name='haiyan_affected_population.pdf',
+        )
+        self.make_map('Nepal: Earthquake shelter cluster 3W')
+        self.assertEqual(
+            [pk for pk, score in duplicates.duplicates_of(first)],
+            [second.pk]
+        )
+        self.assertEqual(duplicates.clusters(), [[first.pk, second.pk]])
+
+    def test_index_follows_edits(self):
+        obj = self.make_map('Typhoon Haiyan affected population')
+        obj.title = 'Nepal earthquake shelter cluster 3W'
+        obj.save()
+        found = duplicates.possible_duplicates(
+            'Typhoon Haiyan: affected population'
+        )
+        self.assertEqual(found, [])
+
+
+class MetadataTest(TestCase):
+
+    def setUp(self):
+        self.landsat = DataSource.objects.create(
+            source_type='SATELLITE', name='Landsat 8',
+            meta={'sensor': 'OLI', 'resolution': 30},
+        )
+        self.srtm = DataSource.objects.create(
+            source_type='ELEVATION', name='SRTM', meta={'resolution': 90},
+        )
+        DataSource.objects.create(source_type='ROADS', name='OSM')
+
+    def check_lookups(self):
+        self.assertEqual(list(DataSource.objects.has_meta('sensor')),
+                         [self.landsat])
+        self.assertEqual(list(DataSource.objects.meta(sensor='OLI')),
+                         [self.landsat])
+        self.assertEqual(
+            list(DataSource.objects.meta(resolution__gt=30)), [self.srtm]
+        )
+        self.assertEqual(
+            set(DataSource.objects.meta(resolution__lte=90)),
+            set([self.landsat, self.srtm])
+        )
+
+    def test_lookups(self):
+        self.check_lookups()
+
+    @override_settings(MAPS_PROMOTED_META_KEYS=('sensor', 'resolution'))
+    def test_promoted_lookups(self):
+        for source in DataSource.objects.all():
+            source.save()
+        self.check_lookups()
+
+    def test_rejects_malformed_keys(self):
+        self.assertRaises(ValueError, DataSource.objects.meta, **{
+            "x') OR 1=1 --": 1
+        })
+
+
+class DraftsTest(TestCase):
+
+    def setUp(self):
+        self.url = '/maps/drafts/draft-0001/'
+
+    def autosave(self, fields, client=None):
+        return (client or self.client).post(
+            self.url, json.dumps(fields), content_type='application/json'
+        )
+
+    def test_record_coalesce_promote(self):
+        drafts.record_changes('r1', 'k1', {'title': 'Shel', 'language': 'en'})
+        drafts.record_changes('r1', 'k1', {'title': 'Shelter'})
+        drafts.record_changes('r2', 'k1', {'title': 'Other reviewer'})
+        self.assertEqual(DraftChange.objects.count(), 4)
+
+        mine = ReviewDraft.objects.filter(reviewer='r1')
+        self.assertEqual(drafts.coalesce(mine), 3)
+        self.assertEqual(DraftChange.objects.count(), 1)
+        self.assertEqual(drafts.load('r1', 'k1'),
+                         {'title': 'Shelter', 'language': 'en'})
+        self.assertIsNone(drafts.load('r1', 'k2'))
+
+        review = Map.objects.create(
+            reviewer_name='R', title='Shelter', language='en', day_offset=1,
+            extent='Country', event=Event.objects.create(
+                event_type='EQ', start_date=datetime.date(2015, 4, 25)
+            ),
+        )
+        drafts.promote('r1', 'k1', review)
+        self.assertEqual(mine.get().review, review)
+        self.assertIsNone(drafts.load('r1', 'k1'))
+        self.assertEqual(drafts.load('r2', 'k1'), {'title': 'Other reviewer'})
+
+    def test_view(self):
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+        response = self.autosave({'title': 'Shelter', 'no_such_field': 1})
+        self.assertEqual(response.status_code, 204)
+        response = self.client.get(self.url)
+        self.assertEqual(json.loads(response.content.decode('utf-8')),
+                         {'fields': {'title': 'Shelter'}})
+        # The key alone doesn't reach another reviewer's draft.
+        self.assertEqual(Client().get(self.url).status_code, 404)
+
+        # Reading coalesced the draft; unknown fields add nothing to it.
+        self.assertEqual(self.autosave({'no_such_field': 1}).status_code, 204)
+        self.assertFalse(DraftChange.objects.exists())
+        self.assertEqual(self.autosave(['title']).status_code, 400)
+        with override_settings(MAPS_DRAFT_MAX_BYTES=20):
+            response = self.autosave({'title': 'A much longer title'})
+        self.assertEqual(response.status_code, 413)
+
+        ReviewDraft.objects.update(review=Map.objects.create(
+            reviewer_name='R', title='Shelter', language='en', day_offset=1,
+            extent='Country', event=Event.objects.create(
+                event_type='EQ', start_date=datetime.date(2015, 4, 25)
+            ),
+        ))
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+
+class ChangeFeedTest(TestCase):
+
+    def test_save_and_delete_recorded(self):
+        event = Event.objects.create(
+            event_type='EQ', start_date=datetime.date(2015, 4, 25)
+        )
+        pk = event.pk
+        event.delete()
+        self.assertEqual(
+            list(Change.objects.values_list('model', 'object_id', 'action')),
+            [('event', pk, Change.SAVE), ('event', pk, Change.DELETE)]
+        )
+
+    def test_queryset_delete_recorded(self):
+        ids = [Actor.objects.create(name=name).pk for name in 'AB']
+        cursor = Change.objects.order_by('-pk')[0].pk
+        Actor.objects.all().delete()
+        self.assertEqual(
+            sorted(Change.objects.after(cursor).values_list(
+                'object_id', 'action'
+            )), [(pk, Change.DELETE) for pk in ids]
+        )
+
+    def test_record_many(self):
+        Change.objects.record_many(Actor, [3, 1, 2], Change.SAVE)
+        changes = list(Change.objects.after(0))
+        self.assertEqual([c.object_id for c in changes], [3, 1, 2])
+        self.assertEqual(changes[0].as_dict()['data'], {})
+
+    def test_record_data(self):
+        event = Event.objects.create(
+            event_type='EQ', start_date=datetime.date(2015, 4, 25)
+        )
+        obj = Map.objects.create(
+            reviewer_name='R', title='T', language='en', day_offset=1,
+            extent='Country', event=event,
+        )
+        data = Change.objects.filter(model='map').get().as_dict()['data']
+        self.assertEqual(data['event'], event.pk)
+        self.assertEqual(data['revision'], obj.revision)
+
+    def test_deferred_appends(self):
+        with CaptureQueriesContext(connection) as queries:
+            with transaction.atomic(), Change.objects.deferred_appends():
+                actor = Actor.objects.create(name='A')
+                self.assertFalse(Change.objects.exists())
+                actor.name = 'B'
+                actor.save()
+        sql = [
+            q['sql'] for q in queries.captured_queries
+            if 'SAVEPOINT' not in q['sql']
+        ]
+        inserts = [q for q in sql if 'INSERT INTO "maps_change"' in q]
+        self.assertEqual(inserts, sql[-1:])
+        self.assertEqual(Change.objects.count(), 2)
+
+        with self.assertRaises(ValueError):
+            with transaction.atomic(), Change.objects.deferred_appends():
+                Actor.objects.create(name='C')
+                raise ValueError
+        self.assertEqual(Change.objects.count(), 2)
+
+    def test_paging(self):
+        Change.objects.record_many(Actor, range(1, 6), Change.SAVE)
+        first = Change.objects.order_by('pk')[0].pk - 1
+        page = Change.objects.wait_after(first, 2, 0)
+        self.assertEqual([c.object_id for c in page], [1, 2])
+        page = Change.objects.wait_after(page[-1].pk, 10, 0)
+        self.assertEqual([c.object_id for c in page], [3, 4, 5])
+        self.assertEqual(Change.objects.wait_after(page[-1].pk, 10, 0), [])
+
+    def test_feed_view(self):
+        Change.objects.record_many(Actor, range(1, 4), Change.SAVE)
+        first = Change.objects.order_by('pk')[0].pk - 1
+        response = self.client.get(
+            '/maps/changes/', {'after': first, 'limit': 2}
+        )
+        body = json.loads(response.content.decode('utf-8'))
+        self.assertEqual([c['id'] for c in body['changes']], [1, 2])
+        response = self.client.get(
+            '/maps/changes/', {'after': body['cursor']}
+        )
+        body = json.loads(response.content.decode('utf-8'))
+        self.assertEqual([c['id'] for c in body['changes']], [3])
+        response = self.client.get(
+            '/maps/changes/', {'after': body['cursor']}
+        )
+        self.assertEqual(
+            json.loads(response.content.decode('utf-8')),
+            {'changes': [], 'cursor': body['cursor']}
+        )
+        for params in ({'after': 'x'}, {'limit': 0}, {'limit': -1}):
+            self.assertEqual(
+                self.client.get('/maps/changes/', params).status_code, 400
+            )
+
+
+class ReviewTestMixin(object):
+    """Saves reviews through the pipeline from form data."""
+
+    def setUp(self):
+        self.event = Event.objects.create(
+            event_type='EQ', start_date=datetime.date(2015, 4, 25)
+        )
+        self.ocha = Actor.objects.create(name='OCHA')
+        self.wfp = Actor.objects.create(name='WFP')
+
+    def data(self, **data):
+        return dict({
+            'reviewer_name': 'R', 'title': 'Shelter', 'language': 'en',
+            'event': self.event.pk, 'day_offset': 1, 'extent': ['Country'],
+            'update_frequency': 'Daily',
+            'authors_or_producers': [self.ocha.pk], 'donors': [self.ocha.pk],
+        }, **data)
+
+    def review(self, instance=None, formsets=(), **data):
+        form = CreateReviewForm(self.data(**data), instance=instance)
+        self.assertTrue(form.is_valid(), form.errors)
+        return pipeline.save_review(form, formsets)
+
+
+class PipelineTest(ReviewTestMixin, TestCase):
+
+    def test_sync_m2m(self):
+        obj = self.review()
+        self.assertEqual(
+            pipeline.sync_m2m(obj, 'donors', [self.wfp.pk]),
+            (set([self.wfp.pk]), set([self.ocha.pk]))
+        )
+        self.assertEqual(
+            pipeline.sync_m2m(obj, 'donors', [self.ocha.pk], replace=False),
+            (set([self.ocha.pk]), set())
+        )
+        self.assertEqual(
+            pipeline.sync_m2m(obj, 'donors', [self.ocha.pk, self.wfp.pk]),
+            (set(), set())
+        )
+        self.assertEqual(set(obj.donors.values_list('pk', flat=True)),
+                         set([self.ocha.pk, self.wfp.pk]))
+
+    def test_one_transaction(self):
+        score = agreement.score
+        self.addCleanup(setattr, agreement, 'score', score)
+
+        def fail(instance, using=None):
+            raise RuntimeError
+        agreement.score = fail
+        formsets = review_formsets(self.formset_data(
+            ('SATELLITE', 'Imagery', 'satellite_data_source'),
+        ))
+        self.assertTrue(all(f.is_valid() for f in formsets))
+        with self.assertRaises(RuntimeError):
+            self.review(formsets=formsets)
+        self.assertFalse(Map.objects.exists())
+        self.assertFalse(DataSource.objects.exists())
+        self.assertFalse(Map.donors.through.objects.exists())
+        self.assertFalse(MapRevision.objects.exists())
+
+    def formset_data(self, *sources):
+        data = {
+            'new_sources-TOTAL_FORMS': str(len(sources)),
+            'new_sources-INITIAL_FORMS': '0',
+            'new_stats-TOTAL_FORMS': '0',
+            'new_stats-INITIAL_FORMS': '0',
+        }
+        for i, (source_type, name, use_for) in enumerate(sources):
+            data['new_sources-{0}-source_type'.format(i)] = source_type
+            data['new_sources-{0}-name'.format(i)] = name
+            data['new_sources-{0}-use_for'.format(i)] = use_for
+        return data
+
+    def test_new_data_sources_fill_slots(self):
+        formsets = review_formsets(self.formset_data(
+            ('SATELLITE', 'Imagery', 'satellite_data_source'),
+            ('POPULATION', 'Census', 'affected_population_data_source'),
+            ('ROADS', 'Unlinked', ''),
+        ))
+        self.assertTrue(all(f.is_valid() for f in formsets))
+        obj = self.review(formsets=formsets)
+        self.assertEqual(obj.satellite_data_source.name, 'Imagery')
+        self.assertEqual(
+            [s.name for s in obj.affected_population_data_source.all()],
+            ['Census']
+        )
+        self.assertEqual(DataSource.objects.count(), 3)
+        rev = MapRevision.objects.get(map=obj)
+        self.assertEqual(
+            json.loads(rev.m2m_data)['affected_population_data_source'],
+            [DataSource.objects.get(name='Census').pk]
+        )
+
+    def test_admin_save(self):
+        User.objects.create_superuser('admin', 'admin@example.com', 'pw')
+        self.client.login(username='admin', password='pw')
+        response = self.client.post('/admin/maps/map/add/', self.data(
+            donors=[self.ocha.pk, self.wfp.pk]
+        ))
+        self.assertEqual(response.status_code, 302)
+        obj = Map.objects.get()
+        self.assertEqual(obj.revision, 1)
+        self.assertEqual(set(obj.donors.values_list('pk', flat=True)),
+                         set([self.ocha.pk, self.wfp.pk]))
+        self.assertEqual(MapRevision.objects.get(map=obj).number, 1)
+
+        response = self.client.post(
+            '/admin/maps/map/{0}/'.format(obj.pk),
+            self.data(title='Health', donors=[self.wfp.pk])
+        )
+        self.assertEqual(response.status_code, 302)
+        fields, m2m = revisions.version(obj.pk, 2)
+        self.assertEqual(fields['title'], 'Health')
+        self.assertEqual(m2m['donors'], set([self.wfp.pk]))
+
+
+class RevisionsTest(ReviewTestMixin, TestCase):
+
+    def test_edits(self):
+        obj = self.review()
+        self.assertEqual(obj.revision, 1)
+        self.assertEqual(revisions.version(obj.pk, 1)[1]['donors'],
+                         set([self.ocha.pk]))
+
+        obj = self.review(Map.objects.get(pk=obj.pk), title='Health',
+                          donors=[self.wfp.pk])
+        rev = MapRevision.objects.get(map=obj, number=2)
+        self.assertFalse(rev.is_checkpoint)
+        self.assertEqual(json.loads(rev.field_data), {'title': 'Health'})
+        self.assertEqual(json.loads(rev.m2m_data), {
+            'donors': {'+': [self.wfp.pk], '-': [self.ocha.pk]},
+        })
+        fields, m2m = revisions.version(obj.pk, 2)
+        self.assertEqual(fields['title'], 'Health')
+        self.assertEqual(m2m['donors'], set([self.wfp.pk]))
+        self.assertEqual(revisions.version(obj.pk, 1)[0]['title'], 'Shelter')
+
+    def test_unchanged_edit_records_nothing(self):
+        obj = self.review()
+        cursor = Change.objects.order_by('-pk')[0].pk
+        obj = self.review(Map.objects.get(pk=obj.pk))
+        self.assertEqual(obj.revision, 1)
+        self.assertEqual(MapRevision.objects.count(), 1)
+        self.assertFalse(Change.objects.after(cursor).exists())
+
+    @override_settings(MAPS_REVISION_CHECKPOINT_INTERVAL=3)
+    def test_version_across_checkpoint(self):
+        obj = self.review()
+        for i in range(2, 6):
+            obj = self.review(Map.objects.get(pk=obj.pk),
+                              title='Title {0}'.format(i))
+        self.assertEqual(
+            list(MapRevision.objects.filter(
+                map=obj, is_checkpoint=True
+            ).values_list('number', flat=True).order_by('number')), [1, 3]
+        )
+        for i in range(2, 6):
+            self.assertEqual(revisions.version(obj.pk, i)[0]['title'],
+                             'Title {0}'.format(i))
+        with self.assertRaises(MapRevision.DoesNotExist):
+            revisions.version(obj.pk, 6)
+
+    def test_direct_writes_recorded(self):
+        obj = Map.objects.create(
+            reviewer_name='R', title='Shelter', language='en', day_offset=1,
+            extent='Country', event=self.event,
+        )
+        self.assertEqual(obj.revision, 1)
+        obj.title = 'Health'
+        obj.save()
+        obj.save()
+        obj.donors.add(self.ocha, self.wfp)
+        obj.donors.remove(self.ocha)
+        self.wfp.donor_to.clear()
+        obj = Map.objects.get(pk=obj.pk)
+        self.assertEqual(obj.revision, 5)
+        self.assertEqual(revisions.version(obj.pk, 2)[0]['title'], 'Health')
+        self.assertEqual(
+            [revisions.version(obj.pk, n)[1]['donors'] for n in (3, 4, 5)],
+            [set([self.ocha.pk, self.wfp.pk]), set([self.wfp.pk]), set()]
+        )
+        self.assertEqual(
+            json.loads(Change.objects.filter(model='map').last().data),
+            {'event': self.event.pk, 'revision': 5}
+        )
+
+    def test_changes_since_paging(self):
+        first = self.review()
+        second = self.review(title='Health')
+        self.review(Map.objects.get(pk=first.pk), title='Food')
+        page = list(revisions.changes_since(0, limit=2))
+        self.assertEqual([(r.map_id, r.number) for r in page],
+                         [(first.pk, 1), (second.pk, 1)])
+        page = list(revisions.changes_since(page[-1].pk, limit=2))
+        self.assertEqual([(r.map_id, r.number) for r in page],
+                         [(first.pk, 2)])
+
+
+class MapDetailTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.event = Event.objects.create(
+            event_type='EQ', start_date=datetime.date(2015, 4, 25)
+        )
+        self.ocha = Actor.objects.create(name='OCHA')
+        self.map = Map.objects.create(
+            reviewer_name='R', title='Shelter', language='en', day_offset=1,
+            extent='Country', event=self.event,
+        )
+        self.map.authors_or_producers.add(self.ocha)
+        self.url = '/maps/{0}/'.format(self.map.pk)
+
+    def test_conditional_requests(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'OCHA')
+        etag = response['ETag']
+        for headers in ({'HTTP_IF_NONE_MATCH': etag},
+                        {'HTTP_IF_NONE_MATCH': '"other", ' + etag},
+                        {'HTTP_IF_NONE_MATCH': '*'},
+                        {'HTTP_IF_MODIFIED_SINCE': response['Last-Modified']}):
+            response = self.client.get(self.url, **headers)
+            self.assertEqual(response.status_code, 304, headers)
+            self.assertEqual(response['ETag'], etag)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH='"other"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_related_changes_update_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        Actor.objects.create(name='Unrelated')
+        self.assertEqual(self.client.get(self.url)['ETag'], etag)
+
+        self.ocha.name = 'UN OCHA'
+        self.ocha.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'UN OCHA')
+
+        etag = response['ETag']
+        self.event.glide_number = 'EQ-2015-000048-NPL'
+        self.event.save()
+        self.assertNotEqual(self.client.get(self.url)['ETag'], etag)
+
+    def test_relation_changes_update_last_modified(self):
+        wfp = Actor.objects.create(name='WFP')
+        earlier = timezone.now() - datetime.timedelta(hours=1)
+        Map.objects.filter(pk=self.map.pk).update(updated_at=earlier)
+        Change.objects.update(created=earlier)
+        last_modified = self.client.get(self.url)['Last-Modified']
+        self.map.donors.add(wfp)
+        response = self.client.get(
+            self.url, HTTP_IF_MODIFIED_SINCE=last_modified
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'WFP')
+
+    def test_fragment_cached_per_version(self):
+        self.client.get(self.url)
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url)
+        self.assertContains(response, 'Shelter')
+        self.map.title = 'Health'
+        self.map.save()
+        self.assertContains(self.client.get(self.url), 'Health')
+
+    def test_missing(self):
+        self.assertEqual(self.client.get('/maps/999999/').status_code, 404)
+
+
+class ApiTest(TestCase):
+
+    def setUp(self):
+        self.event = Event.objects.create(
+            event_type='EQ', start_date=datetime.date(2015, 4, 25)
+        )
+        self.actors = [Actor.objects.create(name=n) for n in ('A', 'B', 'C')]
+        self.maps = []
+        for title in ('Shelter', 'Health'):
+            obj = Map.objects.create(
+                reviewer_name='R', title=title, language='en', day_offset=1,
+                extent='Country', event=self.event,
+            )
+            obj.authors_or_producers.add(*self.actors[:2])
+            obj.donors.add(self.actors[2])
+            self.maps.append(obj)
+
+    def get(self, url, status=200, **kwargs):
+        response = self.client.get('/maps/api/' + url, **kwargs)
+        self.assertEqual(response.status_code, status)
+        return response.status_code == 200 and json.loads(
+            response.content.decode('utf-8')
+        )
+
+    def test_keyset_paging(self):
+        page = self.get('actors/?limit=2')
+        self.assertEqual([a['name'] for a in page['data']], ['A', 'B'])
+        self.assertIn('after={0}'.format(self.actors[1].pk), page['next'])
+        page = self.get('actors/?limit=2&after={0}'.format(
+            self.actors[1].pk
+        ))
+        self.assertEqual([a['name'] for a in page['data']], ['C'])
+        self.assertIsNone(page['next'])
+
+    def test_fields_limit_columns(self):
+        with CaptureQueriesContext(connection) as queries:
+            page = self.get('maps/?fields=title')
+        self.assertEqual(page['data'][0], {'id': self.maps[0].pk,
+                                           'title': 'Shelter'})
+        listing = [q['sql'] for q in queries if 'maps_map' in q['sql']]
+        self.assertEqual(len(listing), 1)
+        self.assertNotIn('reviewer_name', listing[0])
+
+    def test_include_one_query_per_relation(self):
+        # The feed ETag, the maps, then one query per relation.
+        with self.assertNumQueries(5):
+            page = self.get('maps/?include=event,authors_or_producers,donors')
+        self.assertEqual(page['data'][1]['event']['id'], self.event.pk)
+        self.assertEqual(
+            [a['name'] for a in page['data'][1]['authors_or_producers']],
+            ['A', 'B']
+        )
+
+    def test_include_self_relation(self):
+        country = AdminArea.objects.create(
+            name='Nepal', code='NP', level=0,
+            west=80.0, south=26.3, east=88.2, north=30.5
+        )
+        AdminArea.objects.create(
+            name='Kathmandu', code='NP-KTM', level=1, parent=country,
+            west=85.2, south=27.6, east=85.6, north=27.8
+        )
+        page = self.get('areas/?include=parent')
+        self.assertEqual([a['parent'] and a['parent']['name']
+                          for a in page['data']], [None, 'Nepal'])
+
+    def test_bad_requests(self):
+        self.get('maps/?fields=title,nope', status=400)
+        self.get('maps/?include=nope', status=400)
+        self.get('maps/?after=x', status=400)
+        self.get('maps/?limit=0', status=400)
+        self.get('maps/{0}/?fields=nope'.format(self.maps[0].pk), status=400)
+        self.get('nope/', status=404)
+
+    def test_foreign_key_filter(self):
+        other = Event.objects.create(
+            event_type='FL', start_date=datetime.date(2015, 7, 1)
+        )
+        self.assertEqual(len(self.get('maps/?event={0}'.format(
+            self.event.pk
+        ))['data']), 2)
+        self.assertEqual(
+            self.get('maps/?event={0}'.format(other.pk))['data'], []
+        )
+
+    def test_feed_etag(self):
+        response = self.client.get('/maps/api/maps/')
+        etag = response['ETag']
+        self.get('maps/', status=304, HTTP_IF_NONE_MATCH=etag)
+        self.get('maps/{0}/'.format(self.maps[0].pk), status=304,
+                 HTTP_IF_NONE_MATCH=etag)
+        Actor.objects.create(name='D')
+        self.get('maps/', HTTP_IF_NONE_MATCH=etag)
+
+        request = RequestFactory().get('/', {'include': 'nope'})
+        self.assertIsNone(api.feed_etag(request, 'maps'))
+        self.assertIsNone(api.feed_etag(request, 'nope'))
+
+
+class ReportsTest(TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        override = override_settings(MAPS_REPORTS_ROOT=self.root)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.haiyan, self.gorkha = [
+            Event.objects.create(
+                event_type=kind, start_date=datetime.date(2015, 4, 25),
+                glide_number=glide,
+            ) for kind, glide in (('TC', 'TC-2013-000139-PHL'),
+                                  ('EQ', 'EQ-2015-000048-NPL'))
+        ]
+        self.ocha = Actor.objects.create(name='OCHA')
+        self.map = self.make_map(self.haiyan, 1)
+        self.make_map(self.haiyan, 3)
+        self.make_map(self.gorkha, 2)
+        reports.rebuild_all()
+
+    def make_map(self, event, day):
+        obj = Map.objects.create(
+            reviewer_name='R', title='Map', language='en', event=event,
+            day_offset=day, extent='Country', has_roads=True,
+        )
+        obj.authors_or_producers.add(self.ocha)
+        return obj
+
+    def read(self, event, fmt):
+        with open(reports.path(event.pk, fmt)) as f:
+            return f.read()
+
+    def test_report_contents(self):
+        csv = self.read(self.haiyan, 'csv')
+        self.assertIn('total,TC-2013-000139-PHL,2,', csv)
+        self.assertIn('day_offset,3,1,', csv)
+        self.assertIn('producers,OCHA,2,', csv)
+        self.assertIn('layers,has roads,2,', csv)
+        self.assertIn('OCHA', self.read(self.gorkha, 'html'))
+
+    def test_only_touched_events_rebuilt(self):
+        self.assertEqual(reports.refresh(), set())
+        self.map.day_offset = 5
+        self.map.save()
+        self.assertEqual(reports.refresh(), set([self.haiyan.pk]))
+        self.assertIn('day_offset,5,1,', self.read(self.haiyan, 'csv'))
+
+    def test_moved_map_rebuilds_both_events(self):
+        self.map.event = self.gorkha
+        self.map.save()
+        self.assertEqual(reports.refresh(),
+                         set([self.haiyan.pk, self.gorkha.pk]))
+        self.assertIn('total,EQ-2015-000048-NPL,2,',
+                      self.read(self.gorkha, 'csv'))
+        change = Change.objects.filter(model='map').latest('pk')
+        self.assertEqual(json.loads(change.data)['previous_event'],
+                         self.haiyan.pk)
+        with open(os.path.join(self.root, 'manifest.json')) as f:
+            self.assertEqual(list(json.load(f)), ['cursor'])
+
+    def test_renamed_actor_rebuilds_citing_events(self):
+        self.ocha.name = 'UN OCHA'
+        self.ocha.save()
+        self.assertEqual(reports.refresh(),
+                         set([self.haiyan.pk, self.gorkha.pk]))
+
+
+class ArchiveTest(TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        override = override_settings(
+            MAPS_ARCHIVE_ROOT=self.root, MAPS_REPORTS_ROOT=self.root
+        )
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.event = Event.objects.create(
+            event_type='EQ', start_date=datetime.date(2015, 4, 25),
+            glide_number='EQ-2015-000048-NPL',
+        )
+        self.ocha = Actor.objects.create(name='OCHA')
+        self.shared = StatisticalOrIndicatorData.objects.create(
+            data_type='shared'
+        )
+        self.own = StatisticalOrIndicatorData.objects.create(data_type='own')
+        self.map = Map.objects.create(
+            reviewer_name='R', title='Shelter', language='en', day_offset=1,
+            event=self.event, extent='Country',
+        )
+        self.map.authors_or_producers.add(self.ocha)
+        self.map.statistical_data.add(self.shared, self.own)
+        ReviewDraft.objects.create(key='k', review=self.map)
+        other = Map.objects.create(
+            reviewer_name='R', title='Other', language='en', day_offset=1,
+            extent='Country',
+            event=Event.objects.create(
+                event_type='FL', start_date=datetime.date(2015, 7, 1)
+            ),
+        )
+        other.statistical_data.add(self.shared)
+
+    def test_archive_and_restore(self):
+        updated_at = Map.objects.get(pk=self.map.pk).updated_at
+        stored = archive.archive(self.event)
+        self.assertEqual(stored.maps, 1)
+        self.assertFalse(Map.objects.filter(event=self.event).exists())
+        self.assertFalse(ReviewDraft.objects.exists())
+        self.assertEqual(
+            list(StatisticalOrIndicatorData.objects.values_list(
+                'data_type', flat=True
+            )), ['shared']
+        )
+        self.assertEqual(ArchivedMap.objects.get().title, 'Shelter')
+
+        self.assertTrue(archive.restore_map(self.map.pk))
+        restored = Map.objects.get(pk=self.map.pk)
+        self.assertEqual(restored.updated_at, updated_at)
+        self.assertEqual(list(restored.authors_or_producers.all()),
+                         [self.ocha])
+        self.assertEqual(
+            sorted(restored.statistical_data.values_list(
+                'data_type', flat=True
+            )), ['own', 'shared']
+        )
+        self.assertEqual(ReviewDraft.objects.get().review, restored)
+        self.assertFalse(EventArchive.objects.exists())
+        self.assertFalse(ArchivedMap.objects.exists())
+        self.assertFalse(archive.restore_map(self.map.pk))
+        # A restore that read the event before the first one finished.
+        self.assertEqual(archive.restore(self.event), 0)
+
+    def test_failed_archive_keeps_maps(self):
+        ArchivedMap.objects.create(id=self.map.pk, event=self.event)
+        with self.assertRaises(IntegrityError):
+            archive.archive(self.event)
+        self.assertTrue(Map.objects.filter(pk=self.map.pk).exists())
+        self.assertFalse(EventArchive.objects.exists())
+        self.assertFalse(any(
+            name.endswith('.json.gz') for name in os.listdir(self.root)
+        ))
+
+    def test_detail_view_restores(self):
+        archive.archive(self.event)
+        response = self.client.get(
+            '/maps/api/maps/{0}/'.format(self.map.pk)
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(EventArchive.objects.exists())
+
+
+class ReferenceTest(TestCase):
+
+    def setUp(self):
+        self.wfp = Actor.objects.create(name='WFP')
+        self.gone = Actor.objects.create(name='Gone')
+        self.health = Actor.objects.create(name='Health', is_cluster=True)
+
+    def test_sync_actors(self):
+        rows = [{'name': 'WFP'}, {'name': 'OCHA'},
+                {'name': 'Shelter', 'is_cluster': True}]
+        self.assertEqual(reference.sync('actors', rows), {
+            'inserted': 1, 'updated': 0, 'retired': 1, 'unchanged': 1,
+        })
+        self.assertEqual(Actor.objects.get(name='WFP').pk, self.wfp.pk)
+        self.assertFalse(Actor.objects.get(pk=self.gone.pk).is_active)
+        # Clusters are a separate catalogue.
+        self.assertTrue(Actor.objects.get(pk=self.health.pk).is_active)
+        self.assertFalse(Actor.objects.filter(name='Shelter').exists())
+        ocha = Actor.objects.get(name='OCHA')
+        self.assertTrue(Change.objects.filter(
+            model='actor', object_id=ocha.pk
+        ).exists())
+
+        cursor = Change.objects.order_by('-pk')[0].pk
+        self.assertEqual(reference.sync('actors', rows)['unchanged'], 2)
+        self.assertFalse(Change.objects.after(cursor).exists())
+
+        rows.append({'name': 'Gone'})
+        self.assertEqual(reference.sync('actors', rows)['updated'], 1)
+        self.assertTrue(Actor.objects.get(pk=self.gone.pk).is_active)
+
+    def test_sync_events(self):
+        event = Event.objects.create(
+            event_type='EQ', start_date=datetime.date(2015, 4, 24),
+            glide_number='EQ-2015-000048-NPL',
+        )
+        counts = reference.sync('events', [
+            {'glide_number': 'EQ-2015-000048-NPL', 'start_date': '2015-04-25'},
+            {'glide_number': 'TC-2013-000139-PHL', 'start_date': '2013-11-08'},
+        ])
+        self.assertEqual((counts['inserted'], counts['updated']), (1, 1))
+        self.assertEqual(Event.objects.get(pk=event.pk).start_date,
+                         datetime.date(2015, 4, 25))
+        self.assertEqual(
+            Event.objects.get(glide_number='TC-2013-000139-PHL').event_type,
+            'TC'
+        )
+        with self.assertRaises(ValueError):
+            reference.sync('events', [{'glide_number': 'bad'}])
+
+    def test_shared_changes_updated_together(self):
+        Actor.objects.bulk_create([
+            Actor(name='Retired {0}'.format(i), is_active=False)
+            for i in range(sqlite.CHUNK + 10)
+        ])
+        rows = [{'name': name} for name in Actor.objects.filter(
+            is_cluster=False
+        ).values_list('name', flat=True)]
+        with CaptureQueriesContext(connection) as queries:
+            counts = reference.sync('actors', rows)
+        self.assertEqual(counts['updated'], sqlite.CHUNK + 10)
+        self.assertFalse(Actor.objects.filter(is_active=False).exists())
+        updates = [q for q in queries if 'UPDATE "maps_actor"' in q['sql']]
+        self.assertEqual(len(updates), 2)
+
+
+class AgreementTest(TestCase):
+
+    def setUp(self):
+        self.event = Event.objects.create(
+            event_type='EQ', start_date=datetime.date(2015, 4, 25),
+        )
+        self.reviews = [
+            self.review(name, roads)
+            for name, roads in (('A', True), ('B', True), ('C', False))
+        ]
+
+    def review(self, reviewer_name, has_roads):
+        obj = Map.objects.create(
+            reviewer_name=reviewer_name, title='Kathmandu valley',
+            url='http://www.example.org/maps/kathmandu.pdf', language='en',
+            event=self.event, day_offset=2, extent='Country',
+            has_roads=has_roads,
+        )
+        return obj
+
+    def field(self, name):
+        return dict((s['field'], s) for s in agreement.field_scores())[name]
+
+    def assertTotalsMatchRecount(self):
+        recount = agreement.subject_totals(ReviewCoding.objects.all())
+        for row in FieldAgreement.objects.all():
+            for column in ('subjects', 'pairs', 'agreements'):
+                self.assertEqual(
+                    getattr(row, column),
+                    recount[('field', row.field, column)]
+                )
+
+    def test_scores(self):
+        roads = self.field('has_roads')
+        self.assertEqual((roads['subjects'], roads['pairs']), (1, 3))
+        self.assertAlmostEqual(roads['percent'], 1 / 3.0)
+        self.assertLess(roads['kappa'], 0)
+        self.assertEqual(self.field('language')['percent'], 1.0)
+        reviewers = agreement.reviewer_scores()
+        self.assertEqual([r['reviewer_name'] for r in reviewers],
+                         ['A', 'B', 'C'])
+        subjects, pair = agreement.cohen_kappa('A', 'C')
+        self.assertEqual(subjects, 1)
+
+    def test_incremental_updates(self):
+        changed = self.reviews[2]
+        changed.has_roads = True
+        changed.save()
+        self.assertEqual(self.field('has_roads')['percent'], 1.0)
+        self.assertTotalsMatchRecount()
+
+        self.reviews[1].delete()
+        self.assertEqual(self.field('has_roads')['pairs'], 1)
+        self.assertTotalsMatchRecount()
+
+        self.reviews[0].url = 'http://example.org/other.pdf'
+        self.reviews[0].save()
+        self.assertEqual(agreement.field_scores(), [])
+
+    def test_relation_changes(self):
+        wfp = Actor.objects.create(name='WFP')
+        self.reviews[0].donors.add(wfp)
+        self.assertAlmostEqual(self.field('donors')['percent'], 1 / 3.0)
+        wfp.donor_to.add(*self.reviews[1:])
+        self.assertEqual(self.field('donors')['percent'], 1.0)
+        wfp.donor_to.remove(self.reviews[2])
+        self.assertAlmostEqual(self.field('donors')['percent'], 1 / 3.0)
+        wfp.donor_to.clear()
+        self.assertEqual(self.field('donors')['percent'], 1.0)
+        self.assertTotalsMatchRecount()
+
+    def test_dashboard(self):
+        response = self.client.get('/maps/agreement.html?reviewer=A')
+        self.assertContains(response, 'Has roads')
+        response = self.client.get('/maps/agreement.json?a=A&b=B')
+        self.assertEqual(response.status_code, 200)
+
+
+@skipUnless(connection.vendor == 'sqlite', "SQLite only")
+@override_settings(MAPS_SQLITE_RETRY_DELAY=0)
+class SqliteTest(TransactionTestCase):
+
+    def test_pragmas_applied(self):
+        cursor = connection.cursor()
+        cursor.execute('PRAGMA busy_timeout')
+        self.assertEqual(cursor.fetchone()[0], 5000)
+        cursor.execute('PRAGMA synchronous')
+        self.assertEqual(cursor.fetchone()[0], 1)
+
+    def attempts(self, errors):
+        calls = []
+
+        @sqlite.write_transaction
+        def write():
+            calls.append(connection.in_atomic_block)
+            Actor.objects.create(name='WFP')
+            if errors:
+                raise OperationalError(errors.pop(0))
+        return write, calls
+
+    def test_retries_while_locked(self):
+        write, calls = self.attempts(['database is locked'] * 2)
+        write()
+        self.assertEqual(calls, [True] * 3)
+        self.assertEqual(Actor.objects.count(), 1)
+
+    def test_other_errors_not_retried(self):
+        write, calls = self.attempts(['no such table: x'])
+        with self.assertRaises(OperationalError):
+            write()
+        self.assertEqual(len(calls), 1)
+        self.assertFalse(Actor.objects.exists())
+
+    @override_settings(MAPS_SQLITE_RETRIES=1)
+    def test_gives_up(self):
+        write, calls = self.attempts(['database is locked'] * 3)
+        with self.assertRaises(OperationalError):
+            write()
+        self.assertEqual(len(calls), 2)
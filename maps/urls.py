@@ -1,5 +1,5 @@
 # -*- coding: utf-8 -*-
-from django.conf.urls import patterns, url
+from django.conf.urls import include, patterns, url
 
 from . import views
 
@@ -7,4 +7,10 @@ from . import views
 urlpatterns = patterns(
     '',
     url(r'^review/', views.CreateReview.as_view(), name="create_review"),
+    url(r'^(?P<pk>\d+)/$', views.map_detail, name="map_detail"),
+    url(r'^drafts/(?P<key>[\w-]{8,40})/$', views.review_draft,
+        name="review_draft"),
+    url(r'^duplicates/$', views.possible_duplicates,
+        name="possible_duplicates"),
+    url(r'', include('maps.api_urls')),
 )
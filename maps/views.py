@@ -1,11 +1,244 @@
 # -*- coding: utf-8 -*-
+import calendar
+import json
+import operator
+from functools import reduce
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.urlresolvers import reverse, reverse_lazy
+from django.db.models import Max, Q
+from django.http import (
+    HttpResponse, HttpResponseBadRequest, HttpResponseNotModified,
+    HttpResponseRedirect, JsonResponse, Http404,
+)
 from django.shortcuts import render
+from django.template.loader import render_to_string
+from django.utils import six
+from django.utils.http import (
+    http_date, parse_etags, parse_http_date_safe, quote_etag,
+)
+from django.views.decorators.http import require_GET, require_http_methods
 from django.views.generic import CreateView
 
-from . forms import CreateReviewForm
+from . import archive, drafts, duplicates
+from .forms import CreateReviewForm, review_formsets
+from .models import Change, ChangeFeedMixin, Map
+from .pipeline import save_review
 
 
 class CreateReview(CreateView):
     """Basic creation of the Map Review."""
     form_class = CreateReviewForm
     template_name = 'maps/create.html'
+    success_url = reverse_lazy('create_review')
+
+    def get_context_data(self, **kwargs):
+        kwargs.setdefault('formsets', review_formsets())
+        kwargs.setdefault('bundled_assets', settings.MAPS_BUNDLED_ASSETS)
+        return super(CreateReview, self).get_context_data(**kwargs)
+
+    def post(self, request, *args, **kwargs):
+        self.object = None
+        form = self.get_form(self.get_form_class())
+        formsets = review_formsets(request.POST)
+        # Validate everything up front so all errors are shown at once.
+        valid = [form.is_valid()] + [f.is_valid() for f in formsets]
+        if all(valid):
+            self.object = save_review(form, formsets)
+            if request.POST.get('draft_key'):
+                drafts.promote(
+                    drafts.reviewer(request), request.POST['draft_key'],
+                    self.object
+                )
+            return HttpResponseRedirect(self.get_success_url())
+        return self.render_to_response(
+            self.get_context_data(form=form, formsets=formsets)
+        )
+
+
+@require_http_methods(['GET', 'POST'])
+def review_draft(request, key):
+    """Autosave endpoint for review drafts.
+
+    POST takes a JSON object of only the fields changed since the last
+    autosave and answers with an empty 204; GET returns the draft's
+    coalesced fields so the page can restore them.
+
+    """
+    if request.method == 'GET':
+        data = drafts.load(drafts.reviewer(request), key)
+        if data is None:
+            raise Http404
+        return JsonResponse({'fields': data})
+
+    if len(request.body) > settings.MAPS_DRAFT_MAX_BYTES:
+        return HttpResponse(status=413)
+    try:
+        fields = json.loads(request.body.decode('utf-8'))
+    except ValueError:
+        return HttpResponseBadRequest()
+    if not isinstance(fields, dict):
+        return HttpResponseBadRequest()
+    fields = dict(
+        (k, v) for k, v in fields.items()
+        if k in CreateReviewForm.base_fields
+    )
+    if fields:
+        drafts.record_changes(drafts.reviewer(request), key, fields)
+    return HttpResponse(status=204)
+
+
+@require_GET
+def possible_duplicates(request):
+    """Maps resembling the ``title``, ``url`` and ``file_name`` given.
+
+    Called from the review form as those fields are filled in; ``exclude``
+    leaves out the map being edited.
+
+    """
+    try:
+        exclude = int(request.GET['exclude']) if request.GET.get(
+            'exclude') else None
+    except ValueError:
+        return HttpResponseBadRequest()
+    found = duplicates.possible_duplicates(
+        request.GET.get('title'), request.GET.get('url'),
+        request.GET.get('file_name'), exclude=exclude,
+    )
+    return JsonResponse({'duplicates': [{
+        'id': obj.pk,
+        'title': obj.title,
+        'url': obj.url,
+        'file_name': obj.file_name,
+        'score': round(score, 2),
+        'detail_url': reverse('map_detail', args=[obj.pk]),
+    } for obj, score in found]})
+
+
+def map_fields(obj):
+    """(label, value) pairs describing a Map, for display."""
+    ret = []
+    for field in obj._meta.fields:
+        if field.name in ('id', 'revision', 'updated_at'):
+            continue
+        if field.choices and not field.rel:
+            value = getattr(obj, 'get_{0}_display'.format(field.name))()
+        else:
+            value = getattr(obj, field.name)
+        ret.append((field.verbose_name, value))
+    for field in obj._meta.many_to_many:
+        ret.append((
+            field.verbose_name,
+            ', '.join(six.text_type(o) for o in getattr(obj, field.name).all())
+        ))
+    return ret
+
+
+def _related_feed_fields():
+    """Map relations whose rows are shown by the detail view and in the feed.
+
+    :return: foreign keys and many-to-many fields, as two lists.
+
+    """
+    def in_feed(field):
+        return issubclass(field.rel.to, ChangeFeedMixin)
+    return (
+        [f for f in Map._meta.fields if f.rel and in_feed(f)],
+        [f for f in Map._meta.many_to_many if in_feed(f)],
+    )
+
+
+def related_change(pk, foreign_keys):
+    """The latest feed entry of the rows shown with a Map.
+
+    :param pk: primary key of the Map.
+    :param dict foreign_keys: foreign key field to its value on the Map.
+    :rtype: tuple
+    :return: (sequence number, creation time) of the entry, or (0, None).
+
+    """
+    fks, m2ms = _related_feed_fields()
+    related = [
+        Q(model=f.rel.to._meta.model_name, object_id=foreign_keys[f])
+        for f in fks if foreign_keys[f] is not None
+    ]
+    for field in m2ms:
+        through = field.rel.through
+        linked = through.objects.filter(
+            **{through._meta.get_field(field.m2m_field_name()).attname: pk}
+        ).values(through._meta.get_field(
+            field.m2m_reverse_field_name()
+        ).attname)
+        related.append(Q(model=field.rel.to._meta.model_name,
+                         object_id__in=linked))
+    last = Change.objects.filter(reduce(operator.or_, related)).aggregate(
+        seq=Max('pk'), created=Max('created')
+    )
+    return last['seq'] or 0, last['created']
+
+
+@require_GET
+def map_detail(request, pk):
+    """Read view of a single review, answering conditional GETs cheaply.
+
+    The ETag and Last-Modified validators come from the Map row and the
+    latest feed entry of the events, actors, data sources and statistics it
+    shows, two queries in all, so ``304 Not Modified`` is sent before any
+    related data is read; the rendered fields are cached per ETag.
+
+    """
+    fks = _related_feed_fields()[0]
+    versions = Map.objects.filter(pk=pk).values_list(
+        'revision', 'updated_at', *[f.attname for f in fks]
+    )
+    try:
+        row = versions.get()
+    except Map.DoesNotExist:
+        if not archive.restore_map(pk):
+            raise Http404
+        row = versions.get()
+    revision, updated_at = row[:2]
+    related, related_at = related_change(pk, dict(zip(fks, row[2:])))
+    last_modified = calendar.timegm(
+        max(updated_at, related_at or updated_at).utctimetuple()
+    )
+    etag = quote_etag('{0}-{1}-{2}-{3}'.format(
+        pk, revision, last_modified, related
+    ))
+
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if_modified_since = parse_http_date_safe(
+        request.META.get('HTTP_IF_MODIFIED_SINCE')
+    )
+    if if_none_match:
+        etags = parse_etags(if_none_match)
+        not_modified = '*' in etags or etag.strip('"') in etags
+    else:
+        not_modified = (
+            if_modified_since is not None and
+            last_modified <= if_modified_since
+        )
+
+    if not_modified:
+        response = HttpResponseNotModified()
+    else:
+        key = 'maps:detail:{0}'.format(etag.strip('"'))
+        fragment = cache.get(key)
+        if fragment is None:
+            obj = Map.objects.select_related(
+                *[f.name for f in Map._meta.fields if f.rel]
+            ).prefetch_related(
+                *[f.name for f in Map._meta.many_to_many]
+            ).get(pk=pk)
+            fragment = render_to_string('maps/detail_fragment.html', {
+                'map': obj,
+                'fields': map_fields(obj),
+            })
+            cache.set(key, fragment, settings.MAPS_DETAIL_CACHE_TIMEOUT)
+        response = render(request, 'maps/detail.html', {'fragment': fragment})
+
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = 'max-age=0, must-revalidate'
+    return response